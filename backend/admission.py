@@ -0,0 +1,233 @@
+"""Rate limiting and admission control in front of the app.
+
+Each request is put into a route class (``login``, ``checkout``, ...). A
+class has:
+
+* a token bucket (``rate`` requests per second, bursts up to ``burst``),
+  kept per client: the authenticated user when the class is keyed by user
+  and a valid token is present, otherwise the client IP. Behind a reverse
+  proxy the IP is read from ``X-Forwarded-For``, walking back from the
+  nearest hop past the proxies in ``trusted_proxies``; with ``*`` only the
+  nearest hop is believed, since anything left of it may be forged. An
+  empty bucket
+  answers 429 with ``Retry-After`` set to the time until the next token;
+* optionally a cap on requests of that class running at once in this
+  worker. Past the cap the request is shed straight away with 503 and
+  ``Retry-After``, before it can queue on the event loop or the Mongo
+  pool and slow everything else down.
+
+Buckets live in memory (per worker) or, for classes marked ``shared``, in
+Mongo when ``MongoBuckets`` is configured, so a limit holds across
+workers. A shared bucket check is one ``find_one_and_update``; if Mongo
+fails, the request is let through.
+"""
+import logging
+import math
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import orjson
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RouteClass:
+    name: str
+    rate: float
+    burst: int
+    by_user: bool = False
+    max_concurrency: int = 0
+    shared: bool = False
+
+
+class MemoryBuckets:
+    """Token buckets in a bounded LRU; the least recently seen client is forgotten first."""
+
+    def __init__(self, max_keys: int = 100000, clock: Callable[[], float] = time.monotonic):
+        self.max_keys = max_keys
+        self.clock = clock
+        self._buckets: "OrderedDict[Tuple[str, str], List[float]]" = OrderedDict()
+
+    async def take(self, route_class: RouteClass, client: str) -> float:
+        """Take a token; returns 0 when allowed, otherwise seconds until one is available."""
+        now = self.clock()
+        key = (route_class.name, client)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [float(route_class.burst), now]
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(route_class.burst, bucket[0] + (now - bucket[1]) * route_class.rate)
+            bucket[1] = now
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return 0.0
+        return (1 - bucket[0]) / route_class.rate
+
+
+class MongoBuckets:
+    """Token buckets in ``rate_limits``, refilled and drawn in one atomic update."""
+
+    def __init__(self, db, idle_ttl: timedelta = timedelta(hours=1)):
+        self.db = db
+        self.idle_ttl = idle_ttl
+
+    def _pipeline(self, route_class: RouteClass, now: datetime):
+        elapsed = {"$divide": [{"$subtract": [now, {"$ifNull": ["$at", now]}]}, 1000]}
+        refilled = {"$min": [
+            route_class.burst,
+            {"$add": [{"$ifNull": ["$tokens", route_class.burst]}, {"$multiply": [elapsed, route_class.rate]}]},
+        ]}
+        return [
+            {"$set": {"tokens": refilled, "at": now, "expires_at": now + self.idle_ttl}},
+            {"$set": {"allowed": {"$gte": ["$tokens", 1]}}},
+            {"$set": {"tokens": {"$cond": ["$allowed", {"$subtract": ["$tokens", 1]}, "$tokens"]}}},
+        ]
+
+    async def take(self, route_class: RouteClass, client: str) -> float:
+        key = f"{route_class.name}:{client}"
+        for _ in range(2):
+            try:
+                bucket = await self.db.rate_limits.find_one_and_update(
+                    {"_id": key},
+                    self._pipeline(route_class, datetime.now(timezone.utc)),
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER,
+                    projection={"tokens": 1, "allowed": 1},
+                )
+                break
+            except DuplicateKeyError:
+                # Two first requests raced to create the bucket; the second try updates it
+                continue
+        else:
+            return 0.0
+        if bucket["allowed"]:
+            return 0.0
+        return (1 - bucket["tokens"]) / route_class.rate
+
+
+class AdmissionControl:
+    def __init__(
+        self,
+        classify: Callable[[str, str], Optional[RouteClass]],
+        identify: Callable[[Optional[bytes]], Optional[str]],
+        buckets: Optional[MemoryBuckets] = None,
+        shared_buckets: Optional[MongoBuckets] = None,
+        enabled: bool = True,
+        trusted_proxies: Iterable[str] = ("127.0.0.1",),
+    ):
+        """``classify(method, path)`` picks the route class (None: not limited);
+        ``identify(authorization header)`` returns a verified user id or None.
+        ``trusted_proxies`` are peers whose ``X-Forwarded-For`` is believed
+        (``*`` trusts any peer, but no hop inside the header)."""
+        self.classify = classify
+        self.identify = identify
+        self.buckets = buckets or MemoryBuckets()
+        self.shared_buckets = shared_buckets
+        self.enabled = enabled
+        self.trusted_proxies = {address.strip() for address in trusted_proxies}
+        self.active: Dict[str, int] = {}
+        self.rejected: Dict[Tuple[str, int], int] = {}
+
+    def _trusted(self, address: str) -> bool:
+        return "*" in self.trusted_proxies or address in self.trusted_proxies
+
+    def client_address(self, scope) -> str:
+        client = scope.get("client")
+        address = client[0] if client else "unknown"
+        if not self._trusted(address):
+            return address
+        forwarded = next((value for name, value in scope["headers"] if name == b"x-forwarded-for"), None)
+        if not forwarded:
+            return address
+        hops = [hop.strip() for hop in forwarded.decode("latin-1").split(",") if hop.strip()]
+        # Hops left of the first untrusted one were written by the client and
+        # may be forged, so the wildcard never vouches for a hop in the header
+        for hop in reversed(hops):
+            if hop not in self.trusted_proxies:
+                return hop
+        return hops[0] if hops else address
+
+    def client_key(self, scope, route_class: RouteClass) -> str:
+        if route_class.by_user:
+            authorization = next((value for name, value in scope["headers"] if name == b"authorization"), None)
+            user_id = self.identify(authorization)
+            if user_id:
+                return f"user:{user_id}"
+        return f"ip:{self.client_address(scope)}"
+
+    async def retry_after(self, scope, route_class: RouteClass) -> float:
+        """0 when the client may proceed, otherwise seconds until its next token."""
+        backend = self.shared_buckets if route_class.shared and self.shared_buckets else self.buckets
+        try:
+            return await backend.take(route_class, self.client_key(scope, route_class))
+        except PyMongoError as e:
+            logger.error(f"Rate limit check failed, letting the request through: {str(e)}")
+            return 0.0
+
+    def count_rejection(self, route_class: RouteClass, status_code: int):
+        key = (route_class.name, status_code)
+        self.rejected[key] = self.rejected.get(key, 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "active": dict(self.active),
+            "rejected": {f"{name}:{status}": count for (name, status), count in self.rejected.items()},
+        }
+
+
+async def _reject(send, status_code: int, retry_after: float, detail: str):
+    await send({
+        "type": "http.response.start",
+        "status": status_code,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode("ascii")),
+        ],
+    })
+    await send({"type": "http.response.body", "body": orjson.dumps({"detail": detail})})
+
+
+class AdmissionMiddleware:
+    def __init__(self, app, control: AdmissionControl):
+        self.app = app
+        self.control = control
+
+    async def __call__(self, scope, receive, send):
+        control = self.control
+        if scope["type"] != "http" or not control.enabled:
+            await self.app(scope, receive, send)
+            return
+        route_class = control.classify(scope["method"], scope["path"])
+        if route_class is None:
+            await self.app(scope, receive, send)
+            return
+
+        wait = await control.retry_after(scope, route_class)
+        if wait:
+            control.count_rejection(route_class, 429)
+            await _reject(send, 429, wait, "Too many requests, try again shortly")
+            return
+
+        if not route_class.max_concurrency:
+            await self.app(scope, receive, send)
+            return
+        running = control.active.get(route_class.name, 0)
+        if running >= route_class.max_concurrency:
+            control.count_rejection(route_class, 503)
+            await _reject(send, 503, 1, "Server busy, try again shortly")
+            return
+        control.active[route_class.name] = running + 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            control.active[route_class.name] -= 1
@@ -0,0 +1,209 @@
+"""Incremental NDJSON/CSV parsing and encoding for bulk endpoints.
+
+Uploads arrive as an async stream of byte chunks and are turned into
+``(line, row)`` pairs one record at a time; exports turn an async iterable
+of dicts (usually a Mongo cursor) into byte chunks. Neither side holds more
+than a record, or one flush worth of output, in memory.
+"""
+import codecs
+import csv
+import io
+import json
+from collections import deque
+from datetime import datetime
+from typing import Any, AsyncIterable, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+FORMATS = ("ndjson", "csv")
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+# Rows encoded per yielded chunk; keeps the number of ASGI sends low without
+# buffering much.
+FLUSH_ROWS = 500
+
+
+class RowError(ValueError):
+    pass
+
+
+async def iter_lines(chunks: AsyncIterable[bytes]) -> AsyncIterator[str]:
+    """Split a UTF-8 byte stream into lines, keeping line endings."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        lines = pending.split("\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line + "\n"
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+
+async def parse_ndjson(chunks: AsyncIterable[bytes]) -> AsyncIterator[Tuple[int, Any]]:
+    """Yield ``(line number, object)``; undecodable lines yield a RowError."""
+    number = 0
+    async for line in iter_lines(chunks):
+        number += 1
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield number, RowError(f"invalid JSON: {e.msg}")
+            continue
+        if not isinstance(row, dict):
+            yield number, RowError("expected a JSON object")
+            continue
+        yield number, row
+
+
+# A quoted field may span lines, but a stray quote must not swallow the rest
+# of the upload: past this size the record is reported and parsing resumes
+# on its second line.
+MAX_RECORD_CHARS = 64 * 1024
+
+
+def _still_quoted(line: str, quoted: bool) -> bool:
+    """Whether a record is inside a quoted field after ``line``.
+
+    Follows the ``csv`` module's rules: a quote only opens a quoted field at
+    the start of a field, and ``""`` inside one is an escaped quote.
+    """
+    field_start = not quoted
+    i = 0
+    while i < len(line):
+        char = line[i]
+        if quoted:
+            if char == '"':
+                if line[i + 1:i + 2] == '"':
+                    i += 1
+                else:
+                    quoted = False
+                    field_start = False
+        elif char == '"' and field_start:
+            quoted = True
+        else:
+            field_start = char == ","
+        i += 1
+    return quoted
+
+
+class _CsvRecords:
+    """Groups ``(line number, line)`` pairs into ``(first line, record text)``."""
+
+    def __init__(self, max_chars: int = MAX_RECORD_CHARS):
+        self.max_chars = max_chars
+        self.lines: List[Tuple[int, str]] = []
+        self.size = 0
+        self.quoted = False
+
+    def _give_up(self, reason: str) -> Tuple[Tuple[int, RowError], List[Tuple[int, str]]]:
+        # Only the record's first line is dropped; the lines after it are read again
+        (start, _), rest = self.lines[0], self.lines[1:]
+        self.lines, self.size, self.quoted = [], 0, False
+        return (start, RowError(reason)), rest
+
+    def feed(self, number: int, line: str) -> List[Tuple[int, Any]]:
+        records: List[Tuple[int, Any]] = []
+        queue = deque([(number, line)])
+        while queue:
+            number, line = queue.popleft()
+            self.lines.append((number, line))
+            self.size += len(line)
+            self.quoted = _still_quoted(line, self.quoted)
+            if not self.quoted:
+                records.append((self.lines[0][0], "".join(text for _, text in self.lines)))
+                self.lines, self.size = [], 0
+            elif self.size > self.max_chars:
+                error, rest = self._give_up(f"quoted field longer than {self.max_chars} characters")
+                records.append(error)
+                queue.extendleft(reversed(rest))
+        return records
+
+    def close(self) -> List[Tuple[int, Any]]:
+        records: List[Tuple[int, Any]] = []
+        while self.lines:
+            error, rest = self._give_up("unterminated quoted field")
+            records.append(error)
+            for number, line in rest:
+                records += self.feed(number, line)
+        return records
+
+
+async def parse_csv(chunks: AsyncIterable[bytes]) -> AsyncIterator[Tuple[int, Any]]:
+    """Yield ``(line number, dict)`` keyed by the header row.
+
+    Quoted fields may span lines. A record that never closes its quote is
+    reported as a RowError on its first line and the lines after it are
+    parsed on their own.
+    """
+    header: Optional[List[str]] = None
+    framer = _CsvRecords()
+
+    async def records():
+        number = 0
+        async for line in iter_lines(chunks):
+            number += 1
+            for record in framer.feed(number, line):
+                yield record
+        for record in framer.close():
+            yield record
+
+    async for start, text in records():
+        if isinstance(text, RowError):
+            yield start, text
+            continue
+        if not text.strip():
+            continue
+        values = next(csv.reader([text]))
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        if len(values) != len(header):
+            yield start, RowError(f"expected {len(header)} columns, got {len(values)}")
+            continue
+        yield start, {name: value for name, value in zip(header, values) if value != ""}
+
+
+def parse_rows(chunks: AsyncIterable[bytes], fmt: str) -> AsyncIterator[Tuple[int, Any]]:
+    return parse_csv(chunks) if fmt == "csv" else parse_ndjson(chunks)
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _csv_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+async def encode_rows(rows: AsyncIterable[Dict[str, Any]], fmt: str, columns: Sequence[str]) -> AsyncIterator[bytes]:
+    """Encode ``rows`` as NDJSON or CSV (header first), ``FLUSH_ROWS`` at a time."""
+    buffer = io.StringIO()
+    writer = None
+    if fmt == "csv":
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+    pending = 0
+    async for row in rows:
+        if writer is not None:
+            writer.writerow([_csv_value(row.get(column)) for column in columns])
+        else:
+            buffer.write(json.dumps(
+                {column: row.get(column) for column in columns},
+                default=_json_default, ensure_ascii=False, separators=(",", ":"),
+            ))
+            buffer.write("\n")
+        pending += 1
+        if pending >= FLUSH_ROWS:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
@@ -0,0 +1,162 @@
+"""Cache invalidation across worker processes.
+
+Every worker keeps its own in-process caches and invalidates them
+immediately after its own writes. ``CacheInvalidator`` relays writes made by
+*other* workers:
+
+* ``change_stream`` (replica sets and sharded clusters): workers watch
+  ``products`` and ``users`` directly, so any write, including ones made
+  outside the app, is seen within one round trip. Product updates that
+  only touch ``stock``/``holds`` are filtered out on the server; the
+  catalog cache already tolerates stock being up to one TTL stale. Change
+  events only carry the ``_id``, so the remaining updates look the document
+  up to drop just that product's entry; a delete (nothing left to look up)
+  drops every product entry.
+* ``poll`` (standalone mongod): writers publish an event to
+  ``cache_events`` and every worker reads new events every
+  ``poll_interval`` seconds, which bounds the delay.
+
+``auto`` picks ``change_stream`` when the server supports it. If the
+stream breaks, every cache is cleared before it is reopened, because events
+may have been missed in between.
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Optional
+
+from bson import ObjectId
+from pymongo.errors import PyMongoError
+
+logger = logging.getLogger(__name__)
+
+PRODUCTS = "product"
+USERS = "user"
+
+# Events written by other workers in the same instant may land slightly out
+# of ObjectId order; each poll re-reads this window and skips what it has seen
+_POLL_OVERLAP = timedelta(seconds=2)
+_RETRY_SECONDS = 1.0
+
+_CATALOG_FIELDS_ONLY = {"$match": {"$or": [
+    {"operationType": {"$ne": "update"}},
+    {"$expr": {"$gt": [
+        {"$size": {"$filter": {
+            "input": {"$concatArrays": [
+                {"$map": {
+                    "input": {"$objectToArray": "$updateDescription.updatedFields"},
+                    "as": "field",
+                    "in": "$$field.k",
+                }},
+                "$updateDescription.removedFields",
+            ]},
+            "as": "path",
+            "cond": {"$not": [{"$in": [{"$arrayElemAt": [{"$split": ["$$path", "."]}, 0]}, ["stock", "holds"]]}]},
+        }}},
+        0,
+    ]}},
+]}}
+
+
+class CacheInvalidator:
+    def __init__(
+        self,
+        db,
+        handlers: Dict[str, Callable[[Optional[str]], None]],
+        mode: str = "auto",
+        poll_interval: float = 1.0,
+    ):
+        """``handlers[kind](key)`` drops one entry, or everything of that kind when ``key`` is None."""
+        self.db = db
+        self.handlers = handlers
+        self.mode = mode
+        self.poll_interval = poll_interval
+        self.received = 0
+        self._tasks = []
+
+    async def _supports_change_streams(self) -> bool:
+        hello = await self.db.client.admin.command("hello")
+        return "setName" in hello or hello.get("msg") == "isdbgrid"
+
+    async def start(self):
+        if self.mode == "auto":
+            self.mode = "change_stream" if await self._supports_change_streams() else "poll"
+        if self.mode == "change_stream":
+            self._tasks = [
+                asyncio.create_task(self._watch(self.db.products, PRODUCTS, [_CATALOG_FIELDS_ONLY], "updateLookup")),
+                asyncio.create_task(self._watch(self.db.users, USERS, [], "updateLookup")),
+            ]
+        elif self.mode == "poll":
+            self._tasks = [asyncio.create_task(self._poll())]
+        logger.info(f"Cache invalidation across workers: {self.mode}")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def _apply(self, kind: str, key: Optional[str]):
+        self.received += 1
+        self.handlers[kind](key)
+
+    def _clear_all(self):
+        for handler in self.handlers.values():
+            handler(None)
+
+    async def publish(self, kind: str, key: Optional[str] = None):
+        """Tell the other workers about a write; only needed in ``poll`` mode."""
+        if self.mode != "poll":
+            return
+        try:
+            await self.db.cache_events.insert_one({"kind": kind, "key": key, "at": datetime.now(timezone.utc)})
+        except PyMongoError as e:
+            # Other workers catch up when their cache entries expire
+            logger.error(f"Failed to publish cache invalidation: {str(e)}")
+
+    async def _watch(self, collection, kind: str, pipeline, full_document: Optional[str]):
+        resume_after: Optional[Dict[str, Any]] = None
+        while True:
+            try:
+                async with collection.watch(pipeline, full_document=full_document, resume_after=resume_after) as stream:
+                    async for change in stream:
+                        resume_after = stream.resume_token
+                        # No document (a delete, or deleted before the lookup) drops the whole kind
+                        document = change.get("fullDocument") or {}
+                        self._apply(kind, document.get("id"))
+                # The collection was dropped or renamed; start a fresh stream
+                resume_after = None
+                self._clear_all()
+            except asyncio.CancelledError:
+                raise
+            except PyMongoError as e:
+                logger.error(f"Change stream on {collection.name} failed, clearing caches: {str(e)}")
+                self._clear_all()
+                await asyncio.sleep(_RETRY_SECONDS)
+
+    async def _poll(self):
+        seen: Dict[ObjectId, datetime] = {}
+        since = datetime.now(timezone.utc)
+        while True:
+            try:
+                cursor = self.db.cache_events.find(
+                    {"_id": {"$gte": ObjectId.from_datetime(since - _POLL_OVERLAP)}}
+                ).sort("_id", 1)
+                async for event in cursor:
+                    if event["_id"] in seen:
+                        continue
+                    seen[event["_id"]] = event["_id"].generation_time
+                    since = max(since, event["_id"].generation_time)
+                    self._apply(event["kind"], event.get("key"))
+                horizon = since - _POLL_OVERLAP
+                for event_id in [event_id for event_id, at in seen.items() if at < horizon]:
+                    del seen[event_id]
+            except asyncio.CancelledError:
+                raise
+            except PyMongoError as e:
+                logger.error(f"Failed to read cache invalidations, clearing caches: {str(e)}")
+                self._clear_all()
+            await asyncio.sleep(self.poll_interval)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"mode": self.mode, "received": self.received, "poll_interval": self.poll_interval}
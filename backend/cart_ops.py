@@ -0,0 +1,115 @@
+"""Atomic cart mutations.
+
+Each change is a single targeted update on the user's cart document rather
+than read, modify in Python, ``replace_one``:
+
+* adding to an existing line is a positional ``$inc`` (the common case);
+* a line that is not there yet is merged in with one pipeline update that
+  either bumps the matching line or appends it, upserting the cart. Because
+  the check and the append happen in the same atomic update, two tabs adding
+  the same product concurrently cannot lose one of the adds;
+* removals are ``$pull``.
+
+``apply_batch`` sends a list of changes as one ordered ``bulk_write``.
+"""
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+
+def _line_filter(product_id: str, size: str, color: str) -> Dict[str, Any]:
+    return {"product_id": product_id, "size": size, "color": color}
+
+
+def _merge_pipeline(product_id: str, size: str, color: str, quantity: int, add: bool) -> List[Dict[str, Any]]:
+    # Values are wrapped in $literal so user input starting with "$" is never
+    # read as a field path.
+    matches = {"$and": [
+        {"$eq": ["$$line.product_id", {"$literal": product_id}]},
+        {"$eq": ["$$line.size", {"$literal": size}]},
+        {"$eq": ["$$line.color", {"$literal": color}]},
+    ]}
+    items = {"$ifNull": ["$items", []]}
+    new_quantity = {"$add": ["$$line.quantity", quantity]} if add else quantity
+    line = {"$literal": {"product_id": product_id, "quantity": quantity, "size": size, "color": color}}
+    return [{"$set": {
+        "id": {"$ifNull": ["$id", str(uuid.uuid4())]},
+        "created_at": {"$ifNull": ["$created_at", datetime.now(timezone.utc)]},
+        "items": {"$cond": [
+            {"$anyElementTrue": [{"$map": {"input": items, "as": "line", "in": matches}}]},
+            {"$map": {
+                "input": items,
+                "as": "line",
+                "in": {"$cond": [matches, {"$mergeObjects": ["$$line", {"quantity": new_quantity}]}, "$$line"]},
+            }},
+            {"$concatArrays": [items, [line]]},
+        ]},
+    }}]
+
+
+async def _write(db, requests: List[UpdateOne]):
+    try:
+        await db.carts.bulk_write(requests, ordered=True)
+    except BulkWriteError as e:
+        # Two first writes raced to create the cart; the loser's upsert hit
+        # the unique user_id index. The cart exists now, so run the rest again.
+        errors = e.details.get("writeErrors", [])
+        if not errors or errors[0]["code"] != 11000:
+            raise
+        await db.carts.bulk_write(requests[errors[0]["index"]:], ordered=True)
+
+
+def add_op(user_id: str, product_id: str, size: str, color: str, quantity: int) -> UpdateOne:
+    return UpdateOne({"user_id": user_id}, _merge_pipeline(product_id, size, color, quantity, add=True), upsert=True)
+
+
+def set_op(user_id: str, product_id: str, size: str, color: str, quantity: int) -> UpdateOne:
+    if quantity <= 0:
+        return remove_op(user_id, product_id, size, color)
+    return UpdateOne({"user_id": user_id}, _merge_pipeline(product_id, size, color, quantity, add=False), upsert=True)
+
+
+def remove_op(user_id: str, product_id: str, size: str, color: str) -> UpdateOne:
+    return UpdateOne({"user_id": user_id}, {"$pull": {"items": _line_filter(product_id, size, color)}})
+
+
+async def add_item(db, user_id: str, product_id: str, size: str, color: str, quantity: int):
+    result = await db.carts.update_one(
+        {"user_id": user_id, "items": {"$elemMatch": _line_filter(product_id, size, color)}},
+        {"$inc": {"items.$.quantity": quantity}},
+    )
+    if result.matched_count == 0:
+        await _write(db, [add_op(user_id, product_id, size, color, quantity)])
+
+
+async def set_quantity(db, user_id: str, product_id: str, size: str, color: str, quantity: int):
+    if quantity > 0:
+        result = await db.carts.update_one(
+            {"user_id": user_id, "items": {"$elemMatch": _line_filter(product_id, size, color)}},
+            {"$set": {"items.$.quantity": quantity}},
+        )
+        if result.matched_count:
+            return
+    await _write(db, [set_op(user_id, product_id, size, color, quantity)])
+
+
+async def remove_line(db, user_id: str, product_id: str, size: str, color: str):
+    await db.carts.update_one({"user_id": user_id}, {"$pull": {"items": _line_filter(product_id, size, color)}})
+
+
+async def remove_product(db, user_id: str, product_id: str):
+    await db.carts.update_one({"user_id": user_id}, {"$pull": {"items": {"product_id": product_id}}})
+
+
+async def apply_batch(db, user_id: str, operations: List[Any]):
+    """Apply ``operations`` (objects with op/product_id/size/color/quantity) in order."""
+    builders = {"add": add_op, "set": set_op, "remove": lambda u, p, s, c, q: remove_op(u, p, s, c)}
+    requests = [
+        builders[operation.op](user_id, operation.product_id, operation.size, operation.color, operation.quantity)
+        for operation in operations
+    ]
+    if requests:
+        await _write(db, requests)
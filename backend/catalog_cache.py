@@ -0,0 +1,114 @@
+"""In-process read-through cache for catalog responses.
+
+Entries are the already-serialized JSON bytes of a response, so a hit skips
+the database, Pydantic validation and JSON encoding entirely. The cache is
+bounded (LRU eviction), entries expire after ``ttl`` seconds, and concurrent
+misses on the same key are coalesced into a single load.
+
+Keys are tuples whose first element is a namespace (``"product"``,
+``"products"``) so a whole family of list pages can be dropped at once when
+an admin edits the catalog.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+
+class CatalogCache:
+    def __init__(self, maxsize: int = 1024, ttl: float = 30.0, clock: Callable[[], float] = time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._entries: "OrderedDict[Tuple[Hashable, ...], Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[Tuple[Hashable, ...], asyncio.Future] = {}
+        # Bumped on every invalidation so a load that started before an
+        # admin write cannot store the stale result it read.
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.coalesced = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0 and self.ttl > 0
+
+    def _lookup(self, key) -> Tuple[bool, Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        expires_at, value = entry
+        if expires_at <= self._clock():
+            del self._entries[key]
+            return False, None
+        self._entries.move_to_end(key)
+        return True, value
+
+    def _store(self, key, value):
+        self._entries[key] = (self._clock() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def get_or_load(self, key: Tuple[Hashable, ...], loader: Callable[[], Awaitable[Optional[Any]]]):
+        """Return the cached value for ``key`` or load it.
+
+        ``None`` results (e.g. a missing product) are returned but not cached.
+        """
+        if not self.enabled:
+            return await loader()
+
+        found, value = self._lookup(key)
+        if found:
+            self.hits += 1
+            return value
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+            return await asyncio.shield(inflight)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        # Nobody may be waiting on the future when the load fails.
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[key] = future
+        generation = self._generation
+        try:
+            value = await loader()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+        if value is not None and generation == self._generation:
+            self._store(key, value)
+        future.set_result(value)
+        return value
+
+    def invalidate(self, key: Tuple[Hashable, ...]):
+        self._generation += 1
+        self._entries.pop(key, None)
+
+    def invalidate_namespace(self, namespace: Hashable):
+        self._generation += 1
+        for key in [k for k in self._entries if k[0] == namespace]:
+            del self._entries[key]
+
+    def clear(self):
+        self._generation += 1
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "coalesced": self.coalesced,
+        }
@@ -0,0 +1,120 @@
+"""Bulk product import and export for admins.
+
+``import_products`` consumes an upload as it arrives: rows are validated
+against the product model, collected into chunks and upserted with
+unordered ``bulk_write`` batches. The next chunk is parsed while the
+previous batch is in flight. Rows carrying an ``id`` update that product;
+rows without one create a new product. Every rejected row (failed
+validation or a failed write) is reported by its line number in the file.
+
+``export_products`` streams the collection in ``id`` order from a single
+cursor.
+"""
+import asyncio
+import uuid
+from datetime import datetime, timezone
+from typing import Any, AsyncIterable, AsyncIterator, Dict, List, Tuple, Type
+
+from pydantic import BaseModel, ValidationError
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from bulk_io import RowError, encode_rows, parse_rows
+
+IMPORT_BATCH_SIZE = 1000
+EXPORT_BATCH_SIZE = 1000
+# The report lists at most this many rejected rows; the counts stay exact
+MAX_REPORTED_ERRORS = 1000
+
+
+class ImportReport:
+    def __init__(self):
+        self.rows = 0
+        self.inserted = 0
+        self.updated = 0
+        self.failed = 0
+        self.errors: List[Dict[str, Any]] = []
+
+    def reject(self, line: int, messages: List[str]):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "errors": messages})
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "rows": self.rows,
+            "inserted": self.inserted,
+            "updated": self.updated,
+            "failed": self.failed,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors),
+        }
+
+
+def _validation_messages(error: ValidationError) -> List[str]:
+    return [f"{'.'.join(str(part) for part in e['loc'])}: {e['msg']}" for e in error.errors()]
+
+
+def _upsert(fields: Dict[str, Any], product_id: str, now: datetime) -> UpdateOne:
+    return UpdateOne(
+        {"id": product_id},
+        {"$set": fields, "$setOnInsert": {"id": product_id, "created_at": now}},
+        upsert=True,
+    )
+
+
+async def _write(db, batch: List[Tuple[int, UpdateOne]], report: ImportReport):
+    try:
+        result = await db.products.bulk_write([op for _, op in batch], ordered=False)
+        report.inserted += result.upserted_count
+        report.updated += result.matched_count
+    except BulkWriteError as e:
+        report.inserted += e.details.get("nUpserted", 0)
+        report.updated += e.details.get("nMatched", 0)
+        for error in e.details.get("writeErrors", []):
+            report.reject(batch[error["index"]][0], [error.get("errmsg", "write failed")])
+
+
+async def import_products(db, chunks: AsyncIterable[bytes], fmt: str, model: Type[BaseModel]) -> Dict[str, Any]:
+    """Upsert every valid row of an NDJSON/CSV upload and return the report."""
+    report = ImportReport()
+    now = datetime.now(timezone.utc)
+    batch: List[Tuple[int, UpdateOne]] = []
+    in_flight = None
+
+    async def flush():
+        nonlocal batch, in_flight
+        if in_flight is not None:
+            await in_flight
+        in_flight = asyncio.ensure_future(_write(db, batch, report)) if batch else None
+        batch = []
+
+    try:
+        async for line, row in parse_rows(chunks, fmt):
+            report.rows += 1
+            if isinstance(row, RowError):
+                report.reject(line, [str(row)])
+                continue
+            product_id = str(row.pop("id", "") or uuid.uuid4())
+            try:
+                fields = model(**row).dict()
+            except ValidationError as e:
+                report.reject(line, _validation_messages(e))
+                continue
+            batch.append((line, _upsert(fields, product_id, now)))
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                await flush()
+        await flush()
+        if in_flight is not None:
+            await in_flight
+    finally:
+        if in_flight is not None and not in_flight.done():
+            in_flight.cancel()
+    return report.as_dict()
+
+
+async def export_products(db, fmt: str, columns: List[str]) -> AsyncIterator[bytes]:
+    projection = {"_id": 0, **{column: 1 for column in columns}}
+    cursor = db.products.find({}, projection).sort("id", 1).batch_size(EXPORT_BATCH_SIZE)
+    async for chunk in encode_rows(cursor, fmt, columns):
+        yield chunk
@@ -0,0 +1,175 @@
+"""Scheduled cleanup of abandoned checkout state.
+
+Shoppers who never pay leave a ``pending`` payment transaction behind, and
+carts emptied line by line stay in ``carts`` with no items. ``Compactor``
+clears both up in bounded batches:
+
+* pending transactions older than ``pending_after`` (by then Stripe has
+  expired the session, so it can no longer be paid) are marked ``expired``;
+* unpaid transactions in a terminal state get a ``purge_at`` date, and the
+  TTL index on that field deletes them ``retention`` later. A payment that
+  still lands in between is finalized as usual and the claim unsets
+  ``purge_at``, so a paid transaction is never purged;
+* empty carts are deleted outright; an empty cart and no cart read the same.
+
+Held stock is not touched here: the reservation sweeper releases it once the
+reservation itself expires.
+
+Every worker calls ``run_if_due`` from its maintenance loop; a lease in
+``maintenance_leases`` makes sure only one of them runs per ``interval``.
+"""
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+OPEN_STATUSES = ["pending", "open"]
+TERMINAL_STATUSES = ["expired", "cancelled"]
+_LEASE = "compaction"
+
+
+class Compactor:
+    def __init__(
+        self,
+        db,
+        interval: timedelta = timedelta(hours=1),
+        pending_after: timedelta = timedelta(hours=25),
+        retention: timedelta = timedelta(days=7),
+        batch_size: int = 500,
+        max_batches: int = 20,
+    ):
+        """Each run touches at most ``batch_size * max_batches`` documents per step;
+        whatever is left is picked up by the next run."""
+        self.db = db
+        self.interval = interval
+        self.pending_after = pending_after
+        self.retention = retention
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        self.runs = 0
+        self.last_report: Optional[Dict[str, Any]] = None
+
+    async def _claim(self, now: datetime) -> bool:
+        try:
+            await self.db.maintenance_leases.update_one(
+                {"_id": _LEASE, "until": {"$lte": now}},
+                {"$set": {"until": now + self.interval}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            # The lease exists and has not run out: another worker ran recently
+            return False
+        return True
+
+    async def run_if_due(self) -> Optional[Dict[str, Any]]:
+        if not await self._claim(datetime.now(timezone.utc)):
+            return None
+        return await self.run()
+
+    async def _batches(self, collection, query: Dict[str, Any], apply) -> int:
+        """Find matching ``_id``s a batch at a time and hand each batch to ``apply``."""
+        total = 0
+        for _ in range(self.max_batches):
+            ids: List[Any] = [
+                document["_id"]
+                async for document in collection.find(query, {"_id": 1}).limit(self.batch_size)
+            ]
+            if not ids:
+                break
+            total += await apply(ids)
+            if len(ids) < self.batch_size:
+                break
+        return total
+
+    async def expire_stale_transactions(self, now: datetime) -> int:
+        query = {
+            "status": {"$in": OPEN_STATUSES},
+            "payment_status": {"$ne": "paid"},
+            "created_at": {"$lte": now - self.pending_after},
+        }
+
+        async def apply(ids):
+            # The query is repeated so a transaction paid since the find is left alone
+            result = await self.db.payment_transactions.update_many(
+                {"_id": {"$in": ids}, **query},
+                {"$set": {"status": "expired", "purge_at": now + self.retention}},
+            )
+            return result.modified_count
+
+        return await self._batches(self.db.payment_transactions, query, apply)
+
+    async def schedule_purge(self, now: datetime) -> int:
+        """Give unpaid cancelled or expired transactions a ``purge_at`` date."""
+        query = {
+            "status": {"$in": TERMINAL_STATUSES},
+            "payment_status": {"$ne": "paid"},
+            "purge_at": {"$exists": False},
+        }
+
+        async def apply(ids):
+            result = await self.db.payment_transactions.update_many(
+                {"_id": {"$in": ids}, **query},
+                {"$set": {"purge_at": now + self.retention}},
+            )
+            return result.modified_count
+
+        return await self._batches(self.db.payment_transactions, query, apply)
+
+    async def delete_empty_carts(self) -> int:
+        query = {"$or": [{"items": {"$size": 0}}, {"items": {"$exists": False}}]}
+
+        async def apply(ids):
+            # A cart filled again since the find no longer matches and is kept
+            result = await self.db.carts.delete_many({"_id": {"$in": ids}, **query})
+            return result.deleted_count
+
+        return await self._batches(self.db.carts, query, apply)
+
+    async def _average_size(self, collection: str) -> int:
+        try:
+            async for stats in self.db[collection].aggregate([{"$collStats": {"storageStats": {}}}]):
+                return int(stats["storageStats"].get("avgObjSize", 0))
+        except PyMongoError as e:
+            logger.warning(f"Could not read storage stats for {collection}: {str(e)}")
+        return 0
+
+    async def run(self, now: Optional[datetime] = None) -> Dict[str, Any]:
+        now = now or datetime.now(timezone.utc)
+        started = time.perf_counter()
+        expired = await self.expire_stale_transactions(now)
+        scheduled = expired + await self.schedule_purge(now)
+        carts = await self.delete_empty_carts()
+
+        # Sizes are estimates from the collections' average document size
+        transaction_size = await self._average_size("payment_transactions") if scheduled else 0
+        cart_size = await self._average_size("carts") if carts else 0
+        report = {
+            "ran_at": now,
+            "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+            "transactions_expired": expired,
+            "transactions_scheduled_for_purge": scheduled,
+            "carts_deleted": carts,
+            "bytes_reclaimed": carts * cart_size,
+            "bytes_scheduled_for_purge": scheduled * transaction_size,
+        }
+        self.runs += 1
+        self.last_report = report
+        logger.info(
+            f"Compaction: expired {expired} transactions, scheduled {scheduled} for purge, "
+            f"deleted {carts} empty carts (~{report['bytes_reclaimed']} bytes reclaimed) "
+            f"in {report['duration_ms']}ms"
+        )
+        return report
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "runs": self.runs,
+            "interval_s": self.interval.total_seconds(),
+            "pending_after_s": self.pending_after.total_seconds(),
+            "retention_s": self.retention.total_seconds(),
+            "last_report": self.last_report,
+        }
@@ -0,0 +1,32 @@
+"""Process and connection-pool sizing for production runs.
+
+Every uvicorn worker is a separate process with its own Motor client, so
+the Mongo connection budget is split between workers: with
+``MONGO_CONNECTION_BUDGET=200`` and 4 workers each pool may open 50
+connections. ``MONGO_MAX_POOL_SIZE`` overrides the split.
+"""
+import os
+from typing import Any, Dict
+
+
+def worker_count() -> int:
+    configured = os.environ.get('WEB_WORKERS')
+    if configured:
+        return max(1, int(configured))
+    # The app is I/O bound and bcrypt has its own pool; one worker per core
+    return max(1, os.cpu_count() or 1)
+
+
+def mongo_client_options() -> Dict[str, Any]:
+    workers = int(os.environ.get('WEB_WORKERS', '1'))
+    budget = int(os.environ.get('MONGO_CONNECTION_BUDGET', '100'))
+    max_pool = int(os.environ.get('MONGO_MAX_POOL_SIZE', str(max(1, budget // max(1, workers)))))
+    return {
+        "maxPoolSize": max_pool,
+        "minPoolSize": min(max_pool, int(os.environ.get('MONGO_MIN_POOL_SIZE', '2'))),
+        "maxIdleTimeMS": int(os.environ.get('MONGO_MAX_IDLE_TIME_MS', '300000')),
+        "waitQueueTimeoutMS": int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', '5000')),
+        "connectTimeoutMS": int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', '5000')),
+        "serverSelectionTimeoutMS": int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', '5000')),
+        "socketTimeoutMS": int(os.environ.get('MONGO_SOCKET_TIMEOUT_MS', '30000')),
+    }
@@ -0,0 +1,266 @@
+"""Durable outbox for transactional email.
+
+Emails are written to ``email_outbox`` next to the order they belong to and
+sent later by ``OutboxWorker``. The worker claims due messages in batches,
+renders each batch with ``email_templates``, sends them concurrently over one shared HTTP connection pool,
+and retries failures with exponential backoff. A unique ``dedupe_key`` (for
+order confirmations, the order id) means enqueueing twice sends once.
+
+Transports are pluggable: ``SendGridTransport`` talks to the SendGrid v3
+API, ``LogTransport`` only logs (useful without credentials) and
+``RecordingTransport`` keeps messages in memory for tests and benchmarks.
+"""
+import asyncio
+import logging
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Union
+
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from instrumentation import outbound
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class OutboundEmail:
+    id: str
+    to: str
+    subject: str
+    html: str
+
+
+async def enqueue_email(db, template: str, dedupe_key: str, to: str, context: Dict[str, Any]) -> bool:
+    """Queue an email. Returns False if one with ``dedupe_key`` already exists."""
+    now = datetime.now(timezone.utc)
+    try:
+        await db.email_outbox.insert_one({
+            "id": str(uuid.uuid4()),
+            "dedupe_key": dedupe_key,
+            "template": template,
+            "to": to,
+            "context": context,
+            "status": "pending",
+            "attempts": 0,
+            "next_attempt_at": now,
+            "created_at": now,
+        })
+    except DuplicateKeyError:
+        return False
+    return True
+
+
+class LogTransport:
+    async def send(self, message: OutboundEmail):
+        logger.info(f"Email to {message.to}: {message.subject}")
+
+    async def close(self):
+        pass
+
+
+class RecordingTransport:
+    def __init__(self, fail_every: int = 0):
+        self.sent: List[OutboundEmail] = []
+        self.fail_every = fail_every
+        self._calls = 0
+
+    async def send(self, message: OutboundEmail):
+        self._calls += 1
+        if self.fail_every and self._calls % self.fail_every == 0:
+            raise RuntimeError("simulated transport failure")
+        self.sent.append(message)
+
+    async def close(self):
+        pass
+
+
+class SendGridTransport:
+    API_URL = "https://api.sendgrid.com/v3/mail/send"
+
+    def __init__(self, api_key: str, sender: str, max_connections: int = 10, timeout: float = 10.0):
+        import httpx
+
+        self.sender = sender
+        self._client = httpx.AsyncClient(
+            headers={"Authorization": f"Bearer {api_key}"},
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=timeout,
+        )
+
+    async def send(self, message: OutboundEmail):
+        async with outbound("sendgrid", "send"):
+            response = await self._client.post(self.API_URL, json={
+                "personalizations": [{"to": [{"email": message.to}]}],
+                "from": {"email": self.sender},
+                "subject": message.subject,
+                "content": [{"type": "text/html", "value": message.html}],
+            })
+        if response.status_code != 202:
+            raise RuntimeError(f"SendGrid answered {response.status_code}: {response.text[:200]}")
+
+    async def close(self):
+        await self._client.aclose()
+
+
+class OutboxWorker:
+    def __init__(
+        self,
+        db,
+        transport,
+        templates,
+        batch_size: int = 50,
+        poll_interval: float = 2.0,
+        max_attempts: int = 8,
+        backoff_base: float = 30.0,
+        backoff_cap: float = 3600.0,
+        lease: float = 300.0,
+    ):
+        self.db = db
+        self.transport = transport
+        self.templates = templates
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.lease = lease
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self.started_at = time.monotonic()
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.batches = 0
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def notify(self):
+        """Skip the rest of the poll interval, e.g. right after an enqueue."""
+        self._wakeup.set()
+
+    async def stop(self):
+        self._stopping = True
+        self._wakeup.set()
+        if self._task is not None:
+            await self._task
+        await self.transport.close()
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                processed = await self.process_batch()
+            except Exception as e:
+                logger.error(f"Email outbox batch failed: {str(e)}")
+                processed = 0
+            if processed < self.batch_size:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+
+    async def _claim(self) -> List[Dict[str, Any]]:
+        now = datetime.now(timezone.utc)
+        due = {"$or": [
+            {"status": "pending", "next_attempt_at": {"$lte": now}},
+            # A worker died mid-send; its lease has run out
+            {"status": "sending", "locked_until": {"$lte": now}},
+        ]}
+        candidates = await self.db.email_outbox.find(due, {"_id": 0, "id": 1}).limit(self.batch_size).to_list(self.batch_size)
+        if not candidates:
+            return []
+        claim = str(uuid.uuid4())
+        await self.db.email_outbox.update_many(
+            {"$and": [{"id": {"$in": [c["id"] for c in candidates]}}, due]},
+            {"$set": {"status": "sending", "claim": claim, "locked_until": now + timedelta(seconds=self.lease)}},
+        )
+        return await self.db.email_outbox.find({"claim": claim}).to_list(self.batch_size)
+
+    def _render(self, documents: List[Dict[str, Any]]) -> List[Union[OutboundEmail, Exception]]:
+        """One message per document, or the exception that kept it from rendering."""
+        by_template: Dict[str, List[Dict[str, Any]]] = {}
+        for document in documents:
+            by_template.setdefault(document["template"], []).append(document)
+        messages: Dict[str, Union[OutboundEmail, Exception]] = {}
+        for template, group in by_template.items():
+            try:
+                rendered = self.templates.render_batch(template, [d["context"] for d in group])
+            except Exception:
+                # Render one by one so a bad context only fails its own message
+                rendered = []
+                for document in group:
+                    try:
+                        rendered.append(self.templates.render_batch(template, [document["context"]])[0])
+                    except Exception as e:
+                        rendered.append(e)
+            for document, result in zip(group, rendered):
+                if isinstance(result, Exception):
+                    messages[document["id"]] = result
+                else:
+                    subject, html = result
+                    messages[document["id"]] = OutboundEmail(
+                        id=document["id"], to=document["to"], subject=subject, html=html
+                    )
+        return [messages[document["id"]] for document in documents]
+
+    async def _send(self, message: Union[OutboundEmail, Exception]):
+        if isinstance(message, Exception):
+            # A render failure counts as a failed attempt like a transport error
+            raise message
+        await self.transport.send(message)
+
+    async def process_batch(self) -> int:
+        documents = await self._claim()
+        if not documents:
+            return 0
+        messages = self._render(documents)
+        results = await asyncio.gather(*(self._send(message) for message in messages), return_exceptions=True)
+
+        now = datetime.now(timezone.utc)
+        ops = []
+        for document, result in zip(documents, results):
+            if not isinstance(result, Exception):
+                self.sent += 1
+                ops.append(UpdateOne(
+                    {"id": document["id"]},
+                    {"$set": {"status": "sent", "sent_at": now}, "$unset": {"claim": "", "locked_until": ""}},
+                ))
+                continue
+
+            attempts = document["attempts"] + 1
+            logger.warning(f"Email {document['id']} attempt {attempts} failed: {str(result)}")
+            if attempts >= self.max_attempts:
+                self.failed += 1
+                update = {"status": "failed", "attempts": attempts, "last_error": str(result)}
+            else:
+                self.retried += 1
+                delay = min(self.backoff_cap, self.backoff_base * 2 ** (attempts - 1))
+                update = {
+                    "status": "pending",
+                    "attempts": attempts,
+                    "last_error": str(result),
+                    "next_attempt_at": now + timedelta(seconds=delay),
+                }
+            ops.append(UpdateOne({"id": document["id"]}, {"$set": update, "$unset": {"claim": "", "locked_until": ""}}))
+
+        await self.db.email_outbox.bulk_write(ops, ordered=False)
+        self.batches += 1
+        return len(documents)
+
+    async def stats(self) -> Dict[str, Any]:
+        elapsed = max(time.monotonic() - self.started_at, 1e-9)
+        return {
+            "sent": self.sent,
+            "retried": self.retried,
+            "failed": self.failed,
+            "batches": self.batches,
+            "sent_per_second": round(self.sent / elapsed, 3),
+            "backlog": await self.db.email_outbox.count_documents({"status": {"$in": ["pending", "sending"]}}),
+            "dead": await self.db.email_outbox.count_documents({"status": "failed"}),
+        }
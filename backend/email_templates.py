@@ -0,0 +1,213 @@
+"""Email templates, compiled once and rendered by joining parts.
+
+Template syntax is deliberately tiny:
+
+* ``{{name}}`` or ``{{name:.2f}}`` inserts a context value (with an optional
+  format spec). Every value in a body is HTML-escaped, so product and
+  customer names cannot inject markup.
+* ``{{#items}}...{{/items}}`` repeats the enclosed block for each mapping
+  in the ``items`` list, with that mapping as the context.
+
+Compiling splits each section into literal pieces and field slots once,
+and a bad format spec is rejected then with ``TemplateError``. Rendering a
+section formats each row and joins them in one go, which stays linear in
+the number of line items.
+"""
+import html
+import re
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+_TOKEN = re.compile(r"{{\s*([#/]?)([A-Za-z_][A-Za-z0-9_]*)(?::([^{}'\"\\\\]*))?\s*}}")
+
+
+class TemplateError(ValueError):
+    pass
+
+
+_NUMERIC_SPECS = set("bdeEfFgGnoxX%")
+# The standard format spec mini-language: [[fill]align][sign][#][0][width][grouping][.precision][type]
+_FORMAT_SPEC = re.compile(r"(?:[^{}]?[<>=^])?[+\- ]?#?0?\d*[,_]?(?:\.\d+)?[bcdeEfFgGnosxX%]?").fullmatch
+_SPECIAL = re.compile(r"[&<>\"']").search
+
+
+def _escape_html(value: Any) -> Any:
+    # Numbers are left alone so their format spec still applies
+    if value.__class__ is str and _SPECIAL(value):
+        return html.escape(value)
+    return value
+
+
+class CompiledTemplate:
+    """A template compiled to a list of literal pieces and field slots.
+
+    Each field becomes a precomputed getter for its slot: an escaped lookup
+    formatted with the builtin ``format``, a plain one for numeric specs,
+    or, for a section, the joined rows of the section's own compiled
+    template. Rendering fills the slots and joins once; nothing is parsed
+    at render time and no code is generated.
+    """
+
+    def __init__(self, source: str, escape: bool = True):
+        parts, _, closing = self._parse(source, 0)
+        if closing is not None:
+            raise TemplateError(f"Unexpected {{{{/{closing}}}}}")
+        self.render: Callable[[Dict[str, Any]], str] = self._compile(parts, escape)
+
+    @classmethod
+    def _compile(cls, parts: List[Any], escape: bool) -> Callable[[Dict[str, Any]], str]:
+        pieces: List[str] = []
+        slots: List[Tuple[int, Callable[[Dict[str, Any]], str]]] = []
+        for part in parts:
+            if part.__class__ is str:
+                pieces.append(part)
+                continue
+            kind, name, extra = part
+            if kind == "field":
+                if not _FORMAT_SPEC(extra):
+                    raise TemplateError(f"Invalid format spec for {name}: {extra!r}")
+                if escape and not extra:
+                    getter = lambda context, name=name: str(_escape_html(context[name]))
+                elif escape and extra[-1:] not in _NUMERIC_SPECS:
+                    getter = lambda context, name=name, spec=extra: format(_escape_html(context[name]), spec)
+                else:
+                    # A numeric format spec can only produce safe characters
+                    getter = lambda context, name=name, spec=extra: format(context[name], spec)
+            else:
+                row = cls._compile(extra, escape)
+                getter = lambda context, name=name, row=row: "".join([row(item) for item in context[name]])
+            slots.append((len(pieces), getter))
+            pieces.append("")
+
+        def render(context: Dict[str, Any]) -> str:
+            filled = pieces.copy()
+            for index, getter in slots:
+                filled[index] = getter(context)
+            return "".join(filled)
+
+        return render
+
+    @classmethod
+    def _parse(cls, source: str, position: int):
+        parts: List[Any] = []
+        while True:
+            match = _TOKEN.search(source, position)
+            if match is None:
+                if position < len(source):
+                    parts.append(source[position:])
+                return parts, len(source), None
+            if match.start() > position:
+                parts.append(source[position:match.start()])
+            kind, name, spec = match.groups()
+            position = match.end()
+            if kind == "/":
+                return parts, position, name
+            if kind == "#":
+                body, position, closing = cls._parse(source, position)
+                if closing != name:
+                    raise TemplateError(f"Section {name} is not closed")
+                parts.append(("section", name, body))
+            else:
+                parts.append(("field", name, spec or ""))
+
+
+class EmailTemplate:
+    def __init__(self, subject: str, body: str):
+        # Subjects are plain text, not HTML
+        self.subject = CompiledTemplate(subject, escape=False)
+        self.body = CompiledTemplate(body)
+
+    def render(self, context: Dict[str, Any]) -> Tuple[str, str]:
+        return self.subject.render(context), self.body.render(context)
+
+
+_LAYOUT_HEAD = """
+    <html>
+        <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
+            <div style="max-width: 600px; margin: 0 auto; padding: 20px;">
+                <h1 style="color: #2c3e50; text-align: center;">Urban Threads</h1>
+"""
+
+_LAYOUT_FOOT = """
+                <div style="text-align: center; margin-top: 30px; padding-top: 20px; border-top: 1px solid #eee;">
+                    <p style="color: #666; font-size: 14px;">Urban Threads - Streetwear Urbano</p>
+                </div>
+            </div>
+        </body>
+    </html>
+"""
+
+_ORDER_TABLE = """
+                <div style="background-color: #f8f9fa; padding: 15px; border-radius: 5px; margin: 20px 0;">
+                    <h3>Detalhes do Pedido #{{order_id}}</h3>
+                    <table style="width: 100%; border-collapse: collapse;">
+                        <thead>
+                            <tr style="background-color: #e9ecef;">
+                                <th style="padding: 10px; text-align: left;">Produto</th>
+                                <th style="padding: 10px; text-align: left;">Tamanho</th>
+                                <th style="padding: 10px; text-align: left;">Cor</th>
+                                <th style="padding: 10px; text-align: left;">Qtd</th>
+                                <th style="padding: 10px; text-align: left;">Preço</th>
+                            </tr>
+                        </thead>
+                        <tbody>{{#items}}
+                            <tr>
+                                <td style="padding: 10px; border-bottom: 1px solid #eee;">{{name}}</td>
+                                <td style="padding: 10px; border-bottom: 1px solid #eee;">{{size}}</td>
+                                <td style="padding: 10px; border-bottom: 1px solid #eee;">{{color}}</td>
+                                <td style="padding: 10px; border-bottom: 1px solid #eee;">{{quantity}}</td>
+                                <td style="padding: 10px; border-bottom: 1px solid #eee;">R$ {{price:.2f}}</td>
+                            </tr>{{/items}}
+                        </tbody>
+                    </table>
+                    <div style="text-align: right; margin-top: 15px; font-size: 18px; font-weight: bold;">
+                        Total: R$ {{total:.2f}}
+                    </div>
+                </div>
+"""
+
+TEMPLATE_SOURCES = {
+    "order_confirmation": (
+        "Confirmação de Pedido #{{order_id}}",
+        _LAYOUT_HEAD + """
+                <h2 style="color: #34495e;">Confirmação de Pedido</h2>
+                <p>Olá {{user_name}},</p>
+                <p>Seu pedido foi confirmado! Obrigado por comprar na Urban Threads.</p>
+""" + _ORDER_TABLE + """
+                <p>Você receberá uma nova notificação quando seu pedido for enviado.</p>
+                <p>Obrigado por escolher a Urban Threads!</p>
+""" + _LAYOUT_FOOT,
+    ),
+    "order_shipped": (
+        "Pedido #{{order_id}} enviado",
+        _LAYOUT_HEAD + """
+                <h2 style="color: #34495e;">Pedido Enviado</h2>
+                <p>Olá {{user_name}},</p>
+                <p>Seu pedido está a caminho!</p>
+""" + _ORDER_TABLE + """
+                <p>Obrigado por escolher a Urban Threads!</p>
+""" + _LAYOUT_FOOT,
+    ),
+    "order_cancelled": (
+        "Pedido #{{order_id}} cancelado",
+        _LAYOUT_HEAD + """
+                <h2 style="color: #34495e;">Pedido Cancelado</h2>
+                <p>Olá {{user_name}},</p>
+                <p>Seu pedido foi cancelado. Se você não solicitou o cancelamento, entre em contato conosco.</p>
+""" + _ORDER_TABLE + _LAYOUT_FOOT,
+    ),
+}
+
+
+class EmailTemplates:
+    def __init__(self, sources: Dict[str, Tuple[str, str]] = TEMPLATE_SOURCES):
+        self._templates = {name: EmailTemplate(subject, body) for name, (subject, body) in sources.items()}
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._templates
+
+    def render(self, name: str, context: Dict[str, Any]) -> Tuple[str, str]:
+        return self._templates[name].render(context)
+
+    def render_batch(self, name: str, contexts: Sequence[Dict[str, Any]]) -> List[Tuple[str, str]]:
+        template = self._templates[name]
+        return [template.render(context) for context in contexts]
@@ -0,0 +1,187 @@
+"""Exactly-once order finalization for checkout sessions.
+
+Stripe webhooks and browser polls both report session status here. A paid
+session is claimed atomically on its payment transaction (a conditional
+``find_one_and_update`` that stamps the order id), so however many
+deliveries race, one caller creates the order. The unit of work after the
+claim is idempotent: the order is upserted by id, the confirmation email is
+deduplicated by the outbox, and the stock commit is idempotent (committing a
+reservation twice is a no-op, and stock taken for a lapsed reservation is
+tagged with the session). The stock and stats steps each leave a marker on
+the transaction, written only after the step succeeded, so a step that
+failed or was cut short is run again. If the process dies part way,
+``resume_stalled`` finishes the job later. The stats update claims the
+order before counting it, so a replay never counts it twice; a crash
+between the claim and the increments leaves the order out of the stats
+until they are rebuilt.
+
+Webhook event ids are recorded in ``webhook_events`` so redelivered events
+are acknowledged without reprocessing.
+"""
+import logging
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from email_outbox import enqueue_email
+from order_stats import record_paid_order
+from reservations import commit_reservation, forget_taken_stock, release_reservation, take_stock
+
+logger = logging.getLogger(__name__)
+
+
+class OrderFinalizer:
+    def __init__(
+        self,
+        db,
+        build_order: Callable[[Dict[str, Any], str], Dict[str, Any]],
+        notify_outbox: Callable[[], None] = lambda: None,
+        stale_after: timedelta = timedelta(minutes=5),
+    ):
+        """``build_order(transaction, order_id)`` returns the order document to insert."""
+        self.db = db
+        self.build_order = build_order
+        self.notify_outbox = notify_outbox
+        self.stale_after = stale_after
+
+    async def record_event(self, event_id: str, event_type: Optional[str]) -> bool:
+        """Remember a webhook event. Returns False if it was already processed."""
+        try:
+            await self.db.webhook_events.insert_one({
+                "_id": event_id,
+                "type": event_type,
+                "received_at": datetime.now(timezone.utc),
+            })
+        except DuplicateKeyError:
+            return False
+        return True
+
+    async def forget_event(self, event_id: str):
+        # Processing failed; let Stripe's retry go through
+        await self.db.webhook_events.delete_one({"_id": event_id})
+
+    async def apply_status(
+        self, session_id: str, status: str, payment_status: str, stripe_status: Optional[Dict[str, Any]] = None
+    ) -> Optional[str]:
+        """Apply a reported session status. Returns the order id once paid."""
+        fields = {"status": status, "payment_status": payment_status}
+        if stripe_status is not None:
+            fields["stripe_status"] = stripe_status
+
+        if payment_status == "paid":
+            return await self.finalize(session_id, fields)
+        if status == "expired":
+            await self.expire(session_id, fields)
+            return None
+        # Never let a late "open" report overwrite a terminal state
+        await self.db.payment_transactions.update_one(
+            {"session_id": session_id, "payment_status": {"$ne": "paid"}, "status": {"$ne": "expired"}},
+            {"$set": fields},
+        )
+        return None
+
+    async def expire(self, session_id: str, fields: Dict[str, Any]):
+        transaction = await self.db.payment_transactions.find_one_and_update(
+            {"session_id": session_id, "payment_status": {"$ne": "paid"}},
+            {"$set": fields},
+        )
+        if transaction and transaction.get("reservation_id"):
+            await release_reservation(self.db, transaction["reservation_id"])
+
+    async def finalize(self, session_id: str, fields: Dict[str, Any]) -> Optional[str]:
+        now = datetime.now(timezone.utc)
+        transaction = await self.db.payment_transactions.find_one_and_update(
+            # Transactions paid before finalization existed carry no order_id
+            # but already have their order, hence the payment_status guard.
+            {"session_id": session_id, "order_id": {"$exists": False}, "payment_status": {"$ne": "paid"}},
+            # A payment can land after compaction expired the session; the
+            # transaction must then outlive its purge date
+            {
+                "$set": {**fields, "order_id": str(uuid.uuid4()), "finalization.claimed_at": now},
+                "$unset": {"purge_at": ""},
+            },
+            return_document=ReturnDocument.AFTER,
+        )
+        if transaction is None:
+            # Someone else claimed it (or it was never ours); keep the
+            # latest Stripe snapshot for the terminal short-circuit.
+            if "stripe_status" in fields:
+                await self.db.payment_transactions.update_one(
+                    {"session_id": session_id}, {"$set": {"stripe_status": fields["stripe_status"]}}
+                )
+            existing = await self.db.payment_transactions.find_one({"session_id": session_id}, {"_id": 0, "order_id": 1})
+            return existing.get("order_id") if existing else None
+
+        await self._complete(transaction)
+        return transaction["order_id"]
+
+    async def _mark_done(self, session_id: str, step: str):
+        # Only written once the step succeeded, so a failure leaves it to be retried
+        await self.db.payment_transactions.update_one(
+            {"session_id": session_id},
+            {"$set": {f"finalization.{step}": datetime.now(timezone.utc)}},
+        )
+
+    async def _commit_stock(self, transaction: Dict[str, Any], order: Dict[str, Any]):
+        # Make the held stock permanent; if the hold already lapsed, take
+        # whatever stock is still there
+        reservation_id = transaction.get("reservation_id")
+        if reservation_id and await commit_reservation(self.db, reservation_id):
+            return
+        quantities: Dict[str, int] = {}
+        for item in order["items"]:
+            quantities[item["product_id"]] = quantities.get(item["product_id"], 0) + item["quantity"]
+        short = await take_stock(self.db, quantities, f"order:{transaction['session_id']}")
+        if short:
+            logger.warning(f"Order {order['id']} paid after its reservation lapsed; short on {short}")
+
+    async def _complete(self, transaction: Dict[str, Any]):
+        session_id = transaction["session_id"]
+        order = self.build_order(transaction, transaction["order_id"])
+        await self.db.orders.update_one({"id": order["id"]}, {"$setOnInsert": order}, upsert=True)
+
+        if order["user_email"] != "guest":
+            await enqueue_email(self.db, "order_confirmation", f"order_confirmation:{order['id']}", order["user_email"], {
+                "user_name": order["user_name"],
+                "order_id": order["id"],
+                "items": order["items"],
+                "total": order["total_amount"],
+            })
+            self.notify_outbox()
+
+        # The snapshot is fresh: just claimed, or just read by resume_stalled
+        done = transaction.get("finalization") or {}
+        if "stock" not in done:
+            await self._commit_stock(transaction, order)
+            await self._mark_done(session_id, "stock")
+            # The tag only guards a replay of the step above; the marker does that now
+            await forget_taken_stock(self.db, f"order:{session_id}")
+
+        if "stats" not in done:
+            await record_paid_order(self.db, order)
+            await self._mark_done(session_id, "stats")
+
+        # Dropping the claim takes the transaction out of the sparse index
+        # resume_stalled scans, so that index only ever holds open claims
+        await self.db.payment_transactions.update_one(
+            {"session_id": session_id},
+            {
+                "$set": {"finalization.completed_at": datetime.now(timezone.utc)},
+                "$unset": {"finalization.claimed_at": ""},
+            },
+        )
+
+    async def resume_stalled(self, batch_size: int = 100) -> int:
+        """Finish claims whose worker died before completing them."""
+        cutoff = datetime.now(timezone.utc) - self.stale_after
+        stalled = await self.db.payment_transactions.find({
+            "finalization.claimed_at": {"$lte": cutoff},
+            "finalization.completed_at": {"$exists": False},
+        }).limit(batch_size).to_list(length=batch_size)
+        for transaction in stalled:
+            logger.warning(f"Resuming finalization of session {transaction['session_id']}")
+            await self._complete(transaction)
+        return len(stalled)
@@ -0,0 +1,240 @@
+"""Index declarations for every collection, built at startup.
+
+``create_indexes`` is a no-op when an identical index already exists, so
+``ensure_indexes`` is safe to run on every boot.
+
+Running this module checks the query shapes the handlers issue against the
+current indexes and exits non-zero if any of them would scan a whole
+collection::
+
+    python indexes.py            # build indexes, then explain every shape
+    python indexes.py --no-build # only explain
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+INDEXES = {
+    "users": [
+        IndexModel([("email", ASCENDING)], name="users_email", unique=True),
+        IndexModel([("id", ASCENDING)], name="users_id", unique=True),
+    ],
+    "products": [
+        IndexModel([("id", ASCENDING)], name="products_id", unique=True),
+        # Catalog listing: optional equality filters, then the keyset sort
+        IndexModel([("created_at", DESCENDING), ("id", DESCENDING)], name="products_recent"),
+        IndexModel(
+            [("category", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)],
+            name="products_category_recent",
+        ),
+        IndexModel(
+            [("size", ASCENDING), ("color", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)],
+            name="products_size_color_recent",
+        ),
+        # Catalog search; a collection can carry only one text index
+        IndexModel(
+            [("name", TEXT), ("description", TEXT)],
+            name="products_text",
+            weights={"name": 3, "description": 1},
+            default_language="portuguese",
+        ),
+        # Stock holds are looked up by reservation id on commit and release
+        IndexModel([("holds.rid", ASCENDING)], name="products_holds"),
+    ],
+    "carts": [
+        IndexModel([("user_id", ASCENDING)], name="carts_user_id", unique=True),
+    ],
+    "payment_transactions": [
+        IndexModel([("session_id", ASCENDING)], name="payment_transactions_session_id", unique=True),
+        # Finalization unsets claimed_at on completion, so only open claims are indexed
+        IndexModel([("finalization.claimed_at", ASCENDING)], name="payment_transactions_finalizing", sparse=True),
+        IndexModel([("quote_id", ASCENDING)], name="payment_transactions_quote", sparse=True),
+        IndexModel([("status", ASCENDING), ("created_at", ASCENDING)], name="payment_transactions_status_created"),
+        # Set by compaction on unpaid transactions only; paid ones never carry it
+        IndexModel([("purge_at", ASCENDING)], name="payment_transactions_purge", expireAfterSeconds=0),
+    ],
+    "orders": [
+        IndexModel([("id", ASCENDING)], name="orders_id", unique=True),
+        IndexModel([("created_at", DESCENDING), ("id", DESCENDING)], name="orders_recent"),
+        IndexModel([("payment_status", ASCENDING), ("created_at", DESCENDING)], name="orders_payment_status"),
+        IndexModel([("stats_claim", ASCENDING)], name="orders_stats_claim", sparse=True),
+    ],
+    "order_stats": [
+        IndexModel([("kind", ASCENDING), ("date", ASCENDING)], name="order_stats_days"),
+        IndexModel([("kind", ASCENDING), ("revenue", DESCENDING)], name="order_stats_revenue"),
+    ],
+    "email_outbox": [
+        IndexModel([("id", ASCENDING)], name="email_outbox_id", unique=True),
+        IndexModel([("dedupe_key", ASCENDING)], name="email_outbox_dedupe_key", unique=True),
+        IndexModel([("status", ASCENDING), ("next_attempt_at", ASCENDING)], name="email_outbox_due"),
+        IndexModel([("status", ASCENDING), ("locked_until", ASCENDING)], name="email_outbox_lease"),
+        IndexModel([("claim", ASCENDING)], name="email_outbox_claim", sparse=True),
+        # Sent mail is kept a month so a late duplicate enqueue is still deduplicated;
+        # failed mail has no sent_at and stays for inspection
+        IndexModel([("sent_at", ASCENDING)], name="email_outbox_sent_ttl", expireAfterSeconds=30 * 24 * 3600),
+    ],
+    "webhook_events": [
+        # Stripe stops retrying a delivery after three days; a week leaves a margin for replays
+        IndexModel([("received_at", ASCENDING)], name="webhook_events_ttl", expireAfterSeconds=7 * 24 * 3600),
+    ],
+    "cache_events": [
+        # Workers only read the last few seconds of invalidations
+        IndexModel([("at", ASCENDING)], name="cache_events_ttl", expireAfterSeconds=3600),
+    ],
+    "rate_limits": [
+        IndexModel([("expires_at", ASCENDING)], name="rate_limits_ttl", expireAfterSeconds=0),
+    ],
+    "stock_reservations": [
+        IndexModel([("id", ASCENDING)], name="stock_reservations_id", unique=True),
+        IndexModel([("status", ASCENDING), ("expires_at", ASCENDING)], name="stock_reservations_expiry"),
+        IndexModel([("restoring", ASCENDING)], name="stock_reservations_restoring", sparse=True),
+        # Settled reservations are only kept for troubleshooting
+        IndexModel([("released_at", ASCENDING)], name="stock_reservations_released_ttl", expireAfterSeconds=7 * 24 * 3600),
+        IndexModel([("committed_at", ASCENDING)], name="stock_reservations_committed_ttl", expireAfterSeconds=7 * 24 * 3600),
+    ],
+}
+
+
+async def ensure_indexes(db):
+    for collection, indexes in INDEXES.items():
+        try:
+            names = await db[collection].create_indexes(indexes)
+        except OperationFailure as e:
+            # Typically existing duplicates blocking a unique index; keep
+            # serving and let the query-plan check point at the gap.
+            logger.error(f"Failed to build indexes on {collection}: {str(e)}")
+            continue
+        logger.info(f"Ensured indexes on {collection}: {', '.join(names)}")
+
+
+class QueryShape(NamedTuple):
+    name: str
+    collection: str
+    filter: Dict[str, Any]
+    sort: Optional[List] = None
+
+
+_KEYSET = {"created_at": -1, "id": -1}
+_NOW = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+# One entry per distinct query a handler issues; values are placeholders,
+# only the shape matters to the planner.
+QUERY_SHAPES = [
+    QueryShape("auth: user by email", "users", {"email": "shopper@example.com"}),
+    QueryShape("catalog: product by id", "products", {"id": "p"}),
+    QueryShape("catalog: list", "products", {}, _KEYSET),
+    QueryShape("catalog: list by category", "products", {"category": "camisetas"}, _KEYSET),
+    QueryShape("catalog: list by size and color", "products", {"size": "M", "color": "preto"}, _KEYSET),
+    QueryShape("catalog: list by price", "products", {"price": {"$gte": 50, "$lte": 150}}, _KEYSET),
+    QueryShape("search: text", "products", {"$text": {"$search": "camiseta"}}),
+    QueryShape("search: text in category", "products", {"$text": {"$search": "camiseta"}, "category": "camisetas"}),
+    QueryShape("search: category and size", "products", {"category": "camisetas", "size": "M"}, {"created_at": -1, "id": -1}),
+    QueryShape("checkout: price cart", "products", {"id": {"$in": ["p1", "p2"]}}),
+    QueryShape("checkout: reservation holds", "products", {"holds.rid": "r"}),
+    QueryShape("cart: by user", "carts", {"user_id": "u"}),
+    QueryShape("payments: by session", "payment_transactions", {"session_id": "s"}),
+    QueryShape(
+        "payments: reusable quote", "payment_transactions",
+        {"quote_id": "q", "status": {"$in": ["pending", "open"]}, "quote_expires_at": {"$gt": _NOW}},
+    ),
+    QueryShape(
+        "finalization: stalled claims", "payment_transactions",
+        {"finalization.claimed_at": {"$lte": _NOW}, "finalization.completed_at": {"$exists": False}},
+    ),
+    QueryShape(
+        "compaction: stale pending", "payment_transactions",
+        {"status": {"$in": ["pending", "open"]}, "payment_status": {"$ne": "paid"}, "created_at": {"$lte": _NOW}},
+    ),
+    QueryShape(
+        "compaction: unpurged terminal", "payment_transactions",
+        {"status": {"$in": ["expired", "cancelled"]}, "payment_status": {"$ne": "paid"}, "purge_at": {"$exists": False}},
+    ),
+    QueryShape("orders: by id", "orders", {"id": "o"}),
+    QueryShape("orders: recent", "orders", {}, _KEYSET),
+    QueryShape("orders: paid", "orders", {"payment_status": "paid"}),
+    QueryShape(
+        "orders: export range", "orders",
+        {"created_at": {"$gte": _NOW, "$lt": _NOW}}, {"created_at": 1, "id": 1},
+    ),
+    QueryShape(
+        "orders: export paid range", "orders",
+        {"created_at": {"$gte": _NOW, "$lt": _NOW}, "payment_status": "paid"}, {"created_at": 1, "id": 1},
+    ),
+    QueryShape("dashboard: revenue by day", "order_stats", {"kind": "day", "date": {"$gte": "2024-01-01"}}, {"date": 1}),
+    QueryShape("dashboard: top products", "order_stats", {"kind": "product"}, {"revenue": -1}),
+    QueryShape("outbox: due", "email_outbox", {"status": "pending", "next_attempt_at": {"$lte": _NOW}}),
+    QueryShape("outbox: claimed batch", "email_outbox", {"claim": "c"}),
+    QueryShape("outbox: by id", "email_outbox", {"id": "m"}),
+    QueryShape("reservations: by id", "stock_reservations", {"id": "r"}),
+    QueryShape(
+        "reservations: expired", "stock_reservations",
+        {"status": "pending", "expires_at": {"$lte": _NOW}},
+    ),
+    QueryShape("reservations: interrupted releases", "stock_reservations", {"status": "released", "restoring": True}),
+]
+
+
+def _stages(plan: Dict[str, Any]):
+    yield plan.get("stage")
+    for child in ("inputStage", "queryPlan"):
+        if child in plan:
+            yield from _stages(plan[child])
+    for child in plan.get("inputStages", []):
+        yield from _stages(child)
+
+
+async def explain_shape(db, shape: QueryShape) -> List[str]:
+    command = {"find": shape.collection, "filter": shape.filter}
+    if shape.sort:
+        command["sort"] = shape.sort
+    explained = await db.command({"explain": command, "verbosity": "queryPlanner"})
+    return [stage for stage in _stages(explained["queryPlanner"]["winningPlan"]) if stage]
+
+
+async def check_query_plans(db) -> List[QueryShape]:
+    """Explain every query shape and return the ones that scan a collection."""
+    scanning = []
+    for shape in QUERY_SHAPES:
+        stages = await explain_shape(db, shape)
+        verdict = "COLLSCAN" if "COLLSCAN" in stages else "ok"
+        print(f"{verdict:>9}  {shape.name:<36} {' <- '.join(stages)}")
+        if "COLLSCAN" in stages:
+            scanning.append(shape)
+    return scanning
+
+
+async def _main(build: bool) -> int:
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    try:
+        db = client[os.environ['DB_NAME']]
+        if build:
+            await ensure_indexes(db)
+        scanning = await check_query_plans(db)
+    finally:
+        client.close()
+    if scanning:
+        print(f"{len(scanning)} query shape(s) fall back to a collection scan")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build indexes and verify query plans")
+    parser.add_argument("--no-build", action="store_true", help="only explain, do not create indexes")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(asyncio.run(_main(build=not args.no_build)))
@@ -0,0 +1,363 @@
+"""Request, database and outbound-call metrics in Prometheus text format.
+
+* ``RequestMetricsMiddleware`` (plain ASGI, so streaming responses are not
+  buffered) records a latency histogram per route template and method,
+  the number of requests in flight, and, per request, how many Mongo round
+  trips it made and how long they took. With ``server_timing`` on it also
+  reports the latter to the client in a ``Server-Timing`` header.
+* ``MongoCommandListener`` is registered on the client. Motor runs each
+  operation on its executor with a copy of the caller's context, so the
+  listener can charge every command to the request stored in a contextvar.
+  A request that sends the same command to the same collection
+  ``N_PLUS_ONE_THRESHOLD`` times or more (a query in a loop) is counted
+  and logged.
+* ``outbound(service, operation)`` times calls to Stripe and SendGrid.
+* ``SlowRequestProfiler`` is opt-in. It samples the event loop thread's
+  stack and, when a request takes longer than its threshold, keeps the
+  folded stacks seen during that request.
+
+Everything is exposed through ``REGISTRY.render()``; the app serves it at
+``/api/metrics``.
+"""
+import asyncio
+import bisect
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter as Tally, deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+N_PLUS_ONE_THRESHOLD = int(os.environ.get('N_PLUS_ONE_THRESHOLD', '10'))
+# Cursor continuations repeat by design; they are not a query in a loop
+_NOT_N_PLUS_ONE = {"getMore", "killCursors", "endSessions"}
+# Innermost frames of an event loop waiting for I/O (asyncio; uvloop's loop
+# is C, so its innermost Python frame is the runner)
+_IDLE_FRAMES = {
+    ("selectors.py", "select"),
+    ("runners.py", "run"),
+    ("base_events.py", "run_forever"),
+    ("base_events.py", "run_until_complete"),
+}
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[Any], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name, self.help, self.label_names = name, help, tuple(labels)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1.0):
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def samples(self):
+        for labels, value in list(self._values.items()):
+            yield f"{self.name}{_labels(self.label_names, labels)} {value}"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, *labels, value: float):
+        self._values[labels] = value
+
+    def dec(self, *labels, amount: float = 1.0):
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name, self.help, self.label_names = name, help, tuple(labels)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (+Inf last), sum, count]
+        self._series: Dict[Tuple, List[Any]] = {}
+
+    def observe(self, value: float, *labels):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series.setdefault(labels, [[0] * (len(self.buckets) + 1), 0.0, 0])
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def samples(self):
+        for labels, (counts, total, count) in list(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                bound_label = f'le="{le}"'
+                yield f"{self.name}_bucket{_labels(self.label_names, labels, bound_label)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.label_names, labels)} {total}"
+            yield f"{self.name}_count{_labels(self.label_names, labels)} {count}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[Any] = []
+        self._collectors: List[Callable[[], Dict[str, float]]] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collect: Callable[[], Dict[str, float]]):
+        """``collect()`` returns ``{sample name with labels: value}`` gauges read at scrape time."""
+        self._collectors.append(collect)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        for collect in self._collectors:
+            try:
+                samples = collect()
+            except Exception as e:
+                logger.error(f"Metrics collector failed: {str(e)}")
+                continue
+            lines.extend(f"{name} {value}" for name, value in samples.items())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+http_request_seconds = REGISTRY.register(Histogram(
+    "http_request_duration_seconds", "Request latency by route template", ("method", "route", "status"),
+))
+http_in_flight = REGISTRY.register(Gauge("http_requests_in_flight", "Requests being handled", ("method",)))
+request_db_calls = REGISTRY.register(Histogram(
+    "http_request_db_calls", "Mongo round trips per request", ("route",), buckets=COUNT_BUCKETS,
+))
+request_db_seconds = REGISTRY.register(Histogram(
+    "http_request_db_seconds", "Time spent waiting on Mongo per request", ("route",),
+))
+n_plus_one_total = REGISTRY.register(Counter(
+    "http_request_n_plus_one_total", "Requests that repeated one command on one collection",
+    ("route", "command", "collection"),
+))
+mongo_command_seconds = REGISTRY.register(Histogram(
+    "mongo_command_duration_seconds", "Mongo command latency", ("command", "collection", "outcome"),
+))
+outbound_seconds = REGISTRY.register(Histogram(
+    "outbound_request_duration_seconds", "Calls to external services", ("service", "operation", "outcome"),
+))
+
+
+class RequestStats:
+    __slots__ = ("route", "db_calls", "db_seconds", "outbound_seconds", "commands")
+
+    def __init__(self):
+        self.route = "unmatched"
+        self.db_calls = 0
+        self.db_seconds = 0.0
+        self.outbound_seconds = 0.0
+        self.commands: Tally = Tally()
+
+
+_current: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+_in_flight = 0
+
+
+def current_request() -> Optional[RequestStats]:
+    return _current.get()
+
+
+def requests_in_flight() -> int:
+    return _in_flight
+
+
+async def wait_for_idle(timeout: float, interval: float = 0.05) -> bool:
+    """Wait until no request is being handled; False if ``timeout`` ran out first."""
+    deadline = time.monotonic() + timeout
+    while _in_flight:
+        if time.monotonic() >= deadline:
+            return False
+        await asyncio.sleep(interval)
+    return True
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    def __init__(self):
+        # request id -> (collection, stats of the HTTP request that issued it)
+        self._pending: Dict[int, Tuple[str, Optional[RequestStats]]] = {}
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            collection = event.command.get("collection")
+        if not isinstance(collection, str):
+            collection = ""
+        self._pending[event.request_id] = (collection, _current.get())
+
+    def _finish(self, event, outcome: str):
+        collection, stats = self._pending.pop(event.request_id, ("", None))
+        seconds = event.duration_micros / 1e6
+        mongo_command_seconds.observe(seconds, event.command_name, collection, outcome)
+        if stats is not None:
+            stats.db_calls += 1
+            stats.db_seconds += seconds
+            if event.command_name not in _NOT_N_PLUS_ONE:
+                stats.commands[(event.command_name, collection)] += 1
+
+    def succeeded(self, event):
+        self._finish(event, "ok")
+
+    def failed(self, event):
+        self._finish(event, "error")
+
+
+@asynccontextmanager
+async def outbound(service: str, operation: str):
+    outcome = "ok"
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        seconds = time.perf_counter() - started
+        outbound_seconds.observe(seconds, service, operation, outcome)
+        stats = _current.get()
+        if stats is not None:
+            stats.outbound_seconds += seconds
+
+
+class SlowRequestProfiler:
+    """Samples the event loop thread and keeps stacks for slow requests.
+
+    Samples taken while the loop is idle in ``select`` are dropped, so what
+    remains is the code that held the loop. Concurrent requests share the
+    loop, so a dump shows everything that ran while the slow request was
+    in flight, not only its own frames.
+    """
+
+    def __init__(self, threshold: float, interval: float = 0.005, window: float = 30.0, keep: int = 20):
+        self.threshold = threshold
+        self.interval = interval
+        self._samples: Deque[Tuple[float, str]] = deque(maxlen=int(window / interval))
+        self.dumps: Deque[Dict[str, Any]] = deque(maxlen=keep)
+        self._thread_id: Optional[int] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread_id = threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="slow-request-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is None or (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in _IDLE_FRAMES:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            self._samples.append((time.perf_counter(), ";".join(reversed(stack))))
+
+    def request_finished(self, method: str, route: str, started: float, seconds: float):
+        if seconds < self.threshold:
+            return
+        folded = Tally(stack for at, stack in list(self._samples) if at >= started)
+        self.dumps.append({
+            "method": method,
+            "route": route,
+            "duration_ms": round(seconds * 1000, 1),
+            "at": time.time(),
+            "samples": sum(folded.values()),
+            "stacks": [{"stack": stack, "count": count} for stack, count in folded.most_common(50)],
+        })
+        top = folded.most_common(1)
+        logger.warning(
+            f"Slow request {method} {route}: {seconds * 1000:.0f} ms, {sum(folded.values())} busy samples"
+            + (f", hottest: {top[0][0].rsplit(';', 1)[-1]}" if top else "")
+        )
+
+
+class RequestMetricsMiddleware:
+    def __init__(self, app, profiler: Optional[SlowRequestProfiler] = None, server_timing: bool = False):
+        self.app = app
+        self.profiler = profiler
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        stats = RequestStats()
+        token = _current.set(stats)
+        status_code = 500
+        started = time.perf_counter()
+
+        async def send_with_timing(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            if message["type"] == "http.response.start" and self.server_timing:
+                headers = list(message.get("headers", []))
+                headers.append((
+                    b"server-timing",
+                    f'db;dur={stats.db_seconds * 1000:.1f};desc="{stats.db_calls} calls"'.encode("latin-1"),
+                ))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        global _in_flight
+        _in_flight += 1
+        http_in_flight.inc(method)
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            seconds = time.perf_counter() - started
+            _in_flight -= 1
+            http_in_flight.dec(method)
+            _current.reset(token)
+            route = scope.get("route")
+            stats.route = getattr(route, "path", None) or "unmatched"
+            http_request_seconds.observe(seconds, method, stats.route, status_code)
+            request_db_calls.observe(stats.db_calls, stats.route)
+            request_db_seconds.observe(stats.db_seconds, stats.route)
+            for (command, collection), count in stats.commands.items():
+                if count >= N_PLUS_ONE_THRESHOLD:
+                    n_plus_one_total.inc(stats.route, command, collection)
+                    logger.warning(
+                        f"Possible N+1 on {method} {stats.route}: {count} x {command} on {collection}"
+                    )
+            if self.profiler is not None:
+                self.profiler.request_finished(method, stats.route, started, seconds)
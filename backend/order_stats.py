@@ -0,0 +1,234 @@
+"""Pre-aggregated sales figures for the admin dashboard.
+
+``order_stats`` holds one running-totals document plus one document per
+day, product and category. Paying an order bumps all of them with a single
+unordered ``bulk_write`` of ``$inc`` upserts, so the dashboard reads a few
+small documents instead of scanning ``orders``.
+
+Every order is claimed before it is counted: ``stats_counted`` is set on
+the order with a conditional update, and only the caller that set it bumps
+the figures. Live payments and the backfill can therefore overlap without
+counting an order twice or dropping one.
+
+``ensure_order_stats`` backfills history the first time the app starts
+against an existing database. It counts unclaimed paid orders in batches,
+adding to whatever live payments have recorded meanwhile, and leaves its own
+marker in ``maintenance_leases`` when done, so later starts skip it.
+
+``rebuild_order_stats`` recomputes everything from ``orders`` with ``$group``
+aggregations into a staging collection and swaps it in with one rename. It
+is for offline repair: increments recorded while it runs are lost with the
+collection it replaces.
+"""
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List
+
+from pymongo import UpdateOne
+
+from indexes import INDEXES
+
+TOTALS_ID = "totals"
+UNCATEGORIZED = "uncategorized"
+_BACKFILL = "order_stats_backfill"
+_STAGING = "order_stats_staging"
+
+
+def _day(moment: datetime) -> str:
+    return moment.strftime("%Y-%m-%d")
+
+
+def _inc(key: str, kind: str, fields: Dict[str, Any], revenue: float, **extra) -> UpdateOne:
+    return UpdateOne(
+        {"_id": key},
+        {"$inc": {**fields, "revenue": revenue}, "$setOnInsert": {"kind": kind, **extra}},
+        upsert=True,
+    )
+
+
+def _order_ops(orders: List[Dict[str, Any]]) -> List[UpdateOne]:
+    """One ``$inc`` upsert per stats document the orders touch."""
+    totals = {"paid_orders": 0, "revenue": 0}
+    docs: Dict[str, Dict[str, Any]] = {}
+
+    def bump(key, kind, count_field, count, revenue, **extra):
+        doc = docs.setdefault(key, {"kind": kind, "fields": {count_field: 0}, "revenue": 0, "extra": extra})
+        doc["fields"][count_field] += count
+        doc["revenue"] += revenue
+
+    for order in orders:
+        total = order["total_amount"]
+        day = _day(order["created_at"])
+        totals["paid_orders"] += 1
+        totals["revenue"] += total
+        bump(f"day:{day}", "day", "orders", 1, total, date=day)
+        for item in order["items"]:
+            line_revenue = item["price"] * item["quantity"]
+            category = item.get("category") or UNCATEGORIZED
+            bump(
+                f"product:{item['product_id']}", "product", "units", item["quantity"], line_revenue,
+                product_id=item["product_id"], name=item["name"],
+            )
+            bump(f"category:{category}", "category", "units", item["quantity"], line_revenue, category=category)
+
+    ops = [UpdateOne({"_id": TOTALS_ID}, {"$inc": totals}, upsert=True)]
+    ops += [_inc(key, doc["kind"], doc["fields"], doc["revenue"], **doc["extra"]) for key, doc in docs.items()]
+    return ops
+
+
+async def record_paid_order(db, order: Dict[str, Any]) -> bool:
+    """Count a paid order. Returns False if it was already counted."""
+    claimed = await db.orders.update_one(
+        {"id": order["id"], "stats_counted": {"$ne": True}},
+        {"$set": {"stats_counted": True}},
+    )
+    if claimed.modified_count == 0:
+        return False
+    await db.order_stats.bulk_write(_order_ops([order]), ordered=False)
+    return True
+
+
+async def backfill_order_stats(db, batch_size: int = 1000) -> int:
+    """Count the paid orders nothing has counted yet. Returns how many."""
+    query = {"payment_status": "paid", "stats_counted": {"$ne": True}}
+    counted = 0
+    last_id = None
+    while True:
+        # Walking by _id keeps each batch from rescanning the orders claimed before it
+        page = dict(query, _id={"$gt": last_id}) if last_id is not None else query
+        ids = [
+            document["_id"]
+            async for document in db.orders.find(page, {"_id": 1}).sort("_id", 1).limit(batch_size)
+        ]
+        if not ids:
+            break
+        last_id = ids[-1]
+        claim = uuid.uuid4().hex
+        # The query is repeated so orders a live payment counted since the find are left alone
+        await db.orders.update_many(
+            {"_id": {"$in": ids}, **query},
+            {"$set": {"stats_counted": True, "stats_claim": claim}},
+        )
+        orders = await db.orders.find(
+            {"stats_claim": claim},
+            {"_id": 0, "total_amount": 1, "created_at": 1, "items": 1},
+        ).to_list(length=batch_size)
+        if orders:
+            await db.order_stats.bulk_write(_order_ops(orders), ordered=False)
+            counted += len(orders)
+        await db.orders.update_many({"stats_claim": claim}, {"$unset": {"stats_claim": ""}})
+        if len(ids) < batch_size:
+            break
+    return counted
+
+
+async def rebuild_order_stats(db):
+    # Everything paid so far is in the rebuild; later payments count themselves
+    await db.orders.update_many(
+        {"payment_status": "paid", "stats_counted": {"$ne": True}},
+        {"$set": {"stats_counted": True}},
+    )
+    line_revenue = {"$multiply": ["$items.price", "$items.quantity"]}
+    pipeline = [
+        {"$match": {"payment_status": "paid"}},
+        {"$facet": {
+            "totals": [
+                {"$group": {"_id": None, "paid_orders": {"$sum": 1}, "revenue": {"$sum": "$total_amount"}}},
+            ],
+            "days": [
+                {"$group": {
+                    "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at"}},
+                    "orders": {"$sum": 1},
+                    "revenue": {"$sum": "$total_amount"},
+                }},
+            ],
+            "products": [
+                {"$unwind": "$items"},
+                {"$group": {
+                    "_id": "$items.product_id",
+                    "name": {"$last": "$items.name"},
+                    "units": {"$sum": "$items.quantity"},
+                    "revenue": {"$sum": line_revenue},
+                }},
+            ],
+            "categories": [
+                {"$unwind": "$items"},
+                {"$group": {
+                    "_id": {"$ifNull": ["$items.category", UNCATEGORIZED]},
+                    "units": {"$sum": "$items.quantity"},
+                    "revenue": {"$sum": line_revenue},
+                }},
+            ],
+        }},
+    ]
+    result = (await db.orders.aggregate(pipeline, allowDiskUse=True).to_list(length=1))[0]
+
+    totals = result["totals"][0] if result["totals"] else {"paid_orders": 0, "revenue": 0}
+    documents = [{"_id": TOTALS_ID, "paid_orders": totals["paid_orders"], "revenue": totals["revenue"]}]
+    documents += [
+        {"_id": f"day:{d['_id']}", "kind": "day", "date": d["_id"], "orders": d["orders"], "revenue": d["revenue"]}
+        for d in result["days"]
+    ]
+    documents += [
+        {"_id": f"product:{p['_id']}", "kind": "product", "product_id": p["_id"], "name": p["name"],
+         "units": p["units"], "revenue": p["revenue"]}
+        for p in result["products"]
+    ]
+    documents += [
+        {"_id": f"category:{c['_id']}", "kind": "category", "category": c["_id"],
+         "units": c["units"], "revenue": c["revenue"]}
+        for c in result["categories"]
+    ]
+    staging = db[_STAGING]
+    await staging.drop()
+    await staging.create_indexes(INDEXES["order_stats"])
+    await staging.insert_many(documents)
+    await staging.rename("order_stats", dropTarget=True)
+
+
+async def ensure_order_stats(db):
+    """Backfill the stats collection unless a previous start already did."""
+    if await db.maintenance_leases.find_one({"_id": _BACKFILL}, {"_id": 1}) is not None:
+        return
+    await backfill_order_stats(db)
+    await db.maintenance_leases.update_one(
+        {"_id": _BACKFILL},
+        {"$set": {"finished_at": datetime.now(timezone.utc)}},
+        upsert=True,
+    )
+
+
+def _weeks(days: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    weeks: Dict[str, Dict[str, Any]] = {}
+    for day in days:
+        year, week, _ = datetime.strptime(day["date"], "%Y-%m-%d").isocalendar()
+        key = f"{year}-W{week:02d}"
+        bucket = weeks.setdefault(key, {"week": key, "orders": 0, "revenue": 0.0})
+        bucket["orders"] += day["orders"]
+        bucket["revenue"] += day["revenue"]
+    return list(weeks.values())
+
+
+async def dashboard_stats(db, days: int = 30, top: int = 10) -> Dict[str, Any]:
+    totals = await db.order_stats.find_one({"_id": TOTALS_ID}) or {}
+    since = _day(datetime.now(timezone.utc) - timedelta(days=days - 1))
+    by_day = await db.order_stats.find(
+        {"kind": "day", "date": {"$gte": since}},
+        {"_id": 0, "date": 1, "orders": 1, "revenue": 1},
+    ).sort("date", 1).to_list(length=days)
+    top_products = await db.order_stats.find(
+        {"kind": "product"},
+        {"_id": 0, "product_id": 1, "name": 1, "units": 1, "revenue": 1},
+    ).sort("revenue", -1).limit(top).to_list(length=top)
+    by_category = await db.order_stats.find(
+        {"kind": "category"},
+        {"_id": 0, "category": 1, "units": 1, "revenue": 1},
+    ).sort("revenue", -1).to_list(length=None)
+    return {
+        "paid_orders": totals.get("paid_orders", 0),
+        "total_revenue": totals.get("revenue", 0),
+        "revenue_by_day": by_day,
+        "revenue_by_week": _weeks(by_day),
+        "top_products": top_products,
+        "revenue_by_category": by_category,
+    }
@@ -0,0 +1,61 @@
+"""Keyset (cursor) pagination over ``(created_at, id)``.
+
+A cursor is an opaque, URL-safe token naming the last document of the
+previous page. The next page is fetched with a range condition on the
+``(created_at, id)`` pair instead of ``skip``, so page N costs the same as
+page 1 when a matching index exists.
+"""
+import base64
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+# Newest first; ``id`` breaks ties between documents created in the same
+# millisecond.
+KEYSET_SORT = [("created_at", -1), ("id", -1)]
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(document: Dict[str, Any]) -> str:
+    raw = f"{document['created_at'].isoformat()}|{document['id']}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, document_id = base64.urlsafe_b64decode(padded).decode("utf-8").split("|", 1)
+        return datetime.fromisoformat(created_at), document_id
+    except (ValueError, UnicodeDecodeError) as e:
+        raise InvalidCursor("Invalid cursor") from e
+
+
+def keyset_filter(cursor: Optional[str]) -> Dict[str, Any]:
+    """Condition selecting documents that sort after ``cursor``."""
+    if not cursor:
+        return {}
+    created_at, document_id = decode_cursor(cursor)
+    return {
+        "$or": [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "id": {"$lt": document_id}},
+        ]
+    }
+
+
+def with_keyset(query: Dict[str, Any], cursor: Optional[str]) -> Dict[str, Any]:
+    after = keyset_filter(cursor)
+    if not after:
+        return query
+    if not query:
+        return after
+    return {"$and": [query, after]}
+
+
+def next_cursor(page: List[Dict[str, Any]], limit: int) -> Optional[str]:
+    """Cursor for the page after ``page``, or None when it was the last one."""
+    if len(page) < limit or not page:
+        return None
+    return encode_cursor(page[-1])
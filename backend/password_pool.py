@@ -0,0 +1,111 @@
+"""Password hashing off the event loop.
+
+bcrypt is deliberately slow (~100-300 ms per call). Running it inside an
+async handler blocks every other request on the worker, so hashing and
+verification go through a small dedicated executor instead. The pool admits
+at most ``max_queue`` outstanding jobs; beyond that ``PoolSaturated`` is
+raised so the caller can answer 429 and a credential-stuffing burst cannot
+starve the rest of the API.
+
+passlib and its bcrypt backend are loaded on first use (or by ``warm``),
+not when this module is imported.
+"""
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+_pwd_context = None
+
+
+def pwd_context():
+    global _pwd_context
+    if _pwd_context is None:
+        from passlib.context import CryptContext
+
+        _pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    return _pwd_context
+
+
+# Module-level so they can be shipped to a process pool
+def hash_password(password: str) -> str:
+    return pwd_context().hash(password)
+
+
+def check_password(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context().verify(plain_password, hashed_password)
+
+
+def load_backend():
+    pwd_context().handler("bcrypt").get_backend()
+
+
+class PoolSaturated(Exception):
+    pass
+
+
+class PasswordPool:
+    def __init__(self, workers: int = 2, max_queue: int = 64, kind: str = "thread"):
+        """``workers=0`` runs jobs inline on the event loop (the old behaviour)."""
+        self.workers = workers
+        self.max_queue = max_queue
+        self.kind = kind
+        self._executor: Optional[Executor] = None
+        self.outstanding = 0
+        self.peak_outstanding = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password")
+        return self._executor
+
+    async def _run(self, fn: Callable[..., Any], *args):
+        if self.workers <= 0:
+            self.completed += 1
+            return fn(*args)
+        if self.outstanding >= self.max_queue:
+            self.rejected += 1
+            raise PoolSaturated("Too many password operations in progress")
+        self.outstanding += 1
+        self.peak_outstanding = max(self.peak_outstanding, self.outstanding)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            self.outstanding -= 1
+            self.completed += 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(check_password, plain_password, hashed_password)
+
+    def warm(self):
+        """Load the bcrypt backend here and in each process worker ahead of the first login."""
+        load_backend()
+        if self.kind == "process" and self.workers > 0:
+            executor = self._get_executor()
+            for future in [executor.submit(load_backend) for _ in range(self.workers)]:
+                future.result()
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "kind": self.kind,
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "outstanding": self.outstanding,
+            # Jobs waiting for a free worker, as opposed to running
+            "queued": max(0, self.outstanding - self.workers),
+            "peak_outstanding": self.peak_outstanding,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
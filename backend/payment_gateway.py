@@ -0,0 +1,108 @@
+"""Long-lived Stripe checkout client shared by every request.
+
+One ``StripeCheckout`` is built on first use and kept, instead of one per
+request, so the underlying HTTP client and its connections are reused. Its
+webhook URL comes from configuration; without one, the first checkout's
+URL is adopted once and kept, never one per request.
+Status lookups go through a short-lived cache that also coalesces
+concurrent polls for the same session into one upstream call.
+
+The Stripe SDK is only imported when the first client or request is
+built (or by ``warm``), so importing the app stays fast.
+
+Set ``STRIPE_API_BASE`` to point the Stripe SDK at a local fake server such
+as ``stripe-mock`` for tests and benchmarks.
+"""
+import asyncio
+from typing import Any, Dict, Optional
+
+from catalog_cache import CatalogCache
+from instrumentation import outbound
+
+
+class PaymentGateway:
+    def __init__(
+        self,
+        api_key: str,
+        webhook_url: str = "",
+        api_base: Optional[str] = None,
+        status_ttl: float = 2.0,
+        client_factory=None,
+    ):
+        self.api_key = api_key
+        self.webhook_url = webhook_url
+        self.api_base = api_base
+        self._client_factory = client_factory
+        self._checkout: Any = None
+        self.status_cache = CatalogCache(maxsize=10000, ttl=status_ttl)
+        self.upstream_status_calls = 0
+
+    def _factory(self):
+        if self._client_factory is None:
+            from emergentintegrations.payments.stripe.checkout import StripeCheckout
+
+            if self.api_base:
+                import stripe
+
+                stripe.api_base = self.api_base
+            self._client_factory = StripeCheckout
+        return self._client_factory
+
+    def _client(self):
+        if self._checkout is None:
+            self._checkout = self._factory()(api_key=self.api_key, webhook_url=self.webhook_url)
+        return self._checkout
+
+    def default_webhook_url(self, webhook_url: str):
+        """Use ``webhook_url`` unless one is set already; only the first call counts."""
+        if not self.webhook_url:
+            self.webhook_url = webhook_url
+            self._checkout = None
+
+    def checkout_request(self, **fields):
+        from emergentintegrations.payments.stripe.checkout import CheckoutSessionRequest
+
+        return CheckoutSessionRequest(**fields)
+
+    def warm(self):
+        """Import the SDK now instead of on the first checkout."""
+        self._factory()
+
+    async def create_checkout_session(self, checkout_request):
+        async with outbound("stripe", "create_checkout_session"):
+            return await self._client().create_checkout_session(checkout_request)
+
+    async def get_checkout_status(self, session_id: str):
+        async def load():
+            self.upstream_status_calls += 1
+            async with outbound("stripe", "get_checkout_status"):
+                return await self._client().get_checkout_status(session_id)
+
+        return await self.status_cache.get_or_load(("status", session_id), load)
+
+    async def expire_session(self, session_id: str) -> bool:
+        """Close an unpaid session so it can no longer be paid.
+
+        Returns False if the session was paid first. Stripe only expires open
+        sessions; for any other the current status decides, read past the
+        status cache.
+        """
+        import stripe
+
+        # Building the client also points the SDK at STRIPE_API_BASE
+        self._client()
+        try:
+            async with outbound("stripe", "expire_checkout_session"):
+                await asyncio.to_thread(stripe.checkout.Session.expire, session_id, api_key=self.api_key)
+            return True
+        except stripe.error.InvalidRequestError:
+            async with outbound("stripe", "get_checkout_status"):
+                status = await self._client().get_checkout_status(session_id)
+            return status.payment_status != "paid"
+
+    async def handle_webhook(self, body: bytes, signature: Optional[str]):
+        async with outbound("stripe", "handle_webhook"):
+            return await self._client().handle_webhook(body, signature)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"upstream_status_calls": self.upstream_status_calls, "status_cache": self.status_cache.stats()}
@@ -0,0 +1,135 @@
+"""Cart pricing and validation for checkout.
+
+Every product referenced by a cart is loaded with a single ``$in`` query,
+duplicate product/size/color lines are merged, and stock and totals are
+checked in one pass. Problems are collected per line instead of failing on
+the first one, so the client can show everything that is wrong at once.
+"""
+import hashlib
+import json
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Tuple
+
+# Only the fields needed to price and validate a line.
+PRICING_PROJECTION = {"_id": 0, "id": 1, "name": 1, "price": 1, "category": 1, "stock": 1}
+
+
+@dataclass
+class PricedCart:
+    items: List[Dict[str, Any]] = field(default_factory=list)
+    total_amount: float = 0.0
+    errors: List[Dict[str, Any]] = field(default_factory=list)
+    lines: List[Dict[str, Any]] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+    def quantities_by_product(self) -> Dict[str, int]:
+        quantities: Dict[str, int] = {}
+        for item in self.items:
+            quantities[item["product_id"]] = quantities.get(item["product_id"], 0) + item["quantity"]
+        return quantities
+
+    def quote_id(self, *scope: str) -> str:
+        """Stable id for these priced lines; a cart that changes in any line,
+        quantity or price, or a different ``scope``, gets a different id."""
+        lines = sorted(
+            [item["product_id"], item["size"], item["color"], item["quantity"], item["price"]]
+            for item in self.items
+        )
+        return hashlib.sha256(json.dumps([list(scope), lines]).encode()).hexdigest()
+
+    def stock_errors(self, product_ids: Iterable[str]) -> List[Dict[str, Any]]:
+        """Per-line errors for products whose stock could not be reserved."""
+        short = set(product_ids)
+        return [
+            _line_error(line, "insufficient_stock", f"Insufficient stock for {line.get('name', line['product_id'])}")
+            for line in self.lines
+            if line["product_id"] in short
+        ]
+
+
+def merge_cart_lines(cart_items: Iterable[Any]) -> List[Dict[str, Any]]:
+    """Collapse repeated product/size/color lines, keeping first-seen order."""
+    merged: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+    for position, cart_item in enumerate(cart_items):
+        key = (cart_item.product_id, cart_item.size, cart_item.color)
+        line = merged.get(key)
+        if line is None:
+            merged[key] = {
+                "line": position,
+                "product_id": cart_item.product_id,
+                "size": cart_item.size,
+                "color": cart_item.color,
+                "quantity": cart_item.quantity,
+            }
+        else:
+            line["quantity"] += cart_item.quantity
+    return list(merged.values())
+
+
+def _line_error(line: Dict[str, Any], code: str, message: str, **extra) -> Dict[str, Any]:
+    error = {
+        "line": line["line"],
+        "product_id": line["product_id"],
+        "size": line["size"],
+        "color": line["color"],
+        "code": code,
+        "message": message,
+    }
+    error.update(extra)
+    return error
+
+
+async def price_cart(db, cart_items: Iterable[Any], check_stock: bool = True) -> PricedCart:
+    """Price ``cart_items``.
+
+    With ``check_stock=False`` availability is left to the caller, e.g. when
+    a stock reservation is the authoritative check.
+    """
+    lines = merge_cart_lines(cart_items)
+    result = PricedCart(lines=lines)
+    if not lines:
+        return result
+
+    product_ids = list({line["product_id"] for line in lines})
+    products = {
+        product["id"]: product
+        async for product in db.products.find({"id": {"$in": product_ids}}, PRICING_PROJECTION)
+    }
+
+    # Stock is tracked per product, so lines that differ only by size/color
+    # draw from the same pool.
+    demand: Dict[str, int] = {}
+    for line in lines:
+        demand[line["product_id"]] = demand.get(line["product_id"], 0) + line["quantity"]
+
+    for line in lines:
+        product = products.get(line["product_id"])
+        if product is None:
+            result.errors.append(_line_error(line, "not_found", f"Product {line['product_id']} not found"))
+            continue
+        if line["quantity"] <= 0:
+            result.errors.append(_line_error(line, "invalid_quantity", f"Invalid quantity for {product['name']}"))
+            continue
+        line["name"] = product["name"]
+        if check_stock and product["stock"] < demand[line["product_id"]]:
+            result.errors.append(_line_error(
+                line, "insufficient_stock", f"Insufficient stock for {product['name']}",
+                available=product["stock"],
+            ))
+            continue
+
+        result.total_amount += product["price"] * line["quantity"]
+        result.items.append({
+            "product_id": line["product_id"],
+            "name": product["name"],
+            "price": product["price"],
+            "category": product.get("category"),
+            "quantity": line["quantity"],
+            "size": line["size"],
+            "color": line["color"],
+        })
+
+    return result
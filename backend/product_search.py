@@ -0,0 +1,113 @@
+"""Catalog search: text match, filters, facet counts and ranking in one query.
+
+Text matching uses the ``products_text`` index over ``name`` and
+``description`` (name weighted higher), so relevance is Mongo's
+``textScore``. Filters go into the leading ``$match`` next to ``$text`` so
+the planner can use an index; a single ``$facet`` stage then produces the
+page of results, the total and the category/size/color/price counts for
+everything that matched.
+
+Facet counts narrow with the filters: picking ``size=M`` shows how many of
+the medium products come in each color.
+"""
+from typing import Any, Dict, List, Optional
+
+# Upper bounds of the price facet buckets; anything above the last one
+# lands in the open-ended bucket.
+PRICE_BOUNDARIES = [0, 50, 100, 150, 200, 300]
+PRICE_OVERFLOW = "300+"
+FACET_LIMIT = 20
+
+SORTS = {
+    "relevance": None,
+    "newest": {"created_at": -1, "id": -1},
+    "price_asc": {"price": 1, "id": 1},
+    "price_desc": {"price": -1, "id": -1},
+}
+
+_RESULT_PROJECTION = {"_id": 0, "holds": 0}
+
+
+def search_filter(
+    q: Optional[str] = None,
+    category: Optional[str] = None,
+    size: Optional[str] = None,
+    color: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    in_stock: bool = False,
+) -> Dict[str, Any]:
+    query: Dict[str, Any] = {}
+    if q:
+        query["$text"] = {"$search": q}
+    if category:
+        query["category"] = category
+    if size:
+        query["size"] = size
+    if color:
+        query["color"] = color
+    if min_price is not None or max_price is not None:
+        query["price"] = {}
+        if min_price is not None:
+            query["price"]["$gte"] = min_price
+        if max_price is not None:
+            query["price"]["$lte"] = max_price
+    if in_stock:
+        query["stock"] = {"$gt": 0}
+    return query
+
+
+def _value_counts(field: str) -> List[Dict[str, Any]]:
+    return [
+        {"$group": {"_id": f"${field}", "count": {"$sum": 1}}},
+        {"$sort": {"count": -1, "_id": 1}},
+        {"$limit": FACET_LIMIT},
+    ]
+
+
+def search_pipeline(
+    query: Dict[str, Any], sort: str, offset: int, limit: int, projection: Optional[Dict[str, Any]] = None
+) -> List[Dict[str, Any]]:
+    ranked = "$text" in query
+    order = SORTS[sort]
+    if order is None:
+        order = {"score": {"$meta": "textScore"}, "created_at": -1, "id": -1} if ranked else SORTS["newest"]
+    return [
+        {"$match": query},
+        {"$facet": {
+            "items": [{"$sort": order}, {"$skip": offset}, {"$limit": limit}, {"$project": projection or _RESULT_PROJECTION}],
+            "total": [{"$count": "count"}],
+            "category": _value_counts("category"),
+            "size": _value_counts("size"),
+            "color": _value_counts("color"),
+            "price": [{"$bucket": {
+                "groupBy": "$price",
+                "boundaries": PRICE_BOUNDARIES,
+                "default": PRICE_OVERFLOW,
+                "output": {"count": {"$sum": 1}},
+            }}],
+        }},
+    ]
+
+
+def _price_bucket(bucket: Dict[str, Any]) -> Dict[str, Any]:
+    if bucket["_id"] == PRICE_OVERFLOW:
+        return {"min": PRICE_BOUNDARIES[-1], "max": None, "count": bucket["count"]}
+    upper = PRICE_BOUNDARIES[PRICE_BOUNDARIES.index(bucket["_id"]) + 1]
+    return {"min": bucket["_id"], "max": upper, "count": bucket["count"]}
+
+
+async def search_products(
+    db, query: Dict[str, Any], sort: str = "relevance", offset: int = 0, limit: int = 24,
+    projection: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """Run the search and return ``items``, ``total`` and ``facets``."""
+    cursor = db.products.aggregate(search_pipeline(query, sort, offset, limit, projection), allowDiskUse=True)
+    result = (await cursor.to_list(length=1))[0]
+    total = result["total"][0]["count"] if result["total"] else 0
+    facets = {
+        field: [{"value": row["_id"], "count": row["count"]} for row in result[field]]
+        for field in ("category", "size", "color")
+    }
+    facets["price"] = [_price_bucket(bucket) for bucket in result["price"]]
+    return {"items": result["items"], "total": total, "facets": facets}
@@ -0,0 +1,215 @@
+"""Stock reservations held between checkout start and payment.
+
+Stock is taken out of ``products`` when a checkout session is created, using
+one ``bulk_write`` of conditional decrements (``stock >= qty``) so two
+shoppers can never both get the last unit. Each decrement also pushes a
+``holds`` entry tagged with the reservation id; that tag is what makes
+rolling back a partial reservation, releasing an expired one and committing
+a paid one idempotent single round trips.
+
+A reservation document in ``stock_reservations`` moves from ``pending`` to
+either ``committed`` (payment confirmed) or ``released`` (expired, cancelled
+or failed). Both transitions are claimed with a conditional
+``find_one_and_update`` so a payment and the expiry sweeper cannot both win.
+A release is flagged ``restoring`` until its stock is back, and the sweeper
+finishes releases that a crash cut short.
+
+Stripe keeps a checkout session payable for 24 hours, far longer than the
+hold. Before the sweeper releases an expired hold it expires the session, so
+the stock cannot be sold again and then paid for by the original shopper.
+"""
+import logging
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from pymongo import ReturnDocument, UpdateOne
+
+logger = logging.getLogger(__name__)
+
+
+class StockUnavailable(Exception):
+    def __init__(self, product_ids: List[str]):
+        super().__init__(f"Insufficient stock for {', '.join(product_ids)}")
+        self.product_ids = product_ids
+
+
+async def _restore_holds(db, reservation_id: str, quantities: Dict[str, int]):
+    # Only products that still carry this reservation's hold are restored,
+    # so running this twice (or after a partial reservation) is harmless.
+    ops = [
+        UpdateOne(
+            {"id": product_id, "holds.rid": reservation_id},
+            {"$inc": {"stock": quantity}, "$pull": {"holds": {"rid": reservation_id}}},
+        )
+        for product_id, quantity in quantities.items()
+    ]
+    if ops:
+        await db.products.bulk_write(ops, ordered=False)
+
+
+def _quantities(reservation: dict) -> Dict[str, int]:
+    return {item["product_id"]: item["quantity"] for item in reservation["items"]}
+
+
+async def reserve_stock(db, quantities: Dict[str, int], ttl: timedelta) -> str:
+    """Hold ``quantities`` (product id -> units) and return the reservation id.
+
+    Raises ``StockUnavailable`` listing the products that could not be held;
+    in that case nothing stays reserved. Raises ``ValueError`` when there is
+    nothing to hold.
+    """
+    if not quantities:
+        raise ValueError("Nothing to reserve")
+    reservation_id = str(uuid.uuid4())
+    now = datetime.now(timezone.utc)
+    # The record goes in first: if the process dies mid-reservation the
+    # sweeper still finds it and gives the stock back.
+    await db.stock_reservations.insert_one({
+        "id": reservation_id,
+        "session_id": None,
+        "items": [{"product_id": pid, "quantity": qty} for pid, qty in quantities.items()],
+        "status": "pending",
+        "created_at": now,
+        "expires_at": now + ttl,
+    })
+
+    ops = [
+        UpdateOne(
+            {"id": product_id, "stock": {"$gte": quantity}},
+            {"$inc": {"stock": -quantity}, "$push": {"holds": {"rid": reservation_id, "qty": quantity}}},
+        )
+        for product_id, quantity in quantities.items()
+    ]
+    result = await db.products.bulk_write(ops, ordered=False)
+    if result.modified_count == len(ops):
+        return reservation_id
+
+    held = {
+        product["id"]
+        async for product in db.products.find({"holds.rid": reservation_id}, {"_id": 0, "id": 1})
+    }
+    await release_reservation(db, reservation_id)
+    raise StockUnavailable([pid for pid in quantities if pid not in held])
+
+
+async def attach_session(db, reservation_id: str, session_id: str):
+    await db.stock_reservations.update_one({"id": reservation_id}, {"$set": {"session_id": session_id}})
+
+
+async def release_reservation(db, reservation_id: str) -> bool:
+    """Give held stock back. Returns False if it was already committed or released."""
+    reservation = await db.stock_reservations.find_one_and_update(
+        {"id": reservation_id, "status": "pending"},
+        {"$set": {"status": "released", "released_at": datetime.now(timezone.utc), "restoring": True}},
+        return_document=ReturnDocument.AFTER,
+    )
+    if reservation is None:
+        return False
+    await _finish_release(db, reservation)
+    return True
+
+
+async def _finish_release(db, reservation: dict):
+    await _restore_holds(db, reservation["id"], _quantities(reservation))
+    await db.stock_reservations.update_one({"id": reservation["id"]}, {"$unset": {"restoring": ""}})
+
+
+async def commit_reservation(db, reservation_id: str) -> bool:
+    """Make a reservation permanent once payment is confirmed.
+
+    Returns False if the stock is no longer held (for instance the
+    reservation expired before the shopper paid); the caller decides how to
+    recover. Committing twice is a no-op that returns True.
+    """
+    reservation = await db.stock_reservations.find_one_and_update(
+        {"id": reservation_id, "status": "pending"},
+        {"$set": {"status": "committed", "committed_at": datetime.now(timezone.utc)}},
+    )
+    if reservation is None:
+        existing = await db.stock_reservations.find_one({"id": reservation_id}, {"_id": 0, "status": 1})
+        if existing is None or existing["status"] != "committed":
+            return False
+    # Also on a repeat, in case the first commit stopped before dropping the holds
+    await db.products.update_many(
+        {"holds.rid": reservation_id},
+        {"$pull": {"holds": {"rid": reservation_id}}},
+    )
+    return True
+
+
+async def take_stock(db, quantities: Dict[str, int], tag: str) -> List[str]:
+    """Conditionally decrement stock without holding it.
+
+    Used when a payment lands after its reservation was released. Returns
+    the product ids that no longer had enough stock. Each decremented
+    product keeps a ``tag`` entry in ``holds``, so calling this again with
+    the same tag takes nothing twice; ``forget_taken_stock`` drops the tag
+    once the caller has recorded that the stock was taken.
+    """
+    if not quantities:
+        return []
+    await db.products.bulk_write([
+        UpdateOne(
+            {"id": product_id, "stock": {"$gte": quantity}, "holds.rid": {"$ne": tag}},
+            {"$inc": {"stock": -quantity}, "$push": {"holds": {"rid": tag, "qty": quantity}}},
+        )
+        for product_id, quantity in quantities.items()
+    ], ordered=False)
+    taken = {
+        product["id"]
+        async for product in db.products.find({"holds.rid": tag}, {"_id": 0, "id": 1})
+    }
+    return [pid for pid in quantities if pid not in taken]
+
+
+async def forget_taken_stock(db, tag: str):
+    await db.products.update_many({"holds.rid": tag}, {"$pull": {"holds": {"rid": tag}}})
+
+
+async def release_expired_reservations(
+    db,
+    now: Optional[datetime] = None,
+    batch_size: int = 500,
+    expire_session: Optional[Callable[[str], Awaitable[bool]]] = None,
+    recheck_after: timedelta = timedelta(hours=1),
+) -> int:
+    """Release holds that ran out; returns how many were released.
+
+    ``expire_session(session_id)`` closes the reservation's checkout session
+    and returns False if it was paid meanwhile. Such a hold is kept for the
+    payment to commit and looked at again ``recheck_after`` later.
+    """
+    now = now or datetime.now(timezone.utc)
+    # Releases a crash interrupted; restoring twice is harmless
+    interrupted = await db.stock_reservations.find(
+        {"status": "released", "restoring": True},
+        {"_id": 0, "id": 1, "items": 1},
+    ).limit(batch_size).to_list(length=batch_size)
+    for reservation in interrupted:
+        await _finish_release(db, reservation)
+
+    expired = await db.stock_reservations.find(
+        {"status": "pending", "expires_at": {"$lte": now}},
+        {"_id": 0, "id": 1, "session_id": 1},
+    ).limit(batch_size).to_list(length=batch_size)
+    released = 0
+    for reservation in expired:
+        session_id = reservation.get("session_id")
+        if session_id and expire_session is not None:
+            try:
+                closed = await expire_session(session_id)
+            except Exception as e:
+                logger.warning(f"Could not expire checkout session {session_id}: {str(e)}")
+                continue
+            if not closed:
+                await db.stock_reservations.update_one(
+                    {"id": reservation["id"], "status": "pending"},
+                    {"$set": {"expires_at": now + recheck_after}},
+                )
+                continue
+        if await release_reservation(db, reservation["id"]):
+            released += 1
+    if released:
+        logger.info(f"Released {released} expired stock reservations")
+    return released
@@ -0,0 +1,34 @@
+"""Production entry point: ``python run.py``.
+
+Starts uvicorn with ``WEB_WORKERS`` processes (default: one per core) and
+passes the worker count on to them so each sizes its Mongo pool to its
+share of ``MONGO_CONNECTION_BUDGET`` (see ``deployment.py``). On SIGTERM
+uvicorn stops accepting connections and waits up to
+``GRACEFUL_SHUTDOWN_SECONDS`` for in-flight requests before the app's
+shutdown hooks run.
+"""
+import os
+
+import uvicorn
+
+from deployment import worker_count
+
+
+def main():
+    workers = worker_count()
+    os.environ['WEB_WORKERS'] = str(workers)
+    uvicorn.run(
+        "server:app",
+        host=os.environ.get('HOST', '0.0.0.0'),
+        port=int(os.environ.get('PORT', '8001')),
+        workers=workers,
+        proxy_headers=True,
+        forwarded_allow_ips=os.environ.get('FORWARDED_ALLOW_IPS', '127.0.0.1'),
+        timeout_keep_alive=int(os.environ.get('KEEP_ALIVE_SECONDS', '5')),
+        timeout_graceful_shutdown=int(os.environ.get('GRACEFUL_SHUTDOWN_SECONDS', '30')),
+        log_level=os.environ.get('LOG_LEVEL', 'info'),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,57 +1,202 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request, status, BackgroundTasks
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request, Query, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import ORJSONResponse, PlainTextResponse, Response, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, PyMongoError
+from contextlib import asynccontextmanager
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, EmailStr
-from typing import List, Optional, Dict, Any
+from typing import List, Literal, Optional, Dict, Any
 import uuid
 from datetime import datetime, timedelta, timezone
-from passlib.context import CryptContext
-from jose import JWTError, jwt
-from emergentintegrations.payments.stripe.checkout import StripeCheckout, CheckoutSessionResponse, CheckoutStatusResponse, CheckoutSessionRequest
-from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import Mail
 import json
+import hmac
+import asyncio
+import importlib
+import orjson
+
+from cart_ops import add_item, apply_batch, remove_line, remove_product, set_quantity
+from admission import AdmissionControl, AdmissionMiddleware, MemoryBuckets, MongoBuckets, RouteClass
+from bulk_io import MEDIA_TYPES, encode_rows
+from catalog_cache import CatalogCache
+from cache_sync import PRODUCTS, USERS, CacheInvalidator
+from catalog_io import export_products, import_products
+from compaction import Compactor
+from deployment import mongo_client_options
+from email_outbox import LogTransport, OutboxWorker, SendGridTransport, enqueue_email
+from email_templates import EmailTemplates
+from indexes import ensure_indexes
+from instrumentation import REGISTRY, MongoCommandListener, RequestMetricsMiddleware, SlowRequestProfiler, wait_for_idle
+from finalization import OrderFinalizer
+from order_export import DAILY_COLUMNS, EXPORT_COLUMNS, daily_totals, order_filter, order_lines
+from order_stats import dashboard_stats, ensure_order_stats
+from pagination import KEYSET_SORT, InvalidCursor, next_cursor, with_keyset
+from password_pool import PasswordPool, PoolSaturated
+from payment_gateway import PaymentGateway
+from pricing import PricedCart, price_cart
+from product_search import search_filter, search_products
+from reservations import (
+    StockUnavailable, reserve_stock, attach_session, release_reservation,
+    release_expired_reservations
+)
+from warmup import Warmup
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
+# MongoDB connection, opened by the lifespan handler rather than at import time.
+# Every command is timed and charged to the request that issued it; pool
+# limits come from deployment.py so several workers share one connection budget
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+client = None
+db = None
+
+def connect_mongo():
+    global client, db
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    client = AsyncIOMotorClient(mongo_url, event_listeners=[MongoCommandListener()], **mongo_client_options())
+    db = client[os.environ['DB_NAME']]
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # startup() and shutdown() are at the bottom of this module, next to the hooks they run
+    await startup()
+    try:
+        yield
+    finally:
+        await shutdown()
 
 # Create the main app
-app = FastAPI(title="Urban Threads E-commerce API")
+app = FastAPI(title="Urban Threads E-commerce API", default_response_class=ORJSONResponse, lifespan=lifespan)
 api_router = APIRouter(prefix="/api")
 
 # Security
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
 SECRET_KEY = os.environ.get("SECRET_KEY", "your-secret-key-here")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# bcrypt runs on its own workers so logins never block the event loop
+password_pool = PasswordPool(
+    workers=int(os.environ.get('PASSWORD_POOL_WORKERS', '2')),
+    max_queue=int(os.environ.get('PASSWORD_POOL_MAX_QUEUE', '64')),
+    kind=os.environ.get('PASSWORD_POOL_KIND', 'thread'),
+)
+PASSWORD_POOL_RETRY_AFTER = "1"
+
+# Authenticated principals, keyed by user id, so most requests skip the users collection
+principal_cache = CatalogCache(
+    maxsize=int(os.environ.get('PRINCIPAL_CACHE_SIZE', '10000')),
+    ttl=float(os.environ.get('PRINCIPAL_CACHE_TTL_SECONDS', '60')),
+)
+
 # Stripe Setup
 stripe_api_key = os.environ.get('STRIPE_API_KEY')
+stripe_api_base = os.environ.get('STRIPE_API_BASE')
+# Where Stripe reaches this API from outside, e.g. https://loja.example.com
+public_base_url = os.environ.get('PUBLIC_BASE_URL', '')
+STRIPE_STATUS_CACHE_SECONDS = float(os.environ.get('STRIPE_STATUS_CACHE_SECONDS', '2'))
 
 # SendGrid Setup
 sendgrid_api_key = os.environ.get('SENDGRID_API_KEY')
 sender_email = os.environ.get('SENDER_EMAIL', 'noreply@urbanthreads.com')
+email_templates = EmailTemplates()
+
+# Stock reservations
+RESERVATION_TTL = timedelta(minutes=int(os.environ.get('RESERVATION_TTL_MINUTES', '30')))
+RESERVATION_SWEEP_SECONDS = int(os.environ.get('RESERVATION_SWEEP_SECONDS', '60'))
+
+# Checking out the same priced cart again reuses its open Stripe session for
+# this long (never past its stock reservation); concurrent clicks share one load
+CHECKOUT_QUOTE_TTL = timedelta(minutes=int(os.environ.get('CHECKOUT_QUOTE_TTL_MINUTES', '20')))
+checkout_quotes = CatalogCache(maxsize=4096, ttl=2)
+
+# Abandoned checkout cleanup: how often it runs, when an unpaid session counts
+# as abandoned, and how long expired transactions are kept before the TTL purge
+COMPACTION_INTERVAL = timedelta(minutes=int(os.environ.get('COMPACTION_INTERVAL_MINUTES', '60')))
+PENDING_TRANSACTION_TTL = timedelta(hours=int(os.environ.get('PENDING_TRANSACTION_TTL_HOURS', '25')))
+TRANSACTION_RETENTION = timedelta(days=int(os.environ.get('TRANSACTION_RETENTION_DAYS', '7')))
+
+# Deepest result a search page may reach; past this shoppers should refine the query
+SEARCH_MAX_OFFSET = int(os.environ.get('SEARCH_MAX_OFFSET', '1000'))
+
+# Catalog cache
+catalog_cache = CatalogCache(
+    maxsize=int(os.environ.get('CATALOG_CACHE_SIZE', '1024')),
+    ttl=float(os.environ.get('CATALOG_CACHE_TTL_SECONDS', '30')),
+)
+
+# Rate limits and concurrency caps per route class; shared classes use Mongo
+# buckets when RATE_LIMIT_BACKEND=mongo so the limit holds across workers.
+# Clients are told apart by address, which behind an ingress is only known
+# once FORWARDED_ALLOW_IPS names its proxies; until then the limits are off
+# by default, as every shopper would otherwise share the proxy's bucket
+FORWARDED_ALLOW_IPS = os.environ.get('FORWARDED_ALLOW_IPS', '')
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'true' if FORWARDED_ALLOW_IPS else 'false').lower() == 'true'
+RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'memory')
+LOGIN_LIMIT = RouteClass("login", rate=0.5, burst=10, shared=True)
+CHECKOUT_LIMIT = RouteClass("checkout", rate=1, burst=5, by_user=True, max_concurrency=32, shared=True)
+CHECKOUT_STATUS_LIMIT = RouteClass("checkout_status", rate=2, burst=10, max_concurrency=64)
+SEARCH_LIMIT = RouteClass("search", rate=10, burst=30, max_concurrency=32)
+ADMIN_REPORT_LIMIT = RouteClass("admin_reports", rate=1, burst=5, by_user=True, max_concurrency=4, shared=True)
+DEFAULT_LIMIT = RouteClass("default", rate=50, burst=100)
+ROUTE_LIMITS = {
+    ("POST", "/api/auth/login"): LOGIN_LIMIT,
+    ("POST", "/api/auth/register"): LOGIN_LIMIT,
+    ("POST", "/api/payments/checkout/session"): CHECKOUT_LIMIT,
+    ("GET", "/api/products/search"): SEARCH_LIMIT,
+    ("GET", "/api/admin/dashboard"): ADMIN_REPORT_LIMIT,
+    ("GET", "/api/admin/orders/export"): ADMIN_REPORT_LIMIT,
+    ("GET", "/api/admin/products/export"): ADMIN_REPORT_LIMIT,
+    ("POST", "/api/admin/products/import"): ADMIN_REPORT_LIMIT,
+}
+
+# Invalidation across workers: auto, change_stream, poll or off
+CACHE_INVALIDATION = os.environ.get('CACHE_INVALIDATION', 'auto')
+CACHE_EVENT_POLL_SECONDS = float(os.environ.get('CACHE_EVENT_POLL_SECONDS', '1'))
+CACHE_WARM_CATEGORIES = int(os.environ.get('CACHE_WARM_CATEGORIES', '20'))
+DRAIN_SECONDS = float(os.environ.get('DRAIN_SECONDS', '10'))
+
+# Admin dashboard is recomputed at most this often
+dashboard_cache = CatalogCache(maxsize=16, ttl=float(os.environ.get('DASHBOARD_CACHE_TTL_SECONDS', '10')))
+
+# Instrumentation; set SLOW_REQUEST_PROFILE_MS to keep stack samples of slower requests.
+# /api/metrics takes METRICS_TOKEN as a bearer token, or an admin login if it is unset
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+SLOW_REQUEST_PROFILE_MS = float(os.environ.get('SLOW_REQUEST_PROFILE_MS', '0'))
+slow_request_profiler = SlowRequestProfiler(SLOW_REQUEST_PROFILE_MS / 1000) if SLOW_REQUEST_PROFILE_MS > 0 else None
+# Server-Timing tells clients how long requests spent in Mongo; only sent while debugging
+SERVER_TIMING = os.environ.get('SERVER_TIMING', 'false').lower() == 'true' or slow_request_profiler is not None
 
 # Models
+def model_projection(model) -> Dict[str, int]:
+    # Exactly the fields the response model declares, so raw documents can be returned as-is
+    return {"_id": 0, **{name: 1 for name in model.model_fields}}
+
 class User(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     email: EmailStr
     name: str
     password_hash: str
     is_admin: bool = False
+    token_version: int = 0
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+class Principal(BaseModel):
+    # What request handlers need to know about the caller, without the password hash
+    id: str
+    email: str
+    name: str
+    is_admin: bool = False
+    token_version: int = 0
+
 class UserCreate(BaseModel):
     email: EmailStr
     name: str
@@ -83,18 +228,39 @@ class ProductCreate(BaseModel):
     stock: int
     image_url: str
 
+class ProductSearchResult(BaseModel):
+    items: List[Product]
+    total: int
+    page: int
+    limit: int
+    facets: Dict[str, List[Dict[str, Any]]]
+
+PRODUCT_PROJECTION = model_projection(Product)
+
 class CartItem(BaseModel):
     product_id: str
     quantity: int
     size: str
     color: str
 
+class CartOperation(BaseModel):
+    op: Literal["add", "set", "remove"]
+    product_id: str
+    size: str
+    color: str
+    quantity: int = 0
+
+class CartBatch(BaseModel):
+    operations: List[CartOperation] = Field(..., max_length=100)
+
 class Cart(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     user_id: str
     items: List[CartItem]
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+CART_PROJECTION = model_projection(Cart)
+
 class Order(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     user_id: str
@@ -107,6 +273,8 @@ class Order(BaseModel):
     session_id: Optional[str] = None
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+ORDER_PROJECTION = model_projection(Order)
+
 class PaymentTransaction(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     session_id: str
@@ -116,6 +284,12 @@ class PaymentTransaction(BaseModel):
     currency: str = "brl"
     status: str = "pending"
     payment_status: str = "pending"
+    reservation_id: Optional[str] = None
+    user_name: Optional[str] = None
+    items: List[Dict[str, Any]] = []
+    quote_id: Optional[str] = None
+    quote_expires_at: Optional[datetime] = None
+    url: Optional[str] = None
     metadata: Dict[str, str] = {}
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
@@ -130,11 +304,71 @@ class Token(BaseModel):
     token_type: str
 
 # Utility functions
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+def password_pool_busy():
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail="Too many authentication requests, try again shortly",
+        headers={"Retry-After": PASSWORD_POOL_RETRY_AFTER},
+    )
+
+async def verify_password(plain_password, hashed_password):
+    try:
+        return await password_pool.verify(plain_password, hashed_password)
+    except PoolSaturated:
+        raise password_pool_busy()
+
+async def get_password_hash(password):
+    try:
+        return await password_pool.hash(password)
+    except PoolSaturated:
+        raise password_pool_busy()
+
+def render_json(content: Any) -> bytes:
+    # Documents coming straight from a projection are encoded as-is; anything
+    # orjson does not know natively (models, ObjectIds) goes through FastAPI's encoder
+    return orjson.dumps(content, default=jsonable_encoder)
+
+def drop_product_cache(product_id: Optional[str] = None):
+    # Without an id any product may have changed
+    if product_id:
+        catalog_cache.invalidate(("product", product_id))
+    else:
+        catalog_cache.invalidate_namespace("product")
+    catalog_cache.invalidate_namespace("products")
+    catalog_cache.invalidate_namespace("search")
+
+def drop_user_cache(user_id: Optional[str] = None):
+    if user_id:
+        principal_cache.invalidate(("principal", user_id))
+    else:
+        principal_cache.invalidate_namespace("principal")
+
+async def invalidate_product_cache(product_id: Optional[str] = None):
+    # This worker at once, the others through the invalidation channel
+    drop_product_cache(product_id)
+    await app.state.cache_invalidator.publish(PRODUCTS, product_id)
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+def classify_route(method: str, path: str) -> Optional[RouteClass]:
+    route_class = ROUTE_LIMITS.get((method, path))
+    if route_class is not None:
+        return route_class
+    if path.startswith("/api/payments/checkout/status/"):
+        return CHECKOUT_STATUS_LIMIT
+    # Stripe delivers webhooks from a few addresses and backs off for hours on a 429
+    if path.startswith("/api/") and path not in ("/api/metrics", "/api/ready", "/api/webhook/stripe"):
+        return DEFAULT_LIMIT
+    return None
+
+def token_user_id(authorization: Optional[bytes]) -> Optional[str]:
+    # Only a token with a valid signature names the bucket; anything else is keyed by IP
+    if not authorization or not authorization.startswith(b"Bearer "):
+        return None
+    from jose import JWTError, jwt
+
+    try:
+        return jwt.decode(authorization[7:].decode("ascii"), SECRET_KEY, algorithms=[ALGORITHM]).get("uid")
+    except (JWTError, UnicodeDecodeError):
+        return None
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -143,15 +377,42 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     else:
         expire = datetime.now(timezone.utc) + timedelta(minutes=15)
     to_encode.update({"exp": expire})
+    from jose import jwt
+
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+def token_claims(user: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "sub": user["email"],
+        "uid": user["id"],
+        "roles": ["admin"] if user.get("is_admin") else [],
+        "ver": user.get("token_version", 0),
+    }
+
+PRINCIPAL_PROJECTION = {"_id": 0, "id": 1, "email": 1, "name": 1, "is_admin": 1, "token_version": 1}
+
+async def load_principal(user_id: str) -> Optional[Principal]:
+    async def load():
+        user = await db.users.find_one({"id": user_id}, PRINCIPAL_PROJECTION)
+        return Principal(**user) if user else None
+    
+    return await principal_cache.get_or_load(("principal", user_id), load)
+
+async def revoke_tokens(user_id: str) -> bool:
+    result = await db.users.update_one({"id": user_id}, {"$inc": {"token_version": 1}})
+    drop_user_cache(user_id)
+    await app.state.cache_invalidator.publish(USERS, user_id)
+    return result.matched_count > 0
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> Principal:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    from jose import JWTError, jwt
+
     try:
         payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
         email: str = payload.get("sub")
@@ -160,12 +421,37 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     except JWTError:
         raise credentials_exception
     
-    user = await db.users.find_one({"email": email})
-    if user is None:
+    user_id = payload.get("uid")
+    if user_id is None:
+        # Tokens issued before the fast path only carry the email
+        user = await db.users.find_one({"email": email}, PRINCIPAL_PROJECTION)
+        if user is None or user.get("token_version", 0) != 0:
+            raise credentials_exception
+        return Principal(**user)
+    
+    principal = await load_principal(user_id)
+    token_version = payload.get("ver", 0)
+    if principal is not None and principal.token_version < token_version:
+        # Another worker issued a newer token; our cached copy is stale
+        principal_cache.invalidate(("principal", user_id))
+        principal = await load_principal(user_id)
+    if principal is None or principal.token_version != token_version:
         raise credentials_exception
-    return User(**user)
+    return principal
 
-async def get_current_admin_user(current_user: User = Depends(get_current_user)):
+async def get_optional_user(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)
+) -> Optional[Principal]:
+    # Guests may check out. A token left over from an old tab may have
+    # expired meanwhile; its holder checks out as a guest rather than failing
+    if credentials is None:
+        return None
+    try:
+        return await get_current_user(credentials)
+    except HTTPException:
+        return None
+
+async def get_current_admin_user(current_user: Principal = Depends(get_current_user)):
     if not current_user.is_admin:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -173,76 +459,28 @@ async def get_current_admin_user(current_user: User = Depends(get_current_user))
         )
     return current_user
 
-def send_email(to: str, subject: str, content: str):
-    try:
-        message = Mail(
-            from_email=sender_email,
-            to_emails=to,
-            subject=subject,
-            html_content=content
-        )
-        sg = SendGridAPIClient(sendgrid_api_key)
-        response = sg.send(message)
-        return response.status_code == 202
-    except Exception as e:
-        logging.error(f"Failed to send email: {str(e)}")
-        return False
-
-def send_order_confirmation_email(user_email: str, user_name: str, order_id: str, items: List[Dict], total: float):
-    items_html = ""
-    for item in items:
-        items_html += f"""
-        <tr>
-            <td style="padding: 10px; border-bottom: 1px solid #eee;">{item['name']}</td>
-            <td style="padding: 10px; border-bottom: 1px solid #eee;">{item['size']}</td>
-            <td style="padding: 10px; border-bottom: 1px solid #eee;">{item['color']}</td>
-            <td style="padding: 10px; border-bottom: 1px solid #eee;">{item['quantity']}</td>
-            <td style="padding: 10px; border-bottom: 1px solid #eee;">R$ {item['price']:.2f}</td>
-        </tr>
-        """
-    
-    html_content = f"""
-    <html>
-        <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
-            <div style="max-width: 600px; margin: 0 auto; padding: 20px;">
-                <h1 style="color: #2c3e50; text-align: center;">Urban Threads</h1>
-                <h2 style="color: #34495e;">Confirmação de Pedido</h2>
-                <p>Olá {user_name},</p>
-                <p>Seu pedido foi confirmado! Obrigado por comprar na Urban Threads.</p>
-                
-                <div style="background-color: #f8f9fa; padding: 15px; border-radius: 5px; margin: 20px 0;">
-                    <h3>Detalhes do Pedido #{order_id}</h3>
-                    <table style="width: 100%; border-collapse: collapse;">
-                        <thead>
-                            <tr style="background-color: #e9ecef;">
-                                <th style="padding: 10px; text-align: left;">Produto</th>
-                                <th style="padding: 10px; text-align: left;">Tamanho</th>
-                                <th style="padding: 10px; text-align: left;">Cor</th>
-                                <th style="padding: 10px; text-align: left;">Qtd</th>
-                                <th style="padding: 10px; text-align: left;">Preço</th>
-                            </tr>
-                        </thead>
-                        <tbody>
-                            {items_html}
-                        </tbody>
-                    </table>
-                    <div style="text-align: right; margin-top: 15px; font-size: 18px; font-weight: bold;">
-                        Total: R$ {total:.2f}
-                    </div>
-                </div>
-                
-                <p>Você receberá uma nova notificação quando seu pedido for enviado.</p>
-                <p>Obrigado por escolher a Urban Threads!</p>
-                
-                <div style="text-align: center; margin-top: 30px; padding-top: 20px; border-top: 1px solid #eee;">
-                    <p style="color: #666; font-size: 14px;">Urban Threads - Streetwear Urbano</p>
-                </div>
-            </div>
-        </body>
-    </html>
-    """
-    
-    return send_email(user_email, f"Confirmação de Pedido #{order_id}", html_content)
+def build_order(transaction: Dict[str, Any], order_id: str) -> Dict[str, Any]:
+    # Transactions created before line items were stored structured only
+    # carry them as a JSON string in metadata
+    items = transaction.get("items") or json.loads(transaction["metadata"]["items"])
+    return Order(
+        id=order_id,
+        # Transactions opened before user ids were recorded belong to nobody we know
+        user_id=transaction.get("user_id") or "guest",
+        user_email=transaction["metadata"]["user_email"],
+        user_name=transaction["metadata"]["user_name"],
+        items=items,
+        total_amount=transaction["amount"],
+        status="confirmed",
+        payment_status="paid",
+        session_id=transaction["session_id"]
+    ).dict()
+
+def build_email_transport():
+    if sendgrid_api_key:
+        return SendGridTransport(sendgrid_api_key, sender_email)
+    logger.warning("SENDGRID_API_KEY not set; emails will only be logged")
+    return LogTransport()
 
 # Routes
 @api_router.post("/auth/register", response_model=Token)
@@ -253,7 +491,7 @@ async def register(user_data: UserCreate):
         raise HTTPException(status_code=400, detail="Email already registered")
     
     # Create user
-    hashed_password = get_password_hash(user_data.password)
+    hashed_password = await get_password_hash(user_data.password)
     user = User(
         email=user_data.email,
         name=user_data.name,
@@ -261,19 +499,23 @@ async def register(user_data: UserCreate):
         is_admin=(user_data.email == "admin@urbanthreads.com")  # Make first admin
     )
     
-    await db.users.insert_one(user.dict())
+    try:
+        await db.users.insert_one(user.dict())
+    except DuplicateKeyError:
+        # Lost a race with a concurrent registration for the same email
+        raise HTTPException(status_code=400, detail="Email already registered")
     
     # Create token
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.email}, expires_delta=access_token_expires
+        data=token_claims(user.dict()), expires_delta=access_token_expires
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
 @api_router.post("/auth/login", response_model=Token)
 async def login(user_data: UserLogin):
     user = await db.users.find_one({"email": user_data.email})
-    if not user or not verify_password(user_data.password, user["password_hash"]):
+    if not user or not await verify_password(user_data.password, user["password_hash"]):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
@@ -282,131 +524,235 @@ async def login(user_data: UserLogin):
     
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user["email"]}, expires_delta=access_token_expires
+        data=token_claims(user), expires_delta=access_token_expires
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
 @api_router.get("/auth/me", response_model=User)
-async def get_me(current_user: User = Depends(get_current_user)):
-    return current_user
+async def get_me(current_user: Principal = Depends(get_current_user)):
+    user = await db.users.find_one({"id": current_user.id})
+    if user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return User(**user)
+
+@api_router.post("/auth/revoke")
+async def revoke_my_tokens(current_user: Principal = Depends(get_current_user)):
+    await revoke_tokens(current_user.id)
+    return {"message": "All sessions revoked"}
 
 # Products
 @api_router.get("/products", response_model=List[Product])
-async def get_products(category: Optional[str] = None, limit: int = 50, skip: int = 0):
+async def get_products(
+    category: Optional[str] = None,
+    size: Optional[str] = None,
+    color: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    in_stock: bool = False,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    skip: int = Query(0, ge=0)
+):
     query = {}
     if category:
         query["category"] = category
+    if size:
+        query["size"] = size
+    if color:
+        query["color"] = color
+    if min_price is not None or max_price is not None:
+        query["price"] = {}
+        if min_price is not None:
+            query["price"]["$gte"] = min_price
+        if max_price is not None:
+            query["price"]["$lte"] = max_price
+    if in_stock:
+        query["stock"] = {"$gt": 0}
+    
+    try:
+        query = with_keyset(query, cursor)
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    async def load():
+        # skip is kept for older clients; new clients should follow X-Next-Cursor
+        products = await db.products.find(query, PRODUCT_PROJECTION).sort(KEYSET_SORT).skip(skip).limit(limit).to_list(length=limit)
+        return render_json(products), next_cursor(products, limit)
+    
+    cache_key = ("products", category, size, color, min_price, max_price, in_stock, cursor, limit, skip)
+    body, following = await catalog_cache.get_or_load(cache_key, load)
+    headers = {"X-Next-Cursor": following} if following else None
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@api_router.get("/products/search", response_model=ProductSearchResult)
+async def search_catalog(
+    q: Optional[str] = Query(None, max_length=100),
+    category: Optional[str] = None,
+    size: Optional[str] = None,
+    color: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    in_stock: bool = False,
+    sort: Literal["relevance", "newest", "price_asc", "price_desc"] = "relevance",
+    page: int = Query(1, ge=1),
+    limit: int = Query(24, ge=1, le=100)
+):
+    offset = (page - 1) * limit
+    if offset >= SEARCH_MAX_OFFSET:
+        raise HTTPException(status_code=400, detail=f"Search results are limited to the first {SEARCH_MAX_OFFSET} matches")
     
-    products = await db.products.find(query).skip(skip).limit(limit).to_list(length=None)
-    return [Product(**product) for product in products]
+    q = q.strip() if q else None
+    query = search_filter(q, category, size, color, min_price, max_price, in_stock)
+    
+    async def load():
+        result = await search_products(db, query, sort=sort, offset=offset, limit=limit, projection=PRODUCT_PROJECTION)
+        return render_json({
+            "items": result["items"],
+            "total": result["total"],
+            "page": page,
+            "limit": limit,
+            "facets": result["facets"]
+        })
+    
+    cache_key = ("search", q, category, size, color, min_price, max_price, in_stock, sort, page, limit)
+    body = await catalog_cache.get_or_load(cache_key, load)
+    return Response(content=body, media_type="application/json")
 
 @api_router.get("/products/{product_id}", response_model=Product)
 async def get_product(product_id: str):
-    product = await db.products.find_one({"id": product_id})
-    if not product:
+    async def load():
+        product = await db.products.find_one({"id": product_id}, PRODUCT_PROJECTION)
+        return render_json(product) if product else None
+    
+    body = await catalog_cache.get_or_load(("product", product_id), load)
+    if body is None:
         raise HTTPException(status_code=404, detail="Product not found")
-    return Product(**product)
+    return Response(content=body, media_type="application/json")
 
 @api_router.post("/products", response_model=Product)
-async def create_product(product_data: ProductCreate, current_admin: User = Depends(get_current_admin_user)):
+async def create_product(product_data: ProductCreate, current_admin: Principal = Depends(get_current_admin_user)):
     product = Product(**product_data.dict())
     await db.products.insert_one(product.dict())
+    await invalidate_product_cache(product.id)
     return product
 
 @api_router.put("/products/{product_id}", response_model=Product)
-async def update_product(product_id: str, product_data: ProductCreate, current_admin: User = Depends(get_current_admin_user)):
-    product = await db.products.find_one({"id": product_id})
-    if not product:
+async def update_product(product_id: str, product_data: ProductCreate, current_admin: Principal = Depends(get_current_admin_user)):
+    # Only the editable fields are set: holds and created_at are kept as they are
+    product = await db.products.find_one_and_update(
+        {"id": product_id},
+        {"$set": product_data.dict()},
+        projection=PRODUCT_PROJECTION,
+        return_document=ReturnDocument.AFTER
+    )
+    if product is None:
         raise HTTPException(status_code=404, detail="Product not found")
-    
-    updated_product = Product(id=product_id, **product_data.dict())
-    await db.products.replace_one({"id": product_id}, updated_product.dict())
-    return updated_product
+    await invalidate_product_cache(product_id)
+    return Product(**product)
 
 @api_router.delete("/products/{product_id}")
-async def delete_product(product_id: str, current_admin: User = Depends(get_current_admin_user)):
+async def delete_product(product_id: str, current_admin: Principal = Depends(get_current_admin_user)):
     result = await db.products.delete_one({"id": product_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Product not found")
+    await invalidate_product_cache(product_id)
     return {"message": "Product deleted successfully"}
 
+@api_router.post("/admin/products/import")
+async def import_catalog(
+    request: Request,
+    format: Literal["ndjson", "csv"] = "ndjson",
+    current_admin: Principal = Depends(get_current_admin_user)
+):
+    # The body is read as it arrives; rows are validated and written in batches
+    try:
+        report = await import_products(db, request.stream(), format, ProductCreate)
+    finally:
+        await invalidate_product_cache()
+    logger.info(f"Catalog import by {current_admin.email}: {report['inserted']} inserted, {report['updated']} updated, {report['failed']} failed")
+    return report
+
+@api_router.get("/admin/products/export")
+async def export_catalog(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    current_admin: Principal = Depends(get_current_admin_user)
+):
+    columns = ["id", *ProductCreate.model_fields, "created_at"]
+    return StreamingResponse(
+        export_products(db, format, columns),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="products.{format}"'}
+    )
+
 # Cart
 @api_router.get("/cart", response_model=Cart)
-async def get_cart(current_user: User = Depends(get_current_user)):
-    cart = await db.carts.find_one({"user_id": current_user.id})
+async def get_cart(current_user: Principal = Depends(get_current_user)):
+    cart = await db.carts.find_one({"user_id": current_user.id}, CART_PROJECTION)
     if not cart:
-        cart = Cart(user_id=current_user.id, items=[])
-        await db.carts.insert_one(cart.dict())
-    return Cart(**cart)
+        # Nothing is stored until the first item is added
+        return Cart(user_id=current_user.id, items=[])
+    return Response(content=render_json(cart), media_type="application/json")
 
 @api_router.post("/cart/add")
-async def add_to_cart(item: CartItem, current_user: User = Depends(get_current_user)):
-    cart = await db.carts.find_one({"user_id": current_user.id})
-    if not cart:
-        cart = Cart(user_id=current_user.id, items=[])
-    else:
-        cart = Cart(**cart)
-    
-    # Check if item already exists
-    for existing_item in cart.items:
-        if (existing_item.product_id == item.product_id and 
-            existing_item.size == item.size and 
-            existing_item.color == item.color):
-            existing_item.quantity += item.quantity
-            break
-    else:
-        cart.items.append(item)
-    
-    await db.carts.replace_one({"user_id": current_user.id}, cart.dict(), upsert=True)
+async def add_to_cart(item: CartItem, current_user: Principal = Depends(get_current_user)):
+    if item.quantity <= 0:
+        raise HTTPException(status_code=400, detail="Quantity must be positive")
+    await add_item(db, current_user.id, item.product_id, item.size, item.color, item.quantity)
     return {"message": "Item added to cart"}
 
+@api_router.put("/cart/items")
+async def set_cart_item_quantity(item: CartItem, current_user: Principal = Depends(get_current_user)):
+    # A quantity of zero or less removes the line
+    await set_quantity(db, current_user.id, item.product_id, item.size, item.color, item.quantity)
+    return {"message": "Cart updated"}
+
+@api_router.delete("/cart/items/{product_id}")
+async def remove_cart_item(product_id: str, size: str, color: str, current_user: Principal = Depends(get_current_user)):
+    await remove_line(db, current_user.id, product_id, size, color)
+    return {"message": "Item removed from cart"}
+
+@api_router.post("/cart/batch")
+async def update_cart_batch(batch: CartBatch, current_user: Principal = Depends(get_current_user)):
+    if any(operation.op == "add" and operation.quantity <= 0 for operation in batch.operations):
+        raise HTTPException(status_code=400, detail="Quantity must be positive")
+    await apply_batch(db, current_user.id, batch.operations)
+    return {"message": "Cart updated"}
+
 @api_router.delete("/cart/remove/{product_id}")
-async def remove_from_cart(product_id: str, current_user: User = Depends(get_current_user)):
-    cart = await db.carts.find_one({"user_id": current_user.id})
-    if cart:
-        cart = Cart(**cart)
-        cart.items = [item for item in cart.items if item.product_id != product_id]
-        await db.carts.replace_one({"user_id": current_user.id}, cart.dict())
+async def remove_from_cart(product_id: str, current_user: Principal = Depends(get_current_user)):
+    await remove_product(db, current_user.id, product_id)
     return {"message": "Item removed from cart"}
 
 # Checkout & Payments
-@api_router.post("/payments/checkout/session")
-async def create_checkout_session(request: CheckoutRequest, http_request: Request):
-    # Calculate total amount
-    total_amount = 0.0
-    order_items = []
-    
-    for cart_item in request.items:
-        product = await db.products.find_one({"id": cart_item.product_id})
-        if not product:
-            raise HTTPException(status_code=404, detail=f"Product {cart_item.product_id} not found")
-        
-        if product["stock"] < cart_item.quantity:
-            raise HTTPException(status_code=400, detail=f"Insufficient stock for {product['name']}")
-        
-        item_total = product["price"] * cart_item.quantity
-        total_amount += item_total
-        
-        order_items.append({
-            "product_id": cart_item.product_id,
-            "name": product["name"],
-            "price": product["price"],
-            "quantity": cart_item.quantity,
-            "size": cart_item.size,
-            "color": cart_item.color
-        })
+async def open_checkout_session(
+    request: CheckoutRequest, priced: PricedCart, quote_id: str, user_id: str
+) -> Dict[str, str]:
+    now = datetime.now(timezone.utc)
+    reusable = await db.payment_transactions.find_one(
+        {"quote_id": quote_id, "status": {"$in": ["pending", "open"]}, "quote_expires_at": {"$gt": now}},
+        {"_id": 0, "session_id": 1, "url": 1}
+    )
+    if reusable and reusable.get("url"):
+        return {"url": reusable["url"], "session_id": reusable["session_id"]}
     
-    # Setup Stripe
-    host_url = str(http_request.base_url)
-    webhook_url = f"{host_url}api/webhook/stripe"
-    stripe_checkout = StripeCheckout(api_key=stripe_api_key, webhook_url=webhook_url)
+    total_amount = priced.total_amount
+    order_items = priced.items
+    
+    # Hold the stock until the session is paid, expires or is cancelled
+    try:
+        reservation_id = await reserve_stock(db, priced.quantities_by_product(), RESERVATION_TTL)
+    except StockUnavailable as e:
+        errors = priced.stock_errors(e.product_ids)
+        raise HTTPException(status_code=400, detail={"message": errors[0]["message"], "errors": errors})
     
     # Create URLs
     success_url = f"{request.origin_url}/?payment=success&session_id={{CHECKOUT_SESSION_ID}}"
     cancel_url = f"{request.origin_url}/?payment=cancelled"
     
-    # Create checkout session
-    checkout_request = CheckoutSessionRequest(
+    # Create checkout session; Stripe metadata values must be strings of at
+    # most 500 characters, so the line items stay on the transaction and
+    # Stripe only gets the quote id
+    checkout_request = app.state.payment_gateway.checkout_request(
         amount=total_amount,
         currency="brl",
         success_url=success_url,
@@ -414,22 +760,34 @@ async def create_checkout_session(request: CheckoutRequest, http_request: Reques
         metadata={
             "user_email": request.user_email or "guest",
             "user_name": request.user_name or "Guest",
-            "items": json.dumps(order_items)
+            "quote_id": quote_id
         }
     )
     
-    session = await stripe_checkout.create_checkout_session(checkout_request)
+    try:
+        session = await app.state.payment_gateway.create_checkout_session(checkout_request)
+    except Exception:
+        await release_reservation(db, reservation_id)
+        raise
+    await attach_session(db, reservation_id, session.session_id)
     
     # Create payment transaction
     transaction = PaymentTransaction(
         session_id=session.session_id,
+        user_id=user_id,
         user_email=request.user_email,
+        user_name=request.user_name,
         amount=total_amount,
         currency="brl",
+        reservation_id=reservation_id,
+        items=order_items,
+        quote_id=quote_id,
+        # ``now`` predates the reservation, so the quote never outlives the stock hold
+        quote_expires_at=now + min(CHECKOUT_QUOTE_TTL, RESERVATION_TTL),
+        url=session.url,
         metadata={
             "user_email": request.user_email or "guest",
-            "user_name": request.user_name or "Guest",
-            "items": json.dumps(order_items)
+            "user_name": request.user_name or "Guest"
         }
     )
     
@@ -437,124 +795,304 @@ async def create_checkout_session(request: CheckoutRequest, http_request: Reques
     
     return {"url": session.url, "session_id": session.session_id}
 
+@api_router.post("/payments/checkout/session")
+async def create_checkout_session(
+    request: CheckoutRequest,
+    http_request: Request,
+    current_user: Optional[Principal] = Depends(get_optional_user)
+):
+    if not request.items:
+        raise HTTPException(status_code=400, detail="Cart is empty")
+    
+    # Load, merge and validate every line in one pass; stock is checked by
+    # the reservation in open_checkout_session
+    priced = await price_cart(db, request.items, check_stock=False)
+    if not priced.ok:
+        all_missing = all(error["code"] == "not_found" for error in priced.errors)
+        raise HTTPException(
+            status_code=404 if all_missing else 400,
+            detail={"message": priced.errors[0]["message"], "errors": priced.errors}
+        )
+    
+    # Guests have no email to tell them apart, so their quotes are per address
+    client_host = http_request.client.host if http_request.client else "unknown"
+    user_id = current_user.id if current_user else "guest"
+    # Deployments without PUBLIC_BASE_URL keep the URL they were reached at, as before it existed
+    app.state.payment_gateway.default_webhook_url(f"{http_request.base_url}api/webhook/stripe")
+    shopper = request.user_email or f"guest:{client_host}"
+    quote_id = priced.quote_id(user_id, shopper, request.user_name or "", request.origin_url)
+    return await checkout_quotes.get_or_load(
+        ("quote", quote_id), lambda: open_checkout_session(request, priced, quote_id, user_id)
+    )
+
 @api_router.get("/payments/checkout/status/{session_id}")
-async def get_checkout_status(session_id: str, background_tasks: BackgroundTasks):
+async def get_checkout_status(session_id: str):
     # Get transaction
     transaction = await db.payment_transactions.find_one({"session_id": session_id})
     if not transaction:
         raise HTTPException(status_code=404, detail="Transaction not found")
     
-    # Setup Stripe
-    stripe_checkout = StripeCheckout(api_key=stripe_api_key, webhook_url="")
+    # Terminal sessions never change again; answer from our own record
+    if transaction.get("stripe_status") and (
+        transaction["payment_status"] == "paid" or transaction["status"] == "expired"
+    ):
+        return transaction["stripe_status"]
     
-    # Get status from Stripe
-    status_response = await stripe_checkout.get_checkout_status(session_id)
+    # Get status from Stripe (concurrent polls share one upstream call)
+    status_response = await app.state.payment_gateway.get_checkout_status(session_id)
     
-    # Update transaction
-    await db.payment_transactions.update_one(
-        {"session_id": session_id},
-        {
-            "$set": {
-                "status": status_response.status,
-                "payment_status": status_response.payment_status
-            }
-        }
+    # Record it; a paid session is turned into its order exactly once
+    await app.state.finalizer.apply_status(
+        session_id,
+        status_response.status,
+        status_response.payment_status,
+        jsonable_encoder(status_response)
     )
     
-    # If paid, create order and send email
-    if status_response.payment_status == "paid" and transaction["payment_status"] != "paid":
-        items = json.loads(transaction["metadata"]["items"])
-        user_email = transaction["metadata"]["user_email"]
-        user_name = transaction["metadata"]["user_name"]
-        
-        # Create order
-        order = Order(
-            user_email=user_email,
-            user_name=user_name,
-            items=items,
-            total_amount=transaction["amount"],
-            status="confirmed",
-            payment_status="paid",
-            session_id=session_id
-        )
-        
-        await db.orders.insert_one(order.dict())
-        
-        # Update product stock
-        for item in items:
-            await db.products.update_one(
-                {"id": item["product_id"]},
-                {"$inc": {"stock": -item["quantity"]}}
-            )
-        
-        # Send confirmation email
-        if user_email != "guest":
-            background_tasks.add_task(
-                send_order_confirmation_email,
-                user_email,
-                user_name,
-                order.id,
-                items,
-                transaction["amount"]
-            )
-    
     return status_response
 
+@api_router.post("/payments/checkout/cancel/{session_id}")
+async def cancel_checkout_session(session_id: str):
+    transaction = await db.payment_transactions.find_one({"session_id": session_id})
+    if not transaction:
+        raise HTTPException(status_code=404, detail="Transaction not found")
+    
+    if transaction["payment_status"] == "paid":
+        raise HTTPException(status_code=400, detail="Transaction already paid")
+    
+    result = await db.payment_transactions.update_one(
+        {"session_id": session_id, "payment_status": {"$ne": "paid"}},
+        {"$set": {"status": "cancelled"}}
+    )
+    if result.matched_count == 0:
+        # Payment was finalized in the meantime; the stock now belongs to the order
+        raise HTTPException(status_code=400, detail="Transaction already paid")
+    if transaction.get("quote_id"):
+        checkout_quotes.invalidate(("quote", transaction["quote_id"]))
+    if transaction.get("reservation_id"):
+        await release_reservation(db, transaction["reservation_id"])
+    return {"message": "Checkout cancelled"}
+
 @api_router.post("/webhook/stripe")
 async def stripe_webhook(request: Request):
     body = await request.body()
     signature = request.headers.get("Stripe-Signature")
     
-    stripe_checkout = StripeCheckout(api_key=stripe_api_key, webhook_url="")
-    webhook_response = await stripe_checkout.handle_webhook(body, signature)
+    webhook_response = await app.state.payment_gateway.handle_webhook(body, signature)
+    event_id = getattr(webhook_response, "event_id", None)
+    event_type = getattr(webhook_response, "event_type", None) or ""
+    session_id = getattr(webhook_response, "session_id", None)
+    
+    if event_id and not await app.state.finalizer.record_event(event_id, event_type):
+        return {"received": True, "duplicate": True}
+    
+    if session_id:
+        payment_status = getattr(webhook_response, "payment_status", None) or "unpaid"
+        if event_type.endswith("expired"):
+            session_status = "expired"
+        elif payment_status == "paid":
+            session_status = "complete"
+        else:
+            session_status = "open"
+        try:
+            await app.state.finalizer.apply_status(session_id, session_status, payment_status)
+        except Exception:
+            if event_id:
+                await app.state.finalizer.forget_event(event_id)
+            raise
     
     return {"received": True}
 
 # Admin Routes
 @api_router.get("/admin/dashboard")
-async def get_admin_dashboard(current_admin: User = Depends(get_current_admin_user)):
-    # Get stats
-    total_products = await db.products.count_documents({})
-    total_orders = await db.orders.count_documents({})
-    total_revenue = 0
-    
-    # Calculate revenue
-    orders = await db.orders.find({"payment_status": "paid"}).to_list(length=None)
-    total_revenue = sum(order["total_amount"] for order in orders)
-    
-    # Recent orders
-    recent_orders = await db.orders.find().sort("created_at", -1).limit(10).to_list(length=None)
+async def get_admin_dashboard(
+    current_admin: Principal = Depends(get_current_admin_user),
+    days: int = Query(30, ge=1, le=366)
+):
+    async def load():
+        # Counts come from collection metadata; revenue and breakdowns from
+        # the pre-aggregated order_stats documents
+        total_products = await db.products.estimated_document_count()
+        total_orders = await db.orders.estimated_document_count()
+        stats = await dashboard_stats(db, days=days)
+        
+        # Recent orders
+        recent_orders = await db.orders.find({}, ORDER_PROJECTION).sort(KEYSET_SORT).limit(10).to_list(length=10)
+        
+        return render_json({
+            "total_products": total_products,
+            "total_orders": total_orders,
+            "total_revenue": stats["total_revenue"],
+            "recent_orders": recent_orders,
+            "revenue_by_day": stats["revenue_by_day"],
+            "revenue_by_week": stats["revenue_by_week"],
+            "top_products": stats["top_products"],
+            "revenue_by_category": stats["revenue_by_category"]
+        })
     
+    body = await dashboard_cache.get_or_load(("dashboard", days), load)
+    return Response(content=body, media_type="application/json")
+
+@api_router.post("/admin/users/{user_id}/revoke")
+async def revoke_user_tokens(user_id: str, current_admin: Principal = Depends(get_current_admin_user)):
+    if not await revoke_tokens(user_id):
+        raise HTTPException(status_code=404, detail="User not found")
+    return {"message": "User sessions revoked"}
+
+@api_router.get("/admin/password-pool")
+async def get_password_pool_stats(current_admin: Principal = Depends(get_current_admin_user)):
+    return password_pool.stats()
+
+@api_router.get("/admin/email-outbox")
+async def get_email_outbox_stats(current_admin: Principal = Depends(get_current_admin_user)):
+    return await app.state.email_outbox.stats()
+
+@api_router.get("/admin/payment-gateway")
+async def get_payment_gateway_stats(current_admin: Principal = Depends(get_current_admin_user)):
+    return app.state.payment_gateway.stats()
+
+@api_router.get("/admin/admission")
+async def get_admission_stats(current_admin: Principal = Depends(get_current_admin_user)):
+    return admission_control.stats()
+
+@api_router.get("/admin/compaction")
+async def get_compaction_stats(current_admin: Principal = Depends(get_current_admin_user)):
+    return app.state.compactor.stats()
+
+@api_router.get("/admin/cache")
+async def get_cache_stats(current_admin: Principal = Depends(get_current_admin_user)):
     return {
-        "total_products": total_products,
-        "total_orders": total_orders,
-        "total_revenue": total_revenue,
-        "recent_orders": recent_orders
+        "catalog": catalog_cache.stats(),
+        "dashboard": dashboard_cache.stats(),
+        "principals": principal_cache.stats(),
+        "invalidation": app.state.cache_invalidator.stats()
     }
 
 @api_router.get("/admin/orders", response_model=List[Order])
-async def get_all_orders(current_admin: User = Depends(get_current_admin_user), limit: int = 50, skip: int = 0):
-    orders = await db.orders.find().sort("created_at", -1).skip(skip).limit(limit).to_list(length=None)
-    return [Order(**order) for order in orders]
+async def get_all_orders(
+    current_admin: Principal = Depends(get_current_admin_user),
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    skip: int = Query(0, ge=0)
+):
+    try:
+        query = with_keyset({}, cursor)
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    orders = await db.orders.find(query, ORDER_PROJECTION).sort(KEYSET_SORT).skip(skip).limit(limit).to_list(length=limit)
+    following = next_cursor(orders, limit)
+    headers = {"X-Next-Cursor": following} if following else None
+    return Response(content=render_json(orders), media_type="application/json", headers=headers)
+
+@api_router.get("/admin/orders/export")
+async def export_orders(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    mode: Literal["lines", "daily"] = "lines",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    status: Optional[str] = None,
+    payment_status: Optional[str] = None,
+    current_admin: Principal = Depends(get_current_admin_user)
+):
+    if start is not None and end is not None and start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    
+    query = order_filter(start, end, status, payment_status)
+    if mode == "daily":
+        rows, columns = daily_totals(db, query), DAILY_COLUMNS
+    else:
+        rows, columns = order_lines(db, query), EXPORT_COLUMNS
+    return StreamingResponse(
+        encode_rows(rows, format, columns),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="orders-{mode}.{format}"'}
+    )
 
 @api_router.put("/admin/orders/{order_id}/status")
-async def update_order_status(order_id: str, status: str, current_admin: User = Depends(get_current_admin_user)):
-    result = await db.orders.update_one(
+async def update_order_status(order_id: str, status: str, current_admin: Principal = Depends(get_current_admin_user)):
+    order = await db.orders.find_one_and_update(
         {"id": order_id},
-        {"$set": {"status": status}}
+        {"$set": {"status": status}},
+        projection={"_id": 0, "id": 1, "user_email": 1, "user_name": 1, "items": 1, "total_amount": 1}
     )
-    if result.modified_count == 0:
+    if order is None:
         raise HTTPException(status_code=404, detail="Order not found")
+    
+    template = f"order_{status}"
+    if template in email_templates and order["user_email"] != "guest":
+        await enqueue_email(db, template, f"{template}:{order_id}", order["user_email"], {
+            "user_name": order["user_name"],
+            "order_id": order_id,
+            "items": order["items"],
+            "total": order["total_amount"]
+        })
+        app.state.email_outbox.notify()
     return {"message": "Order status updated"}
 
-# Health check
+@api_router.get("/admin/slow-requests")
+async def get_slow_requests(current_admin: Principal = Depends(get_current_admin_user)):
+    if slow_request_profiler is None:
+        raise HTTPException(status_code=404, detail="Slow request profiling is disabled")
+    return list(slow_request_profiler.dumps)
+
+def collect_app_metrics() -> Dict[str, float]:
+    samples = {}
+    for name, cache in (("catalog", catalog_cache), ("dashboard", dashboard_cache), ("principals", principal_cache)):
+        stats = cache.stats()
+        for field in ("size", "hits", "misses", "evictions", "coalesced"):
+            samples[f'app_cache_{field}{{cache="{name}"}}'] = stats[field]
+    pool = password_pool.stats()
+    for field in ("outstanding", "queued", "completed", "rejected"):
+        samples[f"app_password_pool_{field}"] = pool[field]
+    gateway = getattr(app.state, "payment_gateway", None)
+    if gateway is not None:
+        samples["app_stripe_upstream_status_calls"] = gateway.upstream_status_calls
+    warmup = getattr(app.state, "warmup", None)
+    samples["app_ready"] = 1 if warmup is not None and warmup.ready else 0
+    return samples
+
+REGISTRY.add_collector(collect_app_metrics)
+
+@api_router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    if not (METRICS_TOKEN and hmac.compare_digest(credentials.credentials, METRICS_TOKEN)):
+        await get_current_admin_user(await get_current_user(credentials))
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+# Health check (liveness): answers as soon as the worker accepts connections
 @api_router.get("/")
 async def root():
     return {"message": "Urban Threads API is running!"}
 
+# Readiness: 503 until indexes, stats, caches and integrations are warm
+@api_router.get("/ready")
+async def readiness():
+    warmup = getattr(app.state, "warmup", None)
+    report = warmup.stats() if warmup is not None else {"ready": False}
+    try:
+        await asyncio.wait_for(db.command("ping"), timeout=1)
+        report["mongo"] = "ok"
+    except (PyMongoError, asyncio.TimeoutError) as e:
+        report["mongo"] = f"unreachable: {str(e) or 'timeout'}"
+        report["ready"] = False
+    return ORJSONResponse(report, status_code=200 if report["ready"] else 503)
+
 # Include router
 app.include_router(api_router)
 
+# Admission control sits inside CORS so rejections still carry CORS headers
+admission_control = AdmissionControl(
+    classify_route,
+    token_user_id,
+    buckets=MemoryBuckets(),
+    # Shared buckets need the Mongo client; startup() attaches them
+    enabled=RATE_LIMIT_ENABLED,
+    # Same setting run.py hands to uvicorn
+    trusted_proxies=(FORWARDED_ALLOW_IPS or '127.0.0.1').split(','),
+)
+app.add_middleware(AdmissionMiddleware, control=admission_control)
+
 # CORS
 app.add_middleware(
     CORSMiddleware,
@@ -562,7 +1100,9 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
+app.add_middleware(RequestMetricsMiddleware, profiler=slow_request_profiler, server_timing=SERVER_TIMING)
 
 # Configure logging
 logging.basicConfig(
@@ -571,6 +1111,125 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+async def run_maintenance():
+    while True:
+        try:
+            # Sessions are expired with their hold, so a late payment cannot oversell
+            await release_expired_reservations(db, expire_session=app.state.payment_gateway.expire_session)
+        except Exception as e:
+            logger.error(f"Failed to release expired reservations: {str(e)}")
+        try:
+            await app.state.finalizer.resume_stalled()
+        except Exception as e:
+            logger.error(f"Failed to resume stalled order finalization: {str(e)}")
+        try:
+            # Runs once per COMPACTION_INTERVAL across all workers
+            await app.state.compactor.run_if_due()
+        except Exception as e:
+            logger.error(f"Failed to compact abandoned checkouts: {str(e)}")
+        await asyncio.sleep(RESERVATION_SWEEP_SECONDS)
+
+def create_payment_gateway():
+    # The Stripe SDK itself is imported on first use or by warm_integrations.
+    # The webhook URL comes from config; per-request Host headers never reach it
+    if not public_base_url:
+        logger.warning("PUBLIC_BASE_URL not set; the webhook URL is taken from the first checkout request")
+    webhook_url = f"{public_base_url.rstrip('/')}/api/webhook/stripe" if public_base_url else ""
+    app.state.payment_gateway = PaymentGateway(
+        stripe_api_key, webhook_url=webhook_url, api_base=stripe_api_base, status_ttl=STRIPE_STATUS_CACHE_SECONDS
+    )
+
+async def create_indexes():
+    await ensure_indexes(db)
+
+async def backfill_order_stats():
+    await ensure_order_stats(db)
+
+async def start_cache_invalidation():
+    app.state.cache_invalidator = CacheInvalidator(
+        db,
+        {PRODUCTS: drop_product_cache, USERS: drop_user_cache},
+        mode=CACHE_INVALIDATION,
+        poll_interval=CACHE_EVENT_POLL_SECONDS,
+    )
+    await app.state.cache_invalidator.start()
+
+async def warm_caches():
+    # Fill the storefront's first pages before the worker reports ready
+    try:
+        categories = await db.products.distinct("category")
+        for category in [None, *sorted(categories)[:CACHE_WARM_CATEGORIES]]:
+            await get_products(
+                category=category, size=None, color=None, min_price=None, max_price=None,
+                in_stock=False, cursor=None, limit=50, skip=0
+            )
+        await get_admin_dashboard(current_admin=None, days=30)
+    except Exception as e:
+        logger.error(f"Failed to warm caches: {str(e)}")
+
+async def warm_integrations():
+    # Loaded in a thread so the event loop keeps serving while they import
+    await asyncio.to_thread(importlib.import_module, "jose.jwt")
+    await asyncio.to_thread(password_pool.warm)
+    if stripe_api_key:
+        await asyncio.to_thread(app.state.payment_gateway.warm)
+
+def start_email_outbox():
+    app.state.email_outbox = OutboxWorker(
+        db,
+        build_email_transport(),
+        email_templates,
+        batch_size=int(os.environ.get('EMAIL_OUTBOX_BATCH_SIZE', '50')),
+        poll_interval=float(os.environ.get('EMAIL_OUTBOX_POLL_SECONDS', '2')),
+        max_attempts=int(os.environ.get('EMAIL_OUTBOX_MAX_ATTEMPTS', '8')),
+    )
+    app.state.email_outbox.start()
+    app.state.finalizer = OrderFinalizer(db, build_order, notify_outbox=app.state.email_outbox.notify)
+
+def start_maintenance():
+    app.state.compactor = Compactor(
+        db,
+        interval=COMPACTION_INTERVAL,
+        pending_after=PENDING_TRANSACTION_TTL,
+        retention=TRANSACTION_RETENTION,
+        batch_size=int(os.environ.get('COMPACTION_BATCH_SIZE', '500')),
+    )
+    app.state.maintenance = asyncio.create_task(run_maintenance())
+
+async def startup():
+    # Only what requests depend on runs before the worker accepts connections;
+    # the rest warms up in the background and is reported by /api/ready
+    if db is None:
+        # Benchmarks point the app at their own database before starting it
+        connect_mongo()
+    if not FORWARDED_ALLOW_IPS and 'RATE_LIMIT_ENABLED' not in os.environ:
+        logger.warning("FORWARDED_ALLOW_IPS not set; rate limits stay off until the proxies in front are listed")
+    if RATE_LIMIT_BACKEND == "mongo":
+        admission_control.shared_buckets = MongoBuckets(db)
+    create_payment_gateway()
+    await start_cache_invalidation()
+    start_email_outbox()
+    if slow_request_profiler is not None:
+        slow_request_profiler.start()
+    start_maintenance()
+    app.state.warmup = Warmup([
+        ("indexes", create_indexes),
+        ("order_stats", backfill_order_stats),
+        ("caches", warm_caches),
+        ("integrations", warm_integrations),
+    ])
+    app.state.warmup.start()
+
+async def shutdown():
+    # uvicorn has stopped accepting connections; let requests still running finish first
+    if not await wait_for_idle(DRAIN_SECONDS):
+        logger.warning(f"Shutting down with requests still in flight after {DRAIN_SECONDS}s")
+    await app.state.warmup.stop()
+    await app.state.cache_invalidator.stop()
+    await app.state.email_outbox.stop()
+    app.state.maintenance.cancel()
+    password_pool.shutdown()
+    if slow_request_profiler is not None:
+        slow_request_profiler.stop()
+    if client is not None:
+        client.close()
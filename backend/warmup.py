@@ -0,0 +1,85 @@
+"""Post-boot warm-up and the readiness it reports.
+
+Startup itself only does what the first request cannot do without:
+connecting to Mongo and starting the background workers. That keeps the
+time until a worker accepts connections short. Slower preparation runs
+afterwards as a background ``Warmup``: building indexes, backfilling stats,
+filling the caches, and importing the integrations that are otherwise
+loaded on first use.
+
+Steps run in order. A step that fails is retried with backoff until it
+succeeds, so a Mongo hiccup during boot only delays readiness. ``ready`` is
+true once every step has finished. The readiness endpoint serves it so a
+load balancer only routes to warm workers; liveness does not wait for it.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_MAX_BACKOFF_SECONDS = 30.0
+
+
+class Warmup:
+    def __init__(
+        self,
+        steps: List[Tuple[str, Callable[[], Awaitable[None]]]],
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.steps = steps
+        self.clock = clock
+        self.status: Dict[str, Dict[str, Any]] = {name: {"status": "pending"} for name, _ in steps}
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.finished_at is not None
+
+    async def _run_step(self, name: str, step: Callable[[], Awaitable[None]]):
+        started = self.clock()
+        backoff = 1.0
+        attempts = 0
+        while True:
+            attempts += 1
+            self.status[name] = {"status": "running", "attempts": attempts}
+            try:
+                await step()
+                break
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Warm-up step {name} failed, retrying in {backoff:.0f}s: {str(e)}")
+                self.status[name] = {"status": "retrying", "attempts": attempts, "error": str(e)}
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, _MAX_BACKOFF_SECONDS)
+        self.status[name] = {"status": "done", "attempts": attempts, "seconds": round(self.clock() - started, 3)}
+
+    async def run(self):
+        self.started_at = self.clock()
+        for name, step in self.steps:
+            await self._run_step(name, step)
+        self.finished_at = self.clock()
+        logger.info(f"Warm-up finished in {self.finished_at - self.started_at:.2f}s")
+
+    def start(self):
+        self._task = asyncio.create_task(self.run())
+
+    async def wait(self):
+        """Block until every step is done; benchmarks wait on this before measuring."""
+        if self._task is not None:
+            await asyncio.shield(self._task)
+
+    async def stop(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        elapsed = None
+        if self.started_at is not None:
+            elapsed = round((self.finished_at or self.clock()) - self.started_at, 3)
+        return {"ready": self.ready, "elapsed_s": elapsed, "steps": self.status}
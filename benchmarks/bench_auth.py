@@ -0,0 +1,46 @@
+"""Per-request auth overhead with and without the principal fast path.
+
+Resolves the same caller repeatedly through ``get_current_user`` using a
+legacy email-only token (one ``users`` lookup per request) and a token
+carrying the user id and version (served from the principal cache).
+"""
+import asyncio
+import time
+from datetime import timedelta
+
+from fastapi.security import HTTPAuthorizationCredentials
+
+from common import bench_db, load_server
+
+ITERATIONS = 5000
+
+
+async def per_request_us(server, token):
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+    await server.get_current_user(credentials)
+    started = time.perf_counter()
+    for _ in range(ITERATIONS):
+        await server.get_current_user(credentials)
+    return (time.perf_counter() - started) / ITERATIONS * 1e6
+
+
+async def main():
+    async with bench_db("auth") as db:
+        server = load_server(db)
+        user = server.User(email="shopper@example.com", name="Shopper", password_hash="x")
+        await db.users.insert_one(user.dict())
+        await server.ensure_indexes(db)
+
+        expires = timedelta(minutes=5)
+        legacy = server.create_access_token({"sub": user.email}, expires)
+        fast = server.create_access_token(server.token_claims(user.dict()), expires)
+
+        legacy_us = await per_request_us(server, legacy)
+        fast_us = await per_request_us(server, fast)
+        print(f"email lookup per request: {legacy_us:8.1f} us")
+        print(f"principal cache:          {fast_us:8.1f} us  ({legacy_us / fast_us:.1f}x)")
+        print(f"cache counters: {server.principal_cache.stats()}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
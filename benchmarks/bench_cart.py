@@ -0,0 +1,96 @@
+"""Cart mutations: lost updates under concurrency and per-op latency.
+
+1. Fires ``PARALLEL_ADDS`` concurrent adds of one unit of the same line at
+   a fresh cart, with the old read-modify-replace code and with the atomic
+   operations, and checks the final quantity.
+2. Times a single add and remove against carts of 10, 100 and 500 lines.
+"""
+import asyncio
+import uuid
+
+from common import bench_db, print_table, summarize, timed
+
+from cart_ops import add_item, remove_line
+from indexes import INDEXES
+
+PARALLEL_ADDS = 500
+CART_SIZES = (10, 100, 500)
+REPEAT = 50
+
+
+async def legacy_add(db, user_id, line):
+    cart = await db.carts.find_one({"user_id": user_id}) or {"user_id": user_id, "items": []}
+    cart.pop("_id", None)
+    for existing in cart["items"]:
+        if (existing["product_id"], existing["size"], existing["color"]) == (line["product_id"], line["size"], line["color"]):
+            existing["quantity"] += line["quantity"]
+            break
+    else:
+        cart["items"].append(dict(line))
+    await db.carts.replace_one({"user_id": user_id}, cart, upsert=True)
+
+
+async def legacy_remove(db, user_id, product_id):
+    cart = await db.carts.find_one({"user_id": user_id})
+    cart["items"] = [item for item in cart["items"] if item["product_id"] != product_id]
+    await db.carts.replace_one({"user_id": user_id}, cart)
+
+
+def line(product_id, quantity=1):
+    return {"product_id": product_id, "size": "M", "color": "preto", "quantity": quantity}
+
+
+async def main():
+    async with bench_db("cart") as db:
+        await db.carts.create_indexes(INDEXES["carts"])
+
+        hot = line("hot-product")
+        legacy_user, atomic_user = str(uuid.uuid4()), str(uuid.uuid4())
+        await db.carts.insert_one({"user_id": legacy_user, "items": []})
+
+        await asyncio.gather(*(legacy_add(db, legacy_user, hot) for _ in range(PARALLEL_ADDS)), return_exceptions=True)
+        await asyncio.gather(*(
+            add_item(db, atomic_user, hot["product_id"], hot["size"], hot["color"], 1) for _ in range(PARALLEL_ADDS)
+        ))
+        legacy_qty = (await db.carts.find_one({"user_id": legacy_user}))["items"][0]["quantity"]
+        atomic_cart = await db.carts.find_one({"user_id": atomic_user})
+        print(f"{PARALLEL_ADDS} parallel adds -> legacy quantity {legacy_qty}, atomic quantity "
+              f"{atomic_cart['items'][0]['quantity']} in {len(atomic_cart['items'])} line(s)")
+        assert atomic_cart["items"][0]["quantity"] == PARALLEL_ADDS and len(atomic_cart["items"]) == 1
+
+        rows = []
+        for size in CART_SIZES:
+            user_id = str(uuid.uuid4())
+            await db.carts.insert_one({"user_id": user_id, "items": [line(f"p{i}") for i in range(size)]})
+            target = line(f"p{size // 2}")
+
+            async def legacy_cycle():
+                await legacy_add(db, user_id, line("extra"))
+                await legacy_remove(db, user_id, "extra")
+
+            async def atomic_cycle():
+                await add_item(db, user_id, "extra", "M", "preto", 1)
+                await remove_line(db, user_id, "extra", "M", "preto")
+
+            legacy_inc = summarize(await timed(lambda: legacy_add(db, user_id, target), REPEAT))
+            atomic_inc = summarize(await timed(
+                lambda: add_item(db, user_id, target["product_id"], "M", "preto", 1), REPEAT
+            ))
+            legacy_new = summarize(await timed(legacy_cycle, REPEAT))
+            atomic_new = summarize(await timed(atomic_cycle, REPEAT))
+            rows.append({
+                "lines": size,
+                "legacy_inc": legacy_inc["p50_ms"],
+                "atomic_inc": atomic_inc["p50_ms"],
+                "legacy_new": legacy_new["p50_ms"],
+                "atomic_new": atomic_new["p50_ms"],
+            })
+        print_table(
+            "p50 ms: bump an existing line / add+remove a new line",
+            rows,
+            ["lines", "legacy_inc", "atomic_inc", "legacy_new", "atomic_new"],
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
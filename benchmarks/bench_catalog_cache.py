@@ -0,0 +1,60 @@
+"""Catalog endpoint throughput with and without the read-through cache.
+
+Drives ``GET /api/products`` and ``GET /api/products/{id}`` in-process at a
+fixed concurrency and reports requests/sec and cache counters.
+"""
+import asyncio
+import random
+import time
+
+from common import app_client, bench_db, load_server, make_product
+
+from catalog_cache import CatalogCache
+
+CATALOG_SIZE = 2000
+CONCURRENCY = 32
+REQUESTS = 4000
+
+
+async def drive(client, product_ids):
+    remaining = REQUESTS
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            if random.random() < 0.3:
+                response = await client.get("/api/products", params={"skip": random.choice((0, 50, 100))})
+            else:
+                # Skewed towards a hot set, like real product traffic
+                response = await client.get(f"/api/products/{random.choice(product_ids[:200])}")
+            assert response.status_code == 200
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(CONCURRENCY)))
+    return REQUESTS / (time.perf_counter() - started)
+
+
+async def main():
+    async with bench_db("catalog_cache") as db:
+        products = [make_product(i) for i in range(CATALOG_SIZE)]
+        await db.products.insert_many(products)
+        await db.products.create_index("id", unique=True)
+        product_ids = [p["id"] for p in products]
+
+        server = load_server(db)
+        async with app_client(server.app) as client:
+            server.catalog_cache = CatalogCache(maxsize=0)
+            uncached = await drive(client, product_ids)
+
+            server.catalog_cache = CatalogCache(maxsize=1024, ttl=30)
+            cached = await drive(client, product_ids)
+            stats = server.catalog_cache.stats()
+
+        print(f"uncached: {uncached:8.0f} req/s")
+        print(f"cached:   {cached:8.0f} req/s  ({cached / uncached:.1f}x)")
+        print(f"counters: {stats}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,120 @@
+"""Bulk catalog import/export throughput and memory.
+
+Streams a generated ``BENCH_ROWS``-row file (default 100k) through
+``import_products`` in 64 KiB chunks, once as NDJSON and once as CSV; 1% of
+rows are invalid so the error report path is exercised. Then it exports
+the collection in both formats. Reports rows/sec, the peak of Python
+allocations during each run (tracemalloc) and the process max RSS.
+
+The file is generated on the fly, so neither the upload nor the export is
+ever held in memory by the benchmark itself.
+"""
+import asyncio
+import csv
+import io
+import json
+import os
+import resource
+import time
+import tracemalloc
+
+from common import bench_db, load_server, make_product, print_table
+
+from catalog_io import export_products, import_products
+from indexes import INDEXES
+
+ROWS = int(os.environ.get("BENCH_ROWS", "100000"))
+CHUNK = 64 * 1024
+COLUMNS = ["name", "description", "price", "category", "size", "color", "stock", "image_url"]
+
+
+def rows():
+    for i in range(ROWS):
+        product = make_product(i)
+        row = {column: product[column] for column in COLUMNS}
+        if i % 100 == 99:
+            row["price"] = "not-a-price"
+        yield row
+
+
+async def ndjson_file():
+    buffer = []
+    size = 0
+    for row in rows():
+        line = json.dumps(row, ensure_ascii=False) + "\n"
+        buffer.append(line)
+        size += len(line)
+        if size >= CHUNK:
+            yield "".join(buffer).encode("utf-8")
+            buffer, size = [], 0
+    yield "".join(buffer).encode("utf-8")
+
+
+async def csv_file():
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    for row in rows():
+        writer.writerow([row[column] for column in COLUMNS])
+        if buffer.tell() >= CHUNK:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+
+def max_rss_mb():
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+async def measure(label, run):
+    tracemalloc.start()
+    started = time.perf_counter()
+    count = await run()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "run": label,
+        "rows": count,
+        "seconds": round(elapsed, 2),
+        "rows_per_s": int(count / elapsed),
+        "py_peak_mb": round(peak / 2**20, 1),
+        "max_rss_mb": max_rss_mb(),
+    }
+
+
+async def main():
+    async with bench_db("catalog_io") as db:
+        ProductCreate = load_server(db).ProductCreate
+        await db.products.create_indexes(INDEXES["products"])
+        results = []
+
+        for fmt, source in (("ndjson", ndjson_file), ("csv", csv_file)):
+            await db.products.delete_many({})
+
+            async def run_import():
+                report = await import_products(db, source(), fmt, ProductCreate)
+                assert report["failed"] == ROWS // 100, report["failed"]
+                return report["rows"]
+
+            results.append(await measure(f"import {fmt}", run_import))
+
+        for fmt in ("ndjson", "csv"):
+            async def run_export():
+                lines = 0
+                async for chunk in export_products(db, fmt, ["id", *COLUMNS, "created_at"]):
+                    lines += chunk.count(b"\n")
+                return lines - (1 if fmt == "csv" else 0)
+
+            results.append(await measure(f"export {fmt}", run_export))
+
+        print_table(
+            f"bulk catalog I/O, {ROWS} rows",
+            results,
+            ["run", "rows", "seconds", "rows_per_s", "py_peak_mb", "max_rss_mb"],
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
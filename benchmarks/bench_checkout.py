@@ -0,0 +1,68 @@
+"""Checkout pricing latency against cart size.
+
+Compares the old per-line ``find_one`` loop with the batched ``price_cart``
+stage for carts of 1, 10, 50 and 200 lines.
+"""
+import asyncio
+import random
+from types import SimpleNamespace
+
+from common import bench_db, make_product, print_table, summarize, timed
+
+from pricing import price_cart
+
+CART_SIZES = (1, 10, 50, 200)
+REPEAT = 50
+
+
+async def legacy_pricing(db, cart_items):
+    total_amount = 0.0
+    order_items = []
+    for cart_item in cart_items:
+        product = await db.products.find_one({"id": cart_item.product_id})
+        if not product or product["stock"] < cart_item.quantity:
+            raise RuntimeError("unexpected validation failure")
+        total_amount += product["price"] * cart_item.quantity
+        order_items.append({
+            "product_id": cart_item.product_id,
+            "name": product["name"],
+            "price": product["price"],
+            "quantity": cart_item.quantity,
+            "size": cart_item.size,
+            "color": cart_item.color,
+        })
+    return total_amount, order_items
+
+
+async def main():
+    async with bench_db("checkout") as db:
+        products = [make_product(i) for i in range(1000)]
+        await db.products.insert_many(products)
+        await db.products.create_index("id", unique=True)
+
+        rows = []
+        for size in CART_SIZES:
+            picked = random.sample(products, size)
+            cart = [
+                SimpleNamespace(product_id=p["id"], quantity=1, size=p["size"], color=p["color"])
+                for p in picked
+            ]
+            legacy = summarize(await timed(lambda: legacy_pricing(db, cart), REPEAT))
+            batched = summarize(await timed(lambda: price_cart(db, cart), REPEAT))
+            rows.append({
+                "lines": size,
+                "legacy_p50": legacy["p50_ms"],
+                "legacy_p99": legacy["p99_ms"],
+                "batched_p50": batched["p50_ms"],
+                "batched_p99": batched["p99_ms"],
+            })
+
+        print_table(
+            "Checkout pricing latency (ms)",
+            rows,
+            ["lines", "legacy_p50", "legacy_p99", "batched_p50", "batched_p99"],
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,117 @@
+"""Repeated checkout clicks and abandoned-checkout compaction.
+
+Clicks "checkout" on one unchanged cart ``CLICKS`` times one after another
+and then ``BURST`` times at once, with quote reuse off (every click opens a
+Stripe session and reserves stock, the old behaviour) and on. Stripe is the
+in-process fake with 50 ms of latency. Reports Stripe sessions and stock
+reservations created and click latency.
+
+Then seeds ``STALE`` abandoned transactions and empty carts and times one
+``Compactor`` run, printing its report.
+"""
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+
+from common import app_client, bench_db, load_server, make_product, summarize
+from fakes import FakeStripeCheckout
+
+from compaction import Compactor
+from indexes import ensure_indexes
+from payment_gateway import PaymentGateway
+
+CLICKS = 20
+BURST = 10
+STALE = 20000
+STRIPE_LATENCY = 0.05
+
+
+async def clicks(client, body):
+    latencies = []
+    for _ in range(CLICKS):
+        started = time.perf_counter()
+        response = await client.post("/api/payments/checkout/session", json=body)
+        latencies.append((time.perf_counter() - started) * 1000)
+        assert response.status_code == 200, response.text
+
+    async def click():
+        started = time.perf_counter()
+        response = await client.post("/api/payments/checkout/session", json=body)
+        latencies.append((time.perf_counter() - started) * 1000)
+        return response.json()["session_id"]
+
+    await asyncio.gather(*(click() for _ in range(BURST)))
+    return latencies
+
+
+async def bench_reuse(db, server):
+    products = [make_product(i, stock=10**6) for i in range(3)]
+    await db.products.insert_many(products)
+    body = {
+        "origin_url": "http://bench",
+        "user_email": "shopper@example.com",
+        "user_name": "Cliente",
+        "items": [{"product_id": p["id"], "quantity": 1, "size": p["size"], "color": p["color"]} for p in products],
+    }
+    server.app.state.payment_gateway = PaymentGateway(
+        "sk_test_bench",
+        client_factory=lambda api_key, webhook_url: FakeStripeCheckout(api_key, webhook_url, latency=STRIPE_LATENCY),
+    )
+    quote_ttl, quote_cache_size = server.CHECKOUT_QUOTE_TTL, server.checkout_quotes.maxsize
+    rows = []
+    async with app_client(server.app) as client:
+        for label, reuse in (("new session per click", False), ("reuse quote", True)):
+            server.CHECKOUT_QUOTE_TTL = quote_ttl if reuse else timedelta(0)
+            server.checkout_quotes.maxsize = quote_cache_size if reuse else 0
+            server.checkout_quotes.clear()
+            await db.payment_transactions.delete_many({})
+            sessions_before = len(FakeStripeCheckout.sessions)
+            latencies = await clicks(client, body)
+            stats = summarize(latencies)
+            rows.append((
+                label,
+                len(FakeStripeCheckout.sessions) - sessions_before,
+                await db.stock_reservations.count_documents({"status": "pending"}),
+                stats["p50_ms"],
+                stats["p99_ms"],
+            ))
+            await db.stock_reservations.delete_many({})
+    server.CHECKOUT_QUOTE_TTL, server.checkout_quotes.maxsize = quote_ttl, quote_cache_size
+
+    print(f"{CLICKS} sequential + {BURST} concurrent clicks on one cart")
+    print(f"{'':<24} {'sessions':>9} {'holds':>7} {'p50 ms':>8} {'p99 ms':>8}")
+    for label, sessions, holds, p50, p99 in rows:
+        print(f"{label:<24} {sessions:>9} {holds:>7} {p50:>8} {p99:>8}")
+
+
+async def bench_compaction(db):
+    now = datetime.now(timezone.utc)
+    old = now - timedelta(days=2)
+    await db.payment_transactions.insert_many([
+        {
+            "id": f"t{i}", "session_id": f"cs_stale_{i}", "amount": 99.9, "status": "pending",
+            "payment_status": "unpaid", "items": [{"product_id": "p", "quantity": 1}], "created_at": old,
+        }
+        for i in range(STALE)
+    ])
+    await db.carts.insert_many([{"id": f"c{i}", "user_id": f"u{i}", "items": []} for i in range(STALE)])
+
+    compactor = Compactor(db, batch_size=500, max_batches=STALE // 500 + 1)
+    started = time.perf_counter()
+    report = await compactor.run(now)
+    elapsed = time.perf_counter() - started
+    print(f"\ncompaction of {STALE} stale transactions and {STALE} empty carts: {elapsed * 1000:.0f} ms")
+    for key, value in report.items():
+        print(f"  {key:<34} {value}")
+
+
+async def main():
+    async with bench_db("checkout_quote") as db:
+        await ensure_indexes(db)
+        server = load_server(db)
+        await bench_reuse(db, server)
+        await bench_compaction(db)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
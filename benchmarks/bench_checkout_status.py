@@ -0,0 +1,49 @@
+"""Checkout status polling: per-request clients versus the shared gateway.
+
+A burst of concurrent polls for the same session is sent through a fresh
+``StripeCheckout`` per call (the old behaviour) and through
+``PaymentGateway``, against a fake Stripe client with 50 ms of latency.
+Reports wall time, upstream calls and client constructions.
+"""
+import asyncio
+import time
+from types import SimpleNamespace
+
+import common  # noqa: F401  (puts backend/ on sys.path)
+from fakes import FakeStripeCheckout
+
+from payment_gateway import PaymentGateway
+
+POLLS = 200
+
+
+async def main():
+    request = SimpleNamespace(amount=199.9, metadata={})
+    session = await FakeStripeCheckout("sk_test", "").create_checkout_session(request)
+
+    FakeStripeCheckout.constructed = 0
+    FakeStripeCheckout.sessions[session.session_id]["polls"] = 0
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        FakeStripeCheckout(api_key="sk_test", webhook_url="").get_checkout_status(session.session_id)
+        for _ in range(POLLS)
+    ))
+    legacy_s = time.perf_counter() - started
+    legacy_calls = FakeStripeCheckout.sessions[session.session_id]["polls"]
+    legacy_clients = FakeStripeCheckout.constructed
+
+    FakeStripeCheckout.constructed = 0
+    FakeStripeCheckout.sessions[session.session_id]["polls"] = 0
+    gateway = PaymentGateway("sk_test", client_factory=FakeStripeCheckout)
+    started = time.perf_counter()
+    await asyncio.gather(*(gateway.get_checkout_status(session.session_id) for _ in range(POLLS)))
+    pooled_s = time.perf_counter() - started
+
+    print(f"{POLLS} concurrent polls for one session")
+    print(f"per-request client: {legacy_s * 1000:7.1f} ms, {legacy_calls} upstream calls, {legacy_clients} clients")
+    print(f"shared gateway:     {pooled_s * 1000:7.1f} ms, {gateway.upstream_status_calls} upstream calls, "
+          f"{FakeStripeCheckout.constructed} clients")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,72 @@
+"""Admin dashboard cost at ``BENCH_DOCS`` paid orders (default 1M).
+
+Compares the old load-everything-and-sum approach, a server-side ``$group``
+and the pre-aggregated ``order_stats`` read the dashboard now uses.
+"""
+import asyncio
+import os
+import random
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from common import bench_db, make_product, print_table, summarize, timed
+
+from order_stats import dashboard_stats, rebuild_order_stats
+
+DOCS = int(os.environ.get("BENCH_DOCS", "1000000"))
+BATCH = 10000
+REPEAT = 5
+
+
+async def seed(db):
+    products = [make_product(i) for i in range(500)]
+    now = datetime.now(timezone.utc)
+    for offset in range(0, DOCS, BATCH):
+        orders = []
+        for _ in range(min(BATCH, DOCS - offset)):
+            items = [
+                {"product_id": p["id"], "name": p["name"], "price": p["price"],
+                 "category": p["category"], "quantity": random.randint(1, 3)}
+                for p in random.sample(products, random.randint(1, 4))
+            ]
+            orders.append({
+                "id": str(uuid.uuid4()),
+                "items": items,
+                "total_amount": sum(i["price"] * i["quantity"] for i in items),
+                "payment_status": "paid",
+                "created_at": now - timedelta(minutes=random.randint(0, 60 * 24 * 365)),
+            })
+        await db.orders.insert_many(orders, ordered=False)
+    await db.orders.create_index([("payment_status", 1), ("created_at", -1)])
+
+
+async def main():
+    async with bench_db("dashboard") as db:
+        await seed(db)
+
+        async def legacy():
+            orders = await db.orders.find({"payment_status": "paid"}).to_list(length=None)
+            return sum(order["total_amount"] for order in orders)
+
+        async def grouped():
+            return await db.orders.aggregate([
+                {"$match": {"payment_status": "paid"}},
+                {"$group": {"_id": None, "revenue": {"$sum": "$total_amount"}}},
+            ]).to_list(length=1)
+
+        started = time.perf_counter()
+        await rebuild_order_stats(db)
+        rebuild_s = time.perf_counter() - started
+
+        rows = [
+            {"approach": "legacy", **summarize(await timed(legacy, REPEAT))},
+            {"approach": "$group", **summarize(await timed(grouped, REPEAT))},
+            {"approach": "order_stats", **summarize(await timed(lambda: dashboard_stats(db), REPEAT * 20))},
+        ]
+        print_table(f"Dashboard revenue over {DOCS} orders (ms)", rows, ["approach", "p50_ms", "p99_ms"])
+        print(f"\none-off order_stats backfill: {rebuild_s:.1f} s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,64 @@
+"""Order confirmation render cost at 1, 50 and 500 line items.
+
+Compares the old f-string/``+=`` builder (as it was, and with the product
+name escaped, which the old code never did) with the compiled template,
+both per email and as a 100-email batch the way the outbox renders.
+"""
+import html
+import timeit
+
+from common import print_table
+
+from email_templates import EmailTemplates
+
+LINE_COUNTS = (1, 50, 500)
+BATCH = 100
+
+
+def legacy_render(user_name, order_id, items, total, escape=lambda value: value):
+    items_html = ""
+    for item in items:
+        items_html += f"""
+        <tr>
+            <td style="padding: 10px; border-bottom: 1px solid #eee;">{escape(item['name'])}</td>
+            <td style="padding: 10px; border-bottom: 1px solid #eee;">{item['size']}</td>
+            <td style="padding: 10px; border-bottom: 1px solid #eee;">{item['color']}</td>
+            <td style="padding: 10px; border-bottom: 1px solid #eee;">{item['quantity']}</td>
+            <td style="padding: 10px; border-bottom: 1px solid #eee;">R$ {item['price']:.2f}</td>
+        </tr>
+        """
+    return f"""
+    <html><body><h3>Detalhes do Pedido #{order_id}</h3><p>Olá {user_name},</p>
+    <table><tbody>{items_html}</tbody></table><div>Total: R$ {total:.2f}</div></body></html>
+    """
+
+
+def main():
+    templates = EmailTemplates()
+    rows = []
+    for count in LINE_COUNTS:
+        items = [
+            {"name": f"Camiseta <Oversized> {i}", "size": "M", "color": "preto", "quantity": 1, "price": 89.9}
+            for i in range(count)
+        ]
+        context = {"user_name": "Cliente", "order_id": "abc123", "items": items, "total": 89.9 * count}
+        number = max(10, 20000 // count)
+
+        legacy = timeit.timeit(lambda: legacy_render("Cliente", "abc123", items, context["total"]), number=number)
+        escaped = timeit.timeit(
+            lambda: legacy_render("Cliente", "abc123", items, context["total"], html.escape), number=number
+        )
+        compiled = timeit.timeit(lambda: templates.render("order_confirmation", context), number=number)
+        batch = timeit.timeit(lambda: templates.render_batch("order_confirmation", [context] * BATCH), number=max(1, number // BATCH))
+        rows.append({
+            "lines": count,
+            "legacy_us": round(legacy / number * 1e6, 1),
+            "escaped_us": round(escaped / number * 1e6, 1),
+            "compiled_us": round(compiled / number * 1e6, 1),
+            "batch_us_each": round(batch / (max(1, number // BATCH) * BATCH) * 1e6, 1),
+        })
+    print_table("Order confirmation render time per email", rows, ["lines", "legacy_us", "escaped_us", "compiled_us", "batch_us_each"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Catalog latency while logins are hammered.
+
+Runs a steady stream of ``GET /api/products`` requests alongside a burst of
+concurrent ``POST /api/auth/login`` calls, first with bcrypt inline on the
+event loop and then through the password pool, and reports the catalog
+p50/p99 and how many logins were shed with 429.
+"""
+import asyncio
+import time
+
+from common import app_client, bench_db, load_server, make_product, summarize
+
+from password_pool import PasswordPool, hash_password
+
+LOGIN_CONCURRENCY = 64
+LOGINS = 400
+CATALOG_CONCURRENCY = 4
+DURATION_S = 10.0
+
+
+async def scenario(server, pool):
+    server.password_pool = pool
+    # Measure the database and handler, not the catalog cache
+    server.catalog_cache = server.CatalogCache(maxsize=0)
+    latencies = []
+    statuses = {}
+    deadline = time.perf_counter() + DURATION_S
+
+    async with app_client(server.app) as client:
+        async def browse():
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                response = await client.get("/api/products")
+                latencies.append((time.perf_counter() - started) * 1000)
+                assert response.status_code == 200
+
+        remaining = LOGINS
+
+        async def login():
+            nonlocal remaining
+            while remaining > 0 and time.perf_counter() < deadline:
+                remaining -= 1
+                response = await client.post(
+                    "/api/auth/login", json={"email": "shopper@example.com", "password": "correct horse"}
+                )
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        await asyncio.gather(
+            *(browse() for _ in range(CATALOG_CONCURRENCY)),
+            *(login() for _ in range(LOGIN_CONCURRENCY)),
+        )
+    pool.shutdown()
+    return summarize(latencies), statuses
+
+
+async def main():
+    async with bench_db("login_load") as db:
+        server = load_server(db)
+        await db.products.insert_many([make_product(i) for i in range(200)])
+        user = server.User(
+            email="shopper@example.com", name="Shopper", password_hash=hash_password("correct horse")
+        )
+        await db.users.insert_one(user.dict())
+        await server.ensure_indexes(db)
+
+        for label, pool in (
+            ("inline", PasswordPool(workers=0)),
+            ("pool", PasswordPool(workers=2, max_queue=16)),
+        ):
+            catalog, statuses = await scenario(server, pool)
+            print(f"{label:>6}: products p50 {catalog['p50_ms']:7.1f} ms  p99 {catalog['p99_ms']:7.1f} ms"
+                  f"  ({catalog['n']} requests)  logins {statuses}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
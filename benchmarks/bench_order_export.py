@@ -0,0 +1,119 @@
+"""Streaming order export: time to first byte, total time and RSS.
+
+Seeds ``BENCH_ORDERS`` orders (default 1M) with 1-4 line items each, then
+drives the same generators the ``/api/admin/orders/export`` endpoint
+streams (``encode_rows`` over ``order_lines`` or ``daily_totals``) and
+discards the bytes. RSS is sampled from /proc every 50 ms while a run is
+in progress. If memory is constant, the peak stays close to the starting
+value regardless of how many orders are exported.
+"""
+import asyncio
+import os
+import random
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from common import bench_db, print_table
+
+from bulk_io import encode_rows
+from indexes import INDEXES
+from order_export import DAILY_COLUMNS, EXPORT_COLUMNS, daily_totals, order_filter, order_lines
+
+ORDERS = int(os.environ.get("BENCH_ORDERS", "1000000"))
+BATCH = 10000
+START = datetime(2023, 1, 1, tzinfo=timezone.utc)
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+def rss_mb():
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * PAGE_SIZE / 2**20
+
+
+async def seed(db):
+    rng = random.Random(16)
+    for offset in range(0, ORDERS, BATCH):
+        batch = []
+        for i in range(offset, min(offset + BATCH, ORDERS)):
+            items = [
+                {
+                    "product_id": f"p{rng.randrange(2000)}",
+                    "name": f"Produto {n}",
+                    "category": rng.choice(("camisetas", "moletons", "calcas", "bones")),
+                    "size": rng.choice(("P", "M", "G")),
+                    "color": rng.choice(("preto", "branco")),
+                    "quantity": rng.randint(1, 3),
+                    "price": 89.9,
+                }
+                for n in range(rng.randint(1, 4))
+            ]
+            batch.append({
+                "id": str(uuid.uuid4()),
+                "user_id": f"u{i % 20000}",
+                "user_email": f"user{i % 20000}@example.com",
+                "user_name": "Cliente",
+                "items": items,
+                "total_amount": round(sum(item["price"] * item["quantity"] for item in items), 2),
+                "status": "confirmed",
+                "payment_status": rng.choice(("paid", "paid", "paid", "pending")),
+                "session_id": f"cs_{i}",
+                "created_at": START + timedelta(seconds=30 * i),
+            })
+        await db.orders.insert_many(batch, ordered=False)
+    await db.orders.create_indexes(INDEXES["orders"])
+
+
+async def measure(label, chunks):
+    peak = start_rss = rss_mb()
+    done = asyncio.Event()
+
+    async def sample():
+        nonlocal peak
+        while not done.is_set():
+            peak = max(peak, rss_mb())
+            await asyncio.sleep(0.05)
+
+    sampler = asyncio.create_task(sample())
+    started = time.perf_counter()
+    first_byte = None
+    size = 0
+    async for chunk in chunks:
+        if first_byte is None:
+            first_byte = time.perf_counter() - started
+        size += len(chunk)
+    total = time.perf_counter() - started
+    done.set()
+    await sampler
+    return {
+        "export": label,
+        "ttfb_ms": round((first_byte or total) * 1000, 1),
+        "total_s": round(total, 2),
+        "mb_out": round(size / 2**20, 1),
+        "rss_start_mb": round(start_rss, 1),
+        "rss_peak_mb": round(max(peak, rss_mb()), 1),
+    }
+
+
+async def main():
+    async with bench_db("order_export") as db:
+        await seed(db)
+        half = START + timedelta(seconds=30 * ORDERS // 2)
+        everything = order_filter()
+        paid_second_half = order_filter(start=half, payment_status="paid")
+
+        results = [
+            await measure("lines ndjson", encode_rows(order_lines(db, everything), "ndjson", EXPORT_COLUMNS)),
+            await measure("lines csv", encode_rows(order_lines(db, everything), "csv", EXPORT_COLUMNS)),
+            await measure("paid, 2nd half", encode_rows(order_lines(db, paid_second_half), "csv", EXPORT_COLUMNS)),
+            await measure("daily csv", encode_rows(daily_totals(db, everything), "csv", DAILY_COLUMNS)),
+        ]
+        print_table(
+            f"order export over {ORDERS} orders",
+            results,
+            ["export", "ttfb_ms", "total_s", "mb_out", "rss_start_mb", "rss_peak_mb"],
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,57 @@
+"""Email outbox drain throughput.
+
+Enqueues ``BENCH_EMAILS`` confirmations (plus duplicates, which must be
+dropped), then drains them through a recording transport that adds a fixed
+per-send latency and fails every 10th call, and reports sends/sec.
+"""
+import asyncio
+import os
+import time
+
+from common import bench_db
+
+from email_outbox import OutboxWorker, RecordingTransport, enqueue_email
+from email_templates import EmailTemplates
+from indexes import INDEXES
+
+EMAILS = int(os.environ.get("BENCH_EMAILS", "5000"))
+SEND_LATENCY_S = 0.02
+
+
+class SlowTransport(RecordingTransport):
+    async def send(self, message):
+        await asyncio.sleep(SEND_LATENCY_S)
+        await super().send(message)
+
+
+def context(order_number):
+    item = {"name": "Camiseta", "size": "M", "color": "preto", "quantity": 1, "price": 89.9}
+    return {"user_name": "Cliente", "order_id": str(order_number), "items": [item] * 3, "total": 269.7}
+
+
+async def main():
+    async with bench_db("outbox") as db:
+        await db.email_outbox.create_indexes(INDEXES["email_outbox"])
+        for i in range(EMAILS):
+            await enqueue_email(db, "order_confirmation", f"order_confirmation:{i}", f"u{i}@example.com", context(i))
+        duplicates = sum([
+            not await enqueue_email(db, "order_confirmation", f"order_confirmation:{i}", "x@example.com", context(i))
+            for i in range(0, EMAILS, 10)
+        ])
+
+        transport = SlowTransport(fail_every=10)
+        worker = OutboxWorker(db, transport, EmailTemplates(), batch_size=100, backoff_base=0)
+        started = time.perf_counter()
+        while await db.email_outbox.count_documents({"status": {"$ne": "sent"}}):
+            await worker.process_batch()
+        elapsed = time.perf_counter() - started
+
+        delivered = {m.id for m in transport.sent}
+        assert len(delivered) == len(transport.sent) == EMAILS, "lost or duplicated email"
+        print(f"emails: {EMAILS}, duplicate enqueues dropped: {duplicates}")
+        print(f"drained in {elapsed:.2f} s: {EMAILS / elapsed:.0f} emails/s")
+        print(f"worker counters: {await worker.stats()}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
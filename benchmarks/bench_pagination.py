@@ -0,0 +1,72 @@
+"""Page-N latency for skip/limit versus keyset cursors.
+
+Seeds ``BENCH_DOCS`` orders (default 1M) and times fetching page N of 50
+both ways. With the ``orders_recent`` index, cursor pages stay flat while
+skip pages grow with N.
+"""
+import asyncio
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from common import bench_db, print_table, summarize, timed
+
+from indexes import INDEXES
+from pagination import KEYSET_SORT, encode_cursor, with_keyset
+
+DOCS = int(os.environ.get("BENCH_DOCS", "1000000"))
+PAGE = 50
+BATCH = 10000
+REPEAT = 20
+
+
+async def seed(db):
+    start = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    for offset in range(0, DOCS, BATCH):
+        await db.orders.insert_many([
+            {
+                "id": str(uuid.uuid4()),
+                "user_email": f"user{i % 5000}@example.com",
+                "total_amount": 100.0,
+                "payment_status": "paid",
+                "created_at": start + timedelta(seconds=i),
+            }
+            for i in range(offset, min(offset + BATCH, DOCS))
+        ], ordered=False)
+    await db.orders.create_indexes(INDEXES["orders"])
+
+
+async def main():
+    async with bench_db("pagination") as db:
+        await seed(db)
+        pages = [n for n in (1, 10, 100, 1000, 10000) if n * PAGE < DOCS]
+
+        rows = []
+        for page in pages:
+            skip = (page - 1) * PAGE
+            # Cursor for the start of page N: the last document of page N-1
+            cursor = None
+            if skip:
+                last = await db.orders.find().sort(KEYSET_SORT).skip(skip - 1).limit(1).to_list(1)
+                cursor = encode_cursor(last[0])
+
+            def by_skip():
+                return db.orders.find().sort(KEYSET_SORT).skip(skip).limit(PAGE).to_list(PAGE)
+
+            def by_cursor():
+                return db.orders.find(with_keyset({}, cursor)).sort(KEYSET_SORT).limit(PAGE).to_list(PAGE)
+
+            skip_stats = summarize(await timed(by_skip, REPEAT))
+            cursor_stats = summarize(await timed(by_cursor, REPEAT))
+            rows.append({
+                "page": page,
+                "skip_p50": skip_stats["p50_ms"],
+                "cursor_p50": cursor_stats["p50_ms"],
+                "cursor_p99": cursor_stats["p99_ms"],
+            })
+
+        print_table(f"Page latency over {DOCS} orders (ms)", rows, ["page", "skip_p50", "cursor_p50", "cursor_p99"])
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,70 @@
+"""Flash-sale concurrency check for stock reservations.
+
+Fires hundreds of parallel checkouts at one low-stock SKU, then pays for
+half of the successful reservations and lets the rest expire. The run fails
+if more units were reserved than existed or if stock ever ends up negative.
+"""
+import asyncio
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from common import bench_db, make_product
+
+from reservations import (
+    StockUnavailable, commit_reservation, release_expired_reservations, reserve_stock
+)
+
+STOCK = 25
+CHECKOUTS = 500
+TTL = timedelta(minutes=30)
+
+
+async def attempt(db, product_id):
+    try:
+        return await reserve_stock(db, {product_id: random.choice((1, 1, 1, 2))}, TTL)
+    except StockUnavailable:
+        return None
+
+
+async def main():
+    async with bench_db("reservation") as db:
+        product = make_product(0, stock=STOCK)
+        await db.products.insert_one(product)
+        await db.products.create_index("id", unique=True)
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(attempt(db, product["id"]) for _ in range(CHECKOUTS)))
+        elapsed = time.perf_counter() - started
+
+        reserved = [rid for rid in results if rid]
+        reserved_units = sum([
+            r["items"][0]["quantity"]
+            async for r in db.stock_reservations.find({"id": {"$in": reserved}})
+        ])
+        after_reserve = await db.products.find_one({"id": product["id"]})
+
+        paid = reserved[: len(reserved) // 2]
+        await asyncio.gather(*(commit_reservation(db, rid) for rid in paid))
+        await release_expired_reservations(db, now=datetime.now(timezone.utc) + TTL * 2)
+        final = await db.products.find_one({"id": product["id"]})
+        paid_units = reserved_units - sum([
+            r["items"][0]["quantity"]
+            async for r in db.stock_reservations.find({"status": "released", "id": {"$in": reserved}})
+        ])
+
+        print(f"checkouts:           {CHECKOUTS}")
+        print(f"successful holds:    {len(reserved)} ({reserved_units} units of {STOCK})")
+        print(f"stock after holds:   {after_reserve['stock']}")
+        print(f"stock after settle:  {final['stock']} (paid {paid_units} units)")
+        print(f"throughput:          {CHECKOUTS / elapsed:.0f} reservations/s ({elapsed * 1000:.1f} ms)")
+
+        assert reserved_units <= STOCK, "oversold"
+        assert after_reserve["stock"] == STOCK - reserved_units >= 0
+        assert final["stock"] == STOCK - paid_units
+        assert not final.get("holds"), "dangling holds"
+        print("OK: no overselling")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,89 @@
+"""Catalog search latency on a large synthetic catalog.
+
+Seeds ``BENCH_PRODUCTS`` products (default 500k) with names and
+descriptions drawn from a small clothing vocabulary, builds the product
+indexes and times ``search_products`` (one aggregation: results, total and
+facets) for common query/filter combinations. The catalog cache is not
+involved, so these are cold-path numbers.
+"""
+import asyncio
+import os
+import random
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from common import bench_db, make_product, print_table, summarize, timed
+
+from indexes import INDEXES
+from product_search import search_filter, search_products
+
+PRODUCTS = int(os.environ.get("BENCH_PRODUCTS", "500000"))
+BATCH = 10000
+REPEAT = 20
+
+GARMENTS = ["camiseta", "moletom", "calça", "boné", "jaqueta", "bermuda", "regata", "camisa"]
+STYLES = ["oversized", "básica", "estampada", "listrada", "vintage", "slim", "cargo", "tie-dye"]
+MATERIALS = ["algodão", "linho", "jeans", "poliéster", "moletinho", "sarja"]
+
+SCENARIOS = [
+    ("text", {"q": "camiseta"}, "relevance"),
+    ("text, two words", {"q": "jaqueta jeans"}, "relevance"),
+    ("text + category", {"q": "vintage", "category": "camisetas"}, "relevance"),
+    ("text + size + color", {"q": "oversized", "size": "M", "color": "preto"}, "relevance"),
+    ("text + price, by price", {"q": "algodão", "min_price": 50, "max_price": 150}, "price_asc"),
+    ("category only", {"category": "moletons"}, "newest"),
+    ("category + size + color", {"category": "camisetas", "size": "G", "color": "azul"}, "newest"),
+    ("in stock, no filters", {"in_stock": True}, "newest"),
+]
+PAGES = (1, 10)
+PAGE_SIZE = 24
+
+
+async def seed(db):
+    rng = random.Random(14)
+    start = datetime(2022, 1, 1, tzinfo=timezone.utc)
+    for offset in range(0, PRODUCTS, BATCH):
+        batch = []
+        for i in range(offset, min(offset + BATCH, PRODUCTS)):
+            garment, style, material = rng.choice(GARMENTS), rng.choice(STYLES), rng.choice(MATERIALS)
+            batch.append(make_product(
+                i,
+                id=str(uuid.uuid4()),
+                name=f"{garment.title()} {style} {i}",
+                description=f"{garment.title()} {style} em {material}, modelagem urbana.",
+                stock=rng.choice((0, 5, 50)),
+                created_at=start + timedelta(seconds=i),
+            ))
+        await db.products.insert_many(batch, ordered=False)
+    await db.products.create_indexes(INDEXES["products"])
+
+
+async def main():
+    async with bench_db("search") as db:
+        await seed(db)
+
+        rows = []
+        for label, filters, sort in SCENARIOS:
+            query = search_filter(**filters)
+            for page in PAGES:
+                offset = (page - 1) * PAGE_SIZE
+                first = await search_products(db, query, sort=sort, offset=offset, limit=PAGE_SIZE)
+                stats = summarize(await timed(
+                    lambda: search_products(db, query, sort=sort, offset=offset, limit=PAGE_SIZE), REPEAT
+                ))
+                rows.append({
+                    "scenario": label[:24],
+                    "page": page,
+                    "matches": first["total"],
+                    "p50_ms": stats["p50_ms"],
+                    "p95_ms": stats["p95_ms"],
+                })
+        print_table(
+            f"search_products over {PRODUCTS} products (results + total + 4 facets per call)",
+            rows,
+            ["scenario", "page", "matches", "p50_ms", "p95_ms"],
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,74 @@
+"""Serialization cost of one 50-item page, before and after the lean path.
+
+"before" is what a list endpoint used to do with the documents it read:
+build a model per document, let the ``response_model`` validate the list
+again, run ``jsonable_encoder`` and ``json.dumps``. "after" encodes the
+projected documents with ``render_json`` (orjson). Pure CPU: no database
+is involved.
+"""
+import json
+import timeit
+import uuid
+from datetime import datetime, timezone
+from typing import List
+
+from common import make_product, print_table
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+import server
+
+PAGE = 50
+NUMBER = 200
+
+
+def legacy_render(model, documents):
+    models = [model(**document) for document in documents]
+    validated = TypeAdapter(List[model]).validate_python(models)
+    return json.dumps(
+        jsonable_encoder(validated), ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":"),
+    ).encode("utf-8")
+
+
+def make_order(index):
+    return {
+        "id": str(uuid.uuid4()),
+        "user_id": str(uuid.uuid4()),
+        "user_email": f"user{index}@example.com",
+        "user_name": "Cliente Urbano",
+        "items": [
+            {"product_id": str(uuid.uuid4()), "name": f"Produto {n}", "price": 89.9, "category": "camisetas",
+             "quantity": 2, "size": "M", "color": "preto"}
+            for n in range(3)
+        ],
+        "total_amount": 539.4,
+        "status": "confirmed",
+        "payment_status": "paid",
+        "session_id": f"cs_test_{index}",
+        "created_at": datetime.now(timezone.utc),
+    }
+
+
+def main():
+    now = datetime.now(timezone.utc)
+    pages = {
+        "products": (server.Product, [make_product(i, created_at=now) for i in range(PAGE)]),
+        "orders": (server.Order, [make_order(i) for i in range(PAGE)]),
+    }
+    rows = []
+    for name, (model, documents) in pages.items():
+        assert json.loads(legacy_render(model, documents)) == json.loads(server.render_json(documents))
+        before = timeit.timeit(lambda: legacy_render(model, documents), number=NUMBER) / NUMBER
+        after = timeit.timeit(lambda: server.render_json(documents), number=NUMBER) / NUMBER
+        rows.append({
+            "page": name,
+            "before_us": round(before * 1e6, 1),
+            "after_us": round(after * 1e6, 1),
+            "speedup": f"{before / after:.1f}x",
+        })
+    print_table(f"serializing a {PAGE}-item page", rows, ["page", "before_us", "after_us", "speedup"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""Cold start: import time, time to first 200 and time to ready.
+
+Each measurement runs in a fresh interpreter, as a new worker or replica
+would:
+
+* import: wall time of ``import server`` over a bare interpreter start
+  (median of ``--repeat`` runs), plus a ``-X importtime`` breakdown of where
+  it goes, summed per top-level package;
+* first 200: uvicorn is started on the app and ``GET /api/`` is polled until
+  it answers 200 (the worker accepts traffic), then ``GET /api/ready`` until
+  the background warm-up has finished.
+
+The server run needs a local mongod (``MONGO_URL``) and uses an empty
+throwaway database, dropped afterwards. Every run is appended as one JSON
+line to ``--history`` and compared with the previous line, so the numbers
+can be followed from commit to commit::
+
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --history startup_history.jsonl --top 25
+"""
+import argparse
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from common import BACKEND_DIR, MONGO_URL
+
+READY_TIMEOUT = 120.0
+POLL_SECONDS = 0.01
+
+
+def server_env(db_name):
+    env = dict(os.environ, MONGO_URL=MONGO_URL, DB_NAME=db_name)
+    env.setdefault("SECRET_KEY", "bench-startup")
+    return env
+
+
+def run_python(args, env):
+    started = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, *args], cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+    )
+    return time.perf_counter() - started, completed.stderr
+
+
+def import_time(env, repeat):
+    bare = statistics.median(run_python(["-c", "pass"], env)[0] for _ in range(repeat))
+    loaded = statistics.median(run_python(["-c", "import server"], env)[0] for _ in range(repeat))
+    return loaded - bare
+
+
+def import_breakdown(env):
+    """Self time per top-level package from ``-X importtime``, in ms."""
+    _, stderr = run_python(["-X", "importtime", "-c", "import server"], env)
+    packages = defaultdict(float)
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|", 2)
+        packages[name.strip().split(".")[0]] += int(self_us) / 1000
+    return dict(sorted(packages.items(), key=lambda item: item[1], reverse=True))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(url, deadline):
+    while time.perf_counter() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    return True
+        except (urllib.error.URLError, ConnectionError, OSError):
+            pass
+        time.sleep(POLL_SECONDS)
+    return False
+
+
+def time_to_first_200(env):
+    port = free_port()
+    base = f"http://127.0.0.1:{port}/api"
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env,
+    )
+    try:
+        deadline = started + READY_TIMEOUT
+        if not wait_for(f"{base}/", deadline):
+            raise RuntimeError("server never answered GET /api/")
+        live = time.perf_counter() - started
+        if not wait_for(f"{base}/ready", deadline):
+            raise RuntimeError("server never became ready")
+        ready = time.perf_counter() - started
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+    return live, ready
+
+
+def drop_database(db_name):
+    from pymongo import MongoClient
+
+    client = MongoClient(MONGO_URL)
+    try:
+        client.drop_database(db_name)
+    finally:
+        client.close()
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def last_entry(path):
+    try:
+        with open(path) as history:
+            lines = [line for line in history if line.strip()]
+    except FileNotFoundError:
+        return None
+    return json.loads(lines[-1]) if lines else None
+
+
+def change(now, before):
+    if before is None:
+        return ""
+    delta = now - before
+    return f"  ({delta:+.0f} ms)" if abs(delta) >= 1 else ""
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold start of the API")
+    parser.add_argument("--repeat", type=int, default=5, help="interpreter starts per import measurement")
+    parser.add_argument("--top", type=int, default=15, help="packages to list in the import breakdown")
+    parser.add_argument("--history", default="startup_history.jsonl")
+    parser.add_argument("--no-server", action="store_true", help="only measure imports (no mongod needed)")
+    args = parser.parse_args()
+
+    db_name = f"bench_startup_{uuid.uuid4().hex[:8]}"
+    env = server_env(db_name)
+    result = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "finished_at": None,
+        "import_ms": round(import_time(env, args.repeat) * 1000, 1),
+        "packages_ms": {name: round(ms, 1) for name, ms in import_breakdown(env).items()},
+        "first_200_ms": None,
+        "ready_ms": None,
+    }
+    if not args.no_server:
+        try:
+            live, ready = time_to_first_200(env)
+        finally:
+            drop_database(db_name)
+        result["first_200_ms"] = round(live * 1000, 1)
+        result["ready_ms"] = round(ready * 1000, 1)
+    result["finished_at"] = datetime.now(timezone.utc).isoformat()
+
+    previous = last_entry(args.history)
+    before = previous or {}
+    print(f"import server      {result['import_ms']:>9} ms{change(result['import_ms'], before.get('import_ms'))}")
+    for key, label in (("first_200_ms", "first 200"), ("ready_ms", "ready")):
+        if result[key] is not None:
+            print(f"{label:<18} {result[key]:>9} ms{change(result[key], before.get(key))}")
+    print(f"\nself import time by package (-X importtime), top {args.top}")
+    previous_packages = before.get("packages_ms", {})
+    for name, ms in list(result["packages_ms"].items())[:args.top]:
+        print(f"  {name:<32} {ms:>9} ms{change(ms, previous_packages.get(name))}")
+    if previous:
+        print(f"\ncompared with {previous.get('revision') or 'unknown revision'} at {previous.get('finished_at')}")
+
+    with open(args.history, "a") as history:
+        history.write(json.dumps(result, sort_keys=True) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Duplicate and out-of-order webhook deliveries.
+
+Creates ``SESSIONS`` paid checkouts with stock reservations, then delivers
+every completion event several times, interleaved with stale "open" reports,
+late "expired" events and browser polls, all concurrently and shuffled. The
+run fails unless each session produced exactly one order, one email and one
+stock decrement, and the stats count every order once. Orders are built
+by the app's own ``build_order`` so the run fails if it cannot build one.
+"""
+import asyncio
+import random
+import time
+import uuid
+from datetime import timedelta
+
+from common import bench_db, load_server, make_product
+
+from finalization import OrderFinalizer
+from indexes import ensure_indexes
+from order_stats import TOTALS_ID
+from reservations import attach_session, reserve_stock
+
+SESSIONS = 300
+DELIVERIES_PER_SESSION = 4
+STOCK = 10000
+
+
+async def deliver(finalizer, event):
+    kind, session_id, event_id = event
+    if event_id and not await finalizer.record_event(event_id, kind):
+        return "duplicate"
+    if kind == "completed":
+        await finalizer.apply_status(session_id, "complete", "paid")
+    elif kind == "expired":
+        await finalizer.apply_status(session_id, "expired", "unpaid")
+    else:
+        await finalizer.apply_status(session_id, "open", "unpaid")
+    return "processed"
+
+
+async def main():
+    async with bench_db("webhook_replay") as db:
+        server = load_server(db)
+        await ensure_indexes(db)
+        product = make_product(0, stock=STOCK)
+        await db.products.insert_one(product)
+
+        sessions = []
+        for i in range(SESSIONS):
+            session_id = f"cs_test_{uuid.uuid4().hex}"
+            reservation_id = await reserve_stock(db, {product["id"]: 1}, timedelta(minutes=30))
+            await attach_session(db, reservation_id, session_id)
+            items = [{"product_id": product["id"], "name": product["name"], "price": product["price"],
+                      "category": product["category"], "quantity": 1, "size": "M", "color": "preto"}]
+            await db.payment_transactions.insert_one(server.PaymentTransaction(
+                session_id=session_id, user_id=f"u{i}", user_email=f"u{i}@example.com", user_name="Cliente",
+                amount=product["price"], status="open", payment_status="unpaid",
+                reservation_id=reservation_id, items=items,
+                metadata={"user_email": f"u{i}@example.com", "user_name": "Cliente"},
+            ).dict())
+            sessions.append(session_id)
+
+        events = []
+        for session_id in sessions:
+            completed = f"evt_{uuid.uuid4().hex}"
+            events += [("completed", session_id, completed)] * DELIVERIES_PER_SESSION
+            events += [("open", session_id, f"evt_{uuid.uuid4().hex}")]
+            events += [("expired", session_id, f"evt_{uuid.uuid4().hex}")]
+            events += [("completed", session_id, None)] * 2  # browser polls carry no event id
+        random.shuffle(events)
+
+        finalizer = OrderFinalizer(db, server.build_order)
+        started = time.perf_counter()
+        results = await asyncio.gather(*(deliver(finalizer, event) for event in events))
+        elapsed = time.perf_counter() - started
+
+        orders = await db.orders.count_documents({})
+        per_session = await db.orders.aggregate([{"$group": {"_id": "$session_id", "n": {"$sum": 1}}}]).to_list(None)
+        emails = await db.email_outbox.count_documents({})
+        stock = (await db.products.find_one({"id": product["id"]}))["stock"]
+        totals = await db.order_stats.find_one({"_id": TOTALS_ID})
+        unfinished = await db.payment_transactions.count_documents({"finalization.completed_at": {"$exists": False}})
+
+        print(f"events: {len(events)} ({results.count('duplicate')} duplicates skipped) in {elapsed:.2f} s "
+              f"= {len(events) / elapsed:.0f} events/s")
+        print(f"orders: {orders}, emails: {emails}, stock: {stock}, stats paid_orders: {totals['paid_orders']}")
+        assert orders == SESSIONS and all(g["n"] == 1 for g in per_session), "duplicate or missing orders"
+        assert emails == SESSIONS, "duplicate or missing emails"
+        assert stock == STOCK - SESSIONS, "stock decremented more or less than once per order"
+        assert totals["paid_orders"] == SESSIONS, "stats double counted"
+        assert unfinished == 0
+        print("OK: exactly-once finalization")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
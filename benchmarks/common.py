@@ -0,0 +1,102 @@
+"""Shared helpers for the benchmark scripts.
+
+Benchmarks run against a local mongod (``MONGO_URL``, default
+``mongodb://localhost:27017``) in a throwaway database that is dropped
+when the run finishes. They import backend modules directly, so run them
+from the repository root, e.g. ``python benchmarks/bench_checkout.py``.
+"""
+import os
+import statistics
+import sys
+import time
+import uuid
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+MONGO_URL = os.environ.get("MONGO_URL", "mongodb://localhost:27017")
+
+
+@asynccontextmanager
+async def bench_db(name: str):
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    client = AsyncIOMotorClient(MONGO_URL)
+    db_name = f"bench_{name}_{uuid.uuid4().hex[:8]}"
+    try:
+        yield client[db_name]
+    finally:
+        await client.drop_database(db_name)
+        client.close()
+
+
+def load_server(db):
+    """Import the FastAPI app and point it at ``db``.
+
+    Rate limiting is switched off: every in-process request comes from one
+    client address, so the limits would measure the limiter instead of the
+    code under test (``bench_admission.py`` measures the limiter itself).
+    """
+    import server
+
+    server.db = db
+    server.admission_control.enabled = False
+    return server
+
+
+def app_client(app):
+    """An httpx client that talks to ``app`` in-process (no lifespan events)."""
+    import httpx
+
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench")
+
+
+def make_product(index: int, **overrides) -> dict:
+    product = {
+        "id": str(uuid.uuid4()),
+        "name": f"Produto {index}",
+        "description": f"Peça urbana número {index}",
+        "price": round(49.9 + (index % 40) * 5, 2),
+        "category": ("camisetas", "moletons", "calcas", "bones")[index % 4],
+        "size": ("P", "M", "G", "GG")[index % 4],
+        "color": ("preto", "branco", "cinza", "verde", "azul")[index % 5],
+        "stock": 1000,
+        "image_url": f"https://example.com/img/{index}.jpg",
+    }
+    product.update(overrides)
+    return product
+
+
+async def timed(coro_factory, repeat: int):
+    """Await ``coro_factory()`` ``repeat`` times and return latencies in ms."""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await coro_factory()
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def summarize(samples):
+    ordered = sorted(samples)
+
+    def pct(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+    return {
+        "n": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered), 3),
+        "p50_ms": round(pct(50), 3),
+        "p95_ms": round(pct(95), 3),
+        "p99_ms": round(pct(99), 3),
+    }
+
+
+def print_table(title, rows, columns):
+    print(f"\n{title}")
+    print("  ".join(f"{c:>12}" for c in columns))
+    for row in rows:
+        print("  ".join(f"{row.get(c, ''):>12}" for c in columns))
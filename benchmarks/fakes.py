@@ -0,0 +1,41 @@
+"""In-process stand-ins for the payment and email integrations.
+
+``FakeStripeCheckout`` mimics the ``StripeCheckout`` surface the app uses,
+with a configurable per-call latency standing in for the network round
+trip, and marks sessions paid after a number of status polls.
+"""
+import asyncio
+import uuid
+from types import SimpleNamespace
+
+
+class FakeStripeCheckout:
+    sessions = {}
+    constructed = 0
+
+    def __init__(self, api_key, webhook_url, latency=0.05, polls_until_paid=2):
+        type(self).constructed += 1
+        self.latency = latency
+        self.polls_until_paid = polls_until_paid
+
+    async def create_checkout_session(self, request):
+        await asyncio.sleep(self.latency)
+        session_id = f"cs_test_{uuid.uuid4().hex}"
+        self.sessions[session_id] = {"polls": 0, "amount": request.amount, "metadata": request.metadata}
+        return SimpleNamespace(session_id=session_id, url=f"https://checkout.stripe.test/{session_id}")
+
+    async def get_checkout_status(self, session_id):
+        await asyncio.sleep(self.latency)
+        session = self.sessions[session_id]
+        session["polls"] += 1
+        paid = session["polls"] >= self.polls_until_paid
+        return SimpleNamespace(
+            status="complete" if paid else "open",
+            payment_status="paid" if paid else "unpaid",
+            amount_total=int(round(session["amount"] * 100)),
+            currency="brl",
+            metadata=session["metadata"],
+        )
+
+    async def handle_webhook(self, body, signature):
+        return SimpleNamespace(event_type="checkout.session.completed", event_id=None, session_id=None)
@@ -0,0 +1,287 @@
+"""Scripted load test for the whole API, in process.
+
+Seeds a throwaway database (see ``seed.py``), runs the app's startup hooks
+against it with ``FakeStripeCheckout`` in place of Stripe and a
+``RecordingTransport`` in place of SendGrid, then has ``--concurrency``
+virtual shoppers run a weighted mix of scenarios for ``--duration``
+seconds:
+
+* browse: first catalog page, a category page, the next page by cursor,
+  one product
+* search: a text query with a size facet
+* add_to_cart: add a line, read the cart
+* checkout: create a session, poll its status until the fake marks it paid
+* admin_dashboard: the dashboard as an admin
+
+Per endpoint (method and route template) it reports requests, errors,
+throughput and p50/p95/p99, and writes them as JSON::
+
+    python benchmarks/load_test.py --scale small --out results.json
+    python benchmarks/load_test.py --scale small --baseline baseline.json
+
+With ``--baseline`` every endpoint is compared with the stored run. The
+exit status is 1 when a p95 grows, or a throughput drops, by more than
+``--tolerance``. Use ``--save-baseline`` to write the current run as the
+new baseline.
+"""
+import argparse
+import asyncio
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from common import app_client, bench_db, load_server, summarize
+from fakes import FakeStripeCheckout
+from seed import ADMIN_EMAIL, SCALES, seed
+
+from email_outbox import RecordingTransport
+from payment_gateway import PaymentGateway
+
+SCENARIOS = {
+    "browse": 40,
+    "search": 20,
+    "add_to_cart": 20,
+    "checkout": 10,
+    "admin_dashboard": 10,
+}
+SEARCH_TERMS = ["camiseta", "moletom oversized", "jaqueta", "boné vintage", "calça cargo", "bermuda"]
+STRIPE_LATENCY = 0.02
+POLLS_UNTIL_PAID = 2
+# The storefront polls checkout status on a timer; the gateway's status
+# cache is kept shorter so every poll after the first sees fresh state
+POLL_INTERVAL = 0.25
+STATUS_TTL = 0.1
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.scenarios = defaultdict(int)
+
+    async def call(self, client, label, method, url, **kwargs):
+        started = time.perf_counter()
+        response = await client.request(method, url, **kwargs)
+        self.latencies[label].append((time.perf_counter() - started) * 1000)
+        if response.status_code >= 400:
+            self.errors[label] += 1
+        return response
+
+
+class Shopper:
+    def __init__(self, server, client, recorder, shop, rng):
+        self.client = client
+        self.recorder = recorder
+        self.shop = shop
+        self.rng = rng
+        user = rng.choice(shop["users"])
+        self.user = user
+        self.headers = {"Authorization": f"Bearer {server.create_access_token(server.token_claims(user))}"}
+        self.admin_headers = {
+            "Authorization": f"Bearer {server.create_access_token(server.token_claims(shop['admin']))}"
+        }
+
+    def call(self, label, method, url, **kwargs):
+        return self.recorder.call(self.client, label, method, url, **kwargs)
+
+    async def browse(self):
+        first = await self.call("GET /api/products", "GET", "/api/products", params={"limit": 50})
+        category = self.rng.choice(("camisetas", "moletons", "calcas", "bones"))
+        page = await self.call("GET /api/products", "GET", "/api/products", params={"category": category, "limit": 24})
+        cursor = page.headers.get("X-Next-Cursor")
+        if cursor:
+            await self.call("GET /api/products", "GET", "/api/products",
+                            params={"category": category, "limit": 24, "cursor": cursor})
+        products = first.json() if first.status_code == 200 else []
+        if products:
+            product_id = self.rng.choice(products)["id"]
+            await self.call("GET /api/products/{product_id}", "GET", f"/api/products/{product_id}")
+
+    async def search(self):
+        await self.call("GET /api/products/search", "GET", "/api/products/search", params={
+            "q": self.rng.choice(SEARCH_TERMS), "size": self.rng.choice(("P", "M", "G", "GG")),
+        })
+
+    async def add_to_cart(self):
+        product = self.rng.choice(self.shop["products"])
+        await self.call("POST /api/cart/add", "POST", "/api/cart/add", headers=self.headers, json={
+            "product_id": product["id"], "quantity": 1, "size": product["size"], "color": product["color"],
+        })
+        await self.call("GET /api/cart", "GET", "/api/cart", headers=self.headers)
+
+    async def checkout(self):
+        items = [
+            {"product_id": p["id"], "quantity": self.rng.randint(1, 2), "size": p["size"], "color": p["color"]}
+            for p in self.rng.sample(self.shop["products"], self.rng.randint(1, 3))
+        ]
+        response = await self.call("POST /api/payments/checkout/session", "POST", "/api/payments/checkout/session", json={
+            "origin_url": "http://loadtest", "items": items,
+            "user_email": self.user["email"], "user_name": self.user["name"],
+        })
+        if response.status_code != 200:
+            return
+        session_id = response.json()["session_id"]
+        for _ in range(POLLS_UNTIL_PAID + 2):
+            await asyncio.sleep(POLL_INTERVAL)
+            status = await self.call(
+                "GET /api/payments/checkout/status/{session_id}", "GET", f"/api/payments/checkout/status/{session_id}"
+            )
+            if status.status_code != 200 or status.json().get("payment_status") == "paid":
+                break
+
+    async def admin_dashboard(self):
+        await self.call("GET /api/admin/dashboard", "GET", "/api/admin/dashboard", headers=self.admin_headers)
+
+
+async def shopper_loop(server, client, recorder, shop, seed_value, deadline):
+    rng = random.Random(seed_value)
+    shopper = Shopper(server, client, recorder, shop, rng)
+    names, weights = list(SCENARIOS), list(SCENARIOS.values())
+    while time.perf_counter() < deadline:
+        scenario = rng.choices(names, weights)[0]
+        await getattr(shopper, scenario)()
+        recorder.scenarios[scenario] += 1
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def report(recorder, args, elapsed):
+    endpoints = {}
+    for label in sorted(recorder.latencies):
+        samples = recorder.latencies[label]
+        stats = summarize(samples)
+        endpoints[label] = {
+            "requests": len(samples),
+            "errors": recorder.errors[label],
+            "rps": round(len(samples) / elapsed, 2),
+            "p50_ms": stats["p50_ms"],
+            "p95_ms": stats["p95_ms"],
+            "p99_ms": stats["p99_ms"],
+            "mean_ms": stats["mean_ms"],
+        }
+    return {
+        "meta": {
+            "scale": args.scale,
+            "concurrency": args.concurrency,
+            "duration_s": round(elapsed, 2),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "finished_at": datetime.now(timezone.utc).isoformat(),
+        },
+        "total": {
+            "requests": sum(e["requests"] for e in endpoints.values()),
+            "errors": sum(e["errors"] for e in endpoints.values()),
+            "rps": round(sum(e["requests"] for e in endpoints.values()) / elapsed, 2),
+        },
+        "scenarios": dict(recorder.scenarios),
+        "endpoints": endpoints,
+    }
+
+
+def compare(current, baseline, tolerance):
+    """Print current versus baseline per endpoint; return the regressed endpoints."""
+    regressions = []
+    print(f"\n{'endpoint':<48} {'p95 ms':>18} {'rps':>18}")
+    for label, now in current["endpoints"].items():
+        before = baseline["endpoints"].get(label)
+        if before is None:
+            print(f"{label:<48} {now['p95_ms']:>18} {now['rps']:>18}  (new)")
+            continue
+        p95_change = (now["p95_ms"] - before["p95_ms"]) / before["p95_ms"] if before["p95_ms"] else 0.0
+        rps_change = (now["rps"] - before["rps"]) / before["rps"] if before["rps"] else 0.0
+        regressed = p95_change > tolerance or rps_change < -tolerance
+        if regressed:
+            regressions.append(label)
+        print(
+            f"{label:<48} {before['p95_ms']:>7} -> {now['p95_ms']:<7} {p95_change:+6.0%}"
+            f" {before['rps']:>7} -> {now['rps']:<7} {rps_change:+6.0%}"
+            + ("  REGRESSED" if regressed else "")
+        )
+    return regressions
+
+
+async def run(args):
+    async with bench_db("load") as db:
+        server = load_server(db)
+        print(f"seeding {args.scale} shop ...", file=sys.stderr)
+        shop = await seed(db, SCALES[args.scale], server.User)
+        assert shop["admin"]["email"] == ADMIN_EMAIL
+
+        server.build_email_transport = RecordingTransport
+        await server.startup()
+        await server.app.state.warmup.wait()
+        server.app.state.payment_gateway = PaymentGateway(
+            "sk_test_loadtest",
+            status_ttl=STATUS_TTL,
+            client_factory=lambda api_key, webhook_url: FakeStripeCheckout(
+                api_key, webhook_url, latency=STRIPE_LATENCY, polls_until_paid=POLLS_UNTIL_PAID
+            ),
+        )
+        recorder = Recorder()
+        try:
+            async with app_client(server.app) as client:
+                if args.warmup:
+                    warmup_deadline = time.perf_counter() + args.warmup
+                    await asyncio.gather(*(
+                        shopper_loop(server, client, Recorder(), shop, -i, warmup_deadline)
+                        for i in range(args.concurrency)
+                    ))
+                print(f"running {args.concurrency} shoppers for {args.duration}s ...", file=sys.stderr)
+                started = time.perf_counter()
+                deadline = started + args.duration
+                await asyncio.gather(*(
+                    shopper_loop(server, client, recorder, shop, i, deadline) for i in range(args.concurrency)
+                ))
+                elapsed = time.perf_counter() - started
+        finally:
+            await server.shutdown()
+    return report(recorder, args, elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the scripted API load test")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of measured load")
+    parser.add_argument("--warmup", type=float, default=5.0, help="seconds of unmeasured load first")
+    parser.add_argument("--out", default="load_test_results.json")
+    parser.add_argument("--baseline", help="results file to compare against")
+    parser.add_argument("--save-baseline", help="also write this run to the given baseline file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative p95/throughput change")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    with open(args.out, "w") as out:
+        json.dump(results, out, indent=2, sort_keys=True)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as out:
+            json.dump(results, out, indent=2, sort_keys=True)
+
+    total = results["total"]
+    print(f"{total['requests']} requests, {total['errors']} errors, {total['rps']} req/s -> {args.out}")
+    for label, stats in results["endpoints"].items():
+        print(f"{label:<48} {stats['rps']:>8} req/s  p50 {stats['p50_ms']:>8}  p95 {stats['p95_ms']:>8}  "
+              f"p99 {stats['p99_ms']:>8}  errors {stats['errors']}")
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} endpoint(s) regressed beyond {args.tolerance:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Synthetic shop data for the load test.
+
+``seed(db, scale)`` fills users, products, carts and paid orders. Every
+user shares one password hash (bcrypt per user would dominate seeding), and
+products get effectively unlimited stock so repeated checkouts never run
+dry. Data is generated from a fixed random seed, so two runs at the same
+scale see the same shop.
+"""
+import random
+import uuid
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List
+
+from common import make_product
+
+from password_pool import hash_password
+
+PASSWORD = "loadtest-password"
+ADMIN_EMAIL = "admin@loadtest.example.com"
+BATCH = 5000
+
+GARMENTS = ["camiseta", "moletom", "calça", "boné", "jaqueta", "bermuda"]
+STYLES = ["oversized", "básica", "estampada", "vintage", "slim", "cargo"]
+
+
+@dataclass
+class Scale:
+    users: int
+    products: int
+    carts: int
+    orders: int
+
+
+SCALES = {
+    "small": Scale(users=200, products=2000, carts=100, orders=5000),
+    "medium": Scale(users=5000, products=50000, carts=2000, orders=200000),
+    "large": Scale(users=50000, products=500000, carts=20000, orders=1000000),
+}
+
+
+def _line(rng: random.Random, product: Dict[str, Any]) -> Dict[str, Any]:
+    return {"product_id": product["id"], "quantity": rng.randint(1, 3), "size": product["size"], "color": product["color"]}
+
+
+async def _insert(collection, documents: List[Dict[str, Any]]):
+    for offset in range(0, len(documents), BATCH):
+        await collection.insert_many(documents[offset:offset + BATCH], ordered=False)
+
+
+async def seed(db, scale: Scale, user_model) -> Dict[str, Any]:
+    """Seed ``db`` and return the ids the scenarios pick from."""
+    rng = random.Random(19)
+    now = datetime.now(timezone.utc)
+    password_hash = hash_password(PASSWORD)
+
+    users = [
+        user_model(email=f"shopper{i}@loadtest.example.com", name=f"Cliente {i}", password_hash=password_hash).dict()
+        for i in range(scale.users)
+    ]
+    users.append(user_model(email=ADMIN_EMAIL, name="Admin", password_hash=password_hash, is_admin=True).dict())
+    await _insert(db.users, users)
+
+    products = []
+    for i in range(scale.products):
+        garment, style = rng.choice(GARMENTS), rng.choice(STYLES)
+        products.append(make_product(
+            i,
+            name=f"{garment.title()} {style} {i}",
+            description=f"{garment.title()} {style} de algodão, modelagem urbana.",
+            stock=10**9,
+            created_at=now - timedelta(minutes=i),
+        ))
+    await _insert(db.products, products)
+
+    carts = [
+        {
+            "id": str(uuid.uuid4()),
+            "user_id": user["id"],
+            "items": [_line(rng, rng.choice(products)) for _ in range(rng.randint(1, 5))],
+            "created_at": now,
+        }
+        for user in rng.sample(users[:-1], min(scale.carts, scale.users))
+    ]
+    await _insert(db.carts, carts)
+
+    orders = []
+    for i in range(scale.orders):
+        user = users[i % scale.users] if scale.users else users[-1]
+        items = []
+        for _ in range(rng.randint(1, 4)):
+            product = rng.choice(products)
+            items.append({
+                "product_id": product["id"], "name": product["name"], "price": product["price"],
+                "category": product["category"], "quantity": rng.randint(1, 3),
+                "size": product["size"], "color": product["color"],
+            })
+        orders.append({
+            "id": str(uuid.uuid4()),
+            "user_id": user["id"],
+            "user_email": user["email"],
+            "user_name": user["name"],
+            "items": items,
+            "total_amount": round(sum(item["price"] * item["quantity"] for item in items), 2),
+            "status": "confirmed",
+            "payment_status": "paid",
+            "session_id": f"cs_seed_{i}",
+            "created_at": now - timedelta(seconds=rng.randrange(90 * 24 * 3600)),
+        })
+        if len(orders) >= BATCH:
+            await _insert(db.orders, orders)
+            orders = []
+    await _insert(db.orders, orders)
+
+    return {
+        "users": users[:-1],
+        "admin": users[-1],
+        "products": [{"id": p["id"], "size": p["size"], "color": p["color"], "category": p["category"]} for p in products],
+        "scale": asdict(scale),
+    }
@@ -469,12 +469,14 @@ const Checkout = () => {
     
     setLoading(true);
     try {
+      // Signed-in shoppers send their token so the order is linked to their account
+      const token = localStorage.getItem('token');
       const response = await axios.post(`${API}/payments/checkout/session`, {
         origin_url: window.location.origin,
         items: cart,
         user_email: userEmail,
         user_name: userName
-      });
+      }, token ? { headers: { Authorization: `Bearer ${token}` } } : undefined);
       
       // Redirect to Stripe checkout
       window.location.href = response.data.url;
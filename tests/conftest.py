@@ -0,0 +1,48 @@
+import asyncio
+import os
+import sys
+import uuid
+from pathlib import Path
+
+import pytest
+
+# The backend modules import each other as top-level modules, as they do
+# when uvicorn runs server.py from that directory
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+MONGO_URL = os.environ.get("TEST_MONGO_URL", "mongodb://localhost:27017")
+
+
+@pytest.fixture
+def mongo():
+    """Run ``test(db)`` against a throwaway database, dropped afterwards.
+
+    Tests using it are skipped when no mongod answers at ``TEST_MONGO_URL``.
+    """
+    pymongo = pytest.importorskip("pymongo")
+    pytest.importorskip("motor")
+    client = pymongo.MongoClient(MONGO_URL, serverSelectionTimeoutMS=500)
+    try:
+        client.admin.command("ping")
+    except pymongo.errors.PyMongoError:
+        client.close()
+        pytest.skip(f"no mongod at {MONGO_URL}")
+    name = f"test_{uuid.uuid4().hex[:12]}"
+
+    def run(test):
+        async def main():
+            from motor.motor_asyncio import AsyncIOMotorClient
+
+            motor_client = AsyncIOMotorClient(MONGO_URL)
+            try:
+                return await test(motor_client[name])
+            finally:
+                motor_client.close()
+
+        return asyncio.run(main())
+
+    try:
+        yield run
+    finally:
+        client.drop_database(name)
+        client.close()
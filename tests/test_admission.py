@@ -0,0 +1,118 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("pymongo")
+pytest.importorskip("orjson")
+
+from admission import AdmissionControl, AdmissionMiddleware, MemoryBuckets, RouteClass  # noqa: E402
+
+LOGIN = RouteClass("login", rate=1, burst=2)
+CHECKOUT = RouteClass("checkout", rate=1, burst=1, by_user=True, max_concurrency=1)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def scope(peer="203.0.113.9", forwarded=None, authorization=None, path="/api/auth/login"):
+    headers = []
+    if forwarded is not None:
+        headers.append((b"x-forwarded-for", forwarded.encode("latin-1")))
+    if authorization is not None:
+        headers.append((b"authorization", authorization))
+    return {"type": "http", "method": "POST", "path": path, "client": (peer, 51000), "headers": headers}
+
+
+def control(trusted=("127.0.0.1",), **kwargs):
+    return AdmissionControl(lambda method, path: LOGIN, lambda authorization: None, trusted_proxies=trusted, **kwargs)
+
+
+def test_untrusted_peer_is_the_client_whatever_it_forwards():
+    assert control().client_address(scope(forwarded="1.2.3.4")) == "203.0.113.9"
+
+
+def test_walks_back_past_trusted_proxies():
+    admission = control(trusted=("127.0.0.1", "10.0.0.2"))
+    forwarded = "6.6.6.6, 198.51.100.7, 10.0.0.2"
+    assert admission.client_address(scope(peer="127.0.0.1", forwarded=forwarded)) == "198.51.100.7"
+
+
+def test_wildcard_never_trusts_a_forged_leftmost_hop():
+    admission = control(trusted=("*",))
+    assert admission.client_address(scope(peer="10.0.0.5", forwarded="6.6.6.6, 198.51.100.7")) == "198.51.100.7"
+    assert admission.client_address(scope(peer="10.0.0.5", forwarded="198.51.100.7")) == "198.51.100.7"
+    assert admission.client_address(scope(peer="10.0.0.5")) == "10.0.0.5"
+
+
+def test_by_user_classes_key_on_verified_user_only():
+    admission = AdmissionControl(
+        lambda method, path: CHECKOUT,
+        lambda authorization: "u1" if authorization == b"Bearer good" else None,
+    )
+    assert admission.client_key(scope(authorization=b"Bearer good"), CHECKOUT) == "user:u1"
+    assert admission.client_key(scope(authorization=b"Bearer forged"), CHECKOUT) == "ip:203.0.113.9"
+    assert admission.client_key(scope(authorization=b"Bearer good"), LOGIN) == "ip:203.0.113.9"
+
+
+def test_memory_buckets_allow_bursts_then_refill():
+    clock = FakeClock()
+    buckets = MemoryBuckets(clock=clock)
+
+    async def main():
+        taken = [await buckets.take(LOGIN, "ip:a") for _ in range(3)]
+        other = await buckets.take(LOGIN, "ip:b")
+        clock.now = 0.5
+        half = await buckets.take(LOGIN, "ip:a")
+        clock.now = 1.0
+        refilled = await buckets.take(LOGIN, "ip:a")
+        return taken, other, half, refilled
+
+    taken, other, half, refilled = asyncio.run(main())
+    assert taken[:2] == [0.0, 0.0] and taken[2] == pytest.approx(1.0)
+    assert other == 0.0
+    assert half == pytest.approx(0.5)
+    assert refilled == 0.0
+
+
+def test_memory_buckets_forget_the_least_recent_client():
+    buckets = MemoryBuckets(max_keys=2, clock=FakeClock())
+
+    async def main():
+        for client in ("a", "b", "a", "c"):
+            await buckets.take(LOGIN, client)
+
+    asyncio.run(main())
+    assert list(buckets._buckets) == [("login", "a"), ("login", "c")]
+
+
+def test_middleware_answers_429_and_503():
+    sent = []
+    release = asyncio.Event()
+
+    async def app(scope, receive, send):
+        await release.wait()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+
+    async def send(message):
+        sent.append(message)
+
+    admission = AdmissionControl(lambda method, path: CHECKOUT, lambda authorization: None)
+    middleware = AdmissionMiddleware(app, admission)
+
+    async def main():
+        first = asyncio.create_task(middleware(scope(peer="198.51.100.1"), None, send))
+        await asyncio.sleep(0)
+        await middleware(scope(peer="198.51.100.2"), None, send)  # over the concurrency cap
+        await middleware(scope(peer="198.51.100.1"), None, send)  # bucket empty
+        release.set()
+        await first
+
+    asyncio.run(main())
+    statuses = [message["status"] for message in sent if message["type"] == "http.response.start"]
+    assert statuses == [503, 429, 200]
+    assert admission.stats()["rejected"] == {"checkout:503": 1, "checkout:429": 1}
@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+
+from bulk_io import RowError, _CsvRecords, encode_rows, parse_csv, parse_ndjson
+
+
+async def _chunks(data: bytes, size: int):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+def parse(parser, text: str, chunk_size: int = 7):
+    async def collect():
+        return [row async for row in parser(_chunks(text.encode("utf-8"), chunk_size))]
+
+    return asyncio.run(collect())
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 4096])
+def test_csv_quoted_fields_span_lines_and_escape_quotes(chunk_size):
+    rows = parse(parse_csv, 'name,description\nA,"two\nlines, ""quoted"""\nB,plain\n', chunk_size)
+    assert rows == [
+        (2, {"name": "A", "description": 'two\nlines, "quoted"'}),
+        (4, {"name": "B", "description": "plain"}),
+    ]
+
+
+def test_csv_stray_quote_inside_a_field_is_literal():
+    rows = parse(parse_csv, 'name,price\nCamiseta 5" logo,10\nBoné,20\nTênis,30\n')
+    assert [row for _, row in rows] == [
+        {"name": 'Camiseta 5" logo', "price": "10"},
+        {"name": "Boné", "price": "20"},
+        {"name": "Tênis", "price": "30"},
+    ]
+
+
+def test_csv_unterminated_quote_costs_only_its_row():
+    rows = parse(parse_csv, 'name,price\n"Camiseta,10\nBoné,20\nTênis,30\n')
+    assert isinstance(rows[0][1], RowError) and rows[0][0] == 2
+    assert rows[1:] == [(3, {"name": "Boné", "price": "20"}), (4, {"name": "Tênis", "price": "30"})]
+
+
+def test_csv_oversized_record_is_cut_off_and_resynced():
+    records = _CsvRecords(max_chars=32)
+    fed = []
+    for number, line in enumerate(['"' + "x" * 20 + "\n", "y" * 20 + "\n", "Boné,20\n"], start=2):
+        fed += records.feed(number, line)
+    fed += records.close()
+    assert isinstance(fed[0][1], RowError) and fed[0][0] == 2
+    assert fed[1:] == [(3, "y" * 20 + "\n"), (4, "Boné,20\n")]
+
+
+def test_csv_column_count_mismatch_and_bom():
+    rows = parse(parse_csv, "\ufeffname,price\nA,1,extra\nB,2\n")
+    assert isinstance(rows[0][1], RowError)
+    assert rows[1] == (3, {"name": "B", "price": "2"})
+
+
+def test_ndjson_reports_bad_lines_and_keeps_going():
+    rows = parse(parse_ndjson, '{"a": 1}\nnot json\n[1]\n\n{"b": 2}')
+    assert rows[0] == (1, {"a": 1})
+    assert isinstance(rows[1][1], RowError) and isinstance(rows[2][1], RowError)
+    assert rows[3] == (5, {"b": 2})
+
+
+def test_csv_export_round_trips_through_the_parser():
+    async def source():
+        for row in [{"name": 'Camiseta "Urban"', "price": 10}, {"name": "Linha\ndupla", "price": 20}]:
+            yield row
+
+    async def encode():
+        return b"".join([chunk async for chunk in encode_rows(source(), "csv", ["name", "price"])])
+
+    rows = parse(parse_csv, asyncio.run(encode()).decode("utf-8"))
+    assert [row for _, row in rows] == [
+        {"name": 'Camiseta "Urban"', "price": "10"},
+        {"name": "Linha\ndupla", "price": "20"},
+    ]
@@ -0,0 +1,61 @@
+import asyncio
+from types import SimpleNamespace
+
+
+def quantities(cart):
+    return {(line["product_id"], line["size"], line["color"]): line["quantity"] for line in cart["items"]}
+
+
+def test_concurrent_adds_to_a_new_cart_lose_nothing(mongo):
+    from cart_ops import add_item
+    from indexes import INDEXES
+
+    async def test(db):
+        await db.carts.create_indexes(INDEXES["carts"])
+        await asyncio.gather(*(add_item(db, "u1", "hot", "M", "preto", 1) for _ in range(200)))
+        await asyncio.gather(*(add_item(db, "u1", "other", "G", "branco", 2) for _ in range(50)))
+        cart = await db.carts.find_one({"user_id": "u1"})
+        assert quantities(cart) == {("hot", "M", "preto"): 200, ("other", "G", "branco"): 100}
+
+    mongo(test)
+
+
+def test_concurrent_edits_from_two_tabs(mongo):
+    from cart_ops import add_item, remove_line, set_quantity
+    from indexes import INDEXES
+
+    async def test(db):
+        await db.carts.create_indexes(INDEXES["carts"])
+        await add_item(db, "u1", "keep", "M", "preto", 1)
+        await add_item(db, "u1", "drop", "M", "preto", 1)
+        await asyncio.gather(
+            *(add_item(db, "u1", "keep", "M", "preto", 1) for _ in range(50)),
+            remove_line(db, "u1", "drop", "M", "preto"),
+            set_quantity(db, "u1", "new", "P", "azul", 3),
+        )
+        cart = await db.carts.find_one({"user_id": "u1"})
+        assert quantities(cart) == {("keep", "M", "preto"): 51, ("new", "P", "azul"): 3}
+
+    mongo(test)
+
+
+def test_batch_applies_in_order_and_ignores_operator_looking_input(mongo):
+    from cart_ops import apply_batch
+    from indexes import INDEXES
+
+    def operation(op, product_id, quantity=0):
+        return SimpleNamespace(op=op, product_id=product_id, size="M", color="preto", quantity=quantity)
+
+    async def test(db):
+        await db.carts.create_indexes(INDEXES["carts"])
+        await apply_batch(db, "u1", [
+            operation("add", "a", 2),
+            operation("add", "$items", 1),
+            operation("set", "a", 5),
+            operation("add", "b", 1),
+            operation("remove", "b"),
+        ])
+        cart = await db.carts.find_one({"user_id": "u1"})
+        assert quantities(cart) == {("a", "M", "preto"): 5, ("$items", "M", "preto"): 1}
+
+    mongo(test)
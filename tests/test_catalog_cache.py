@@ -0,0 +1,105 @@
+import asyncio
+
+from catalog_cache import CatalogCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_concurrent_misses_share_one_load():
+    cache = CatalogCache()
+    calls = []
+
+    async def load():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return b"catalog"
+
+    async def main():
+        return await asyncio.gather(*(cache.get_or_load(("products", 1), load) for _ in range(10)))
+
+    assert asyncio.run(main()) == [b"catalog"] * 10
+    assert len(calls) == 1
+    assert cache.misses == 1 and cache.coalesced == 9
+
+
+def test_failed_load_reaches_every_waiter_and_is_not_cached():
+    cache = CatalogCache()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("mongo down")
+
+    async def main():
+        return await asyncio.gather(*(cache.get_or_load(("product", "p"), fail) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert cache.stats()["size"] == 0
+
+
+def test_entries_expire_after_ttl():
+    clock = FakeClock()
+    cache = CatalogCache(ttl=30, clock=clock)
+    loads = []
+
+    async def load():
+        loads.append(1)
+        return b"v"
+
+    async def main():
+        await cache.get_or_load(("product", "p"), load)
+        clock.now = 29
+        await cache.get_or_load(("product", "p"), load)
+        clock.now = 31
+        await cache.get_or_load(("product", "p"), load)
+
+    asyncio.run(main())
+    assert len(loads) == 2
+
+
+def test_none_is_returned_but_not_cached():
+    cache = CatalogCache()
+
+    async def missing():
+        return None
+
+    async def main():
+        assert await cache.get_or_load(("product", "gone"), missing) is None
+        assert await cache.get_or_load(("product", "gone"), missing) is None
+
+    asyncio.run(main())
+    assert cache.misses == 2
+
+
+def test_lru_eviction():
+    cache = CatalogCache(maxsize=2)
+
+    async def main():
+        for key in ("a", "b"):
+            await cache.get_or_load(("product", key), lambda key=key: asyncio.sleep(0, key.encode()))
+        await cache.get_or_load(("product", "a"), lambda: asyncio.sleep(0, b"a"))
+        await cache.get_or_load(("product", "c"), lambda: asyncio.sleep(0, b"c"))
+
+    asyncio.run(main())
+    assert cache.evictions == 1
+    assert set(cache._entries) == {("product", "a"), ("product", "c")}
+
+
+def test_invalidation_during_load_discards_the_stale_result():
+    cache = CatalogCache()
+
+    async def main():
+        async def load():
+            cache.invalidate_namespace("products")
+            return b"stale"
+
+        assert await cache.get_or_load(("products", 1), load) == b"stale"
+
+    asyncio.run(main())
+    assert cache.stats()["size"] == 0
@@ -0,0 +1,48 @@
+import pytest
+
+from email_templates import CompiledTemplate, EmailTemplates, TemplateError
+
+
+def test_fields_are_escaped_in_bodies_only():
+    assert CompiledTemplate("<p>{{name}}</p>").render({"name": "<b>Ana & \"Bia\"</b>"}) == (
+        "<p>&lt;b&gt;Ana &amp; &quot;Bia&quot;&lt;/b&gt;</p>"
+    )
+    assert CompiledTemplate("Pedido {{name}}", escape=False).render({"name": "<b>"}) == "Pedido <b>"
+
+
+def test_format_specs_and_literal_braces():
+    template = CompiledTemplate("{ R$ {{price:.2f}} | {{code:>4}} | {{quantity}} }")
+    assert template.render({"price": 89.9, "code": "ab", "quantity": 3}) == "{ R$ 89.90 |   ab | 3 }"
+
+
+def test_sections_repeat_per_item():
+    template = CompiledTemplate("<ul>{{#items}}<li>{{name}} x{{quantity}}</li>{{/items}}</ul>")
+    rendered = template.render({"items": [{"name": "Boné", "quantity": 1}, {"name": "<Tênis>", "quantity": 2}]})
+    assert rendered == "<ul><li>Boné x1</li><li>&lt;Tênis&gt; x2</li></ul>"
+    assert template.render({"items": []}) == "<ul></ul>"
+
+
+@pytest.mark.parametrize("source", [
+    "{{x:\n}}",
+    "{{x:.2q}}",
+    "{{#items}}unclosed",
+    "{{/items}}",
+    "{{#items}}{{/other}}",
+])
+def test_bad_templates_fail_at_compile_time(source):
+    with pytest.raises(TemplateError):
+        CompiledTemplate(source)
+
+
+def test_order_confirmation_renders_in_batches():
+    templates = EmailTemplates()
+    context = {
+        "user_name": "Cliente <script>",
+        "order_id": "abc",
+        "items": [{"name": "Camiseta", "size": "M", "color": "preto", "quantity": 2, "price": 50}],
+        "total": 100,
+    }
+    subject, body = templates.render("order_confirmation", context)
+    assert subject == "Confirmação de Pedido #abc"
+    assert "Cliente &lt;script&gt;" in body and "R$ 100.00" in body
+    assert templates.render_batch("order_confirmation", [context, context]) == [(subject, body)] * 2
@@ -0,0 +1,119 @@
+import asyncio
+import random
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+SESSIONS = 40
+PRICE = 99.9
+
+
+@pytest.fixture
+def server():
+    pytest.importorskip("fastapi")
+    import server
+
+    return server
+
+
+async def open_sessions(db, server, count):
+    from indexes import ensure_indexes
+    from reservations import attach_session, reserve_stock
+
+    await ensure_indexes(db)
+    await db.products.insert_one({"id": "p1", "name": "Camiseta", "price": PRICE, "category": "camisetas", "stock": 1000})
+    sessions = []
+    for i in range(count):
+        session_id = f"cs_test_{uuid.uuid4().hex}"
+        reservation_id = await reserve_stock(db, {"p1": 1}, timedelta(minutes=30))
+        await attach_session(db, reservation_id, session_id)
+        items = [{"product_id": "p1", "name": "Camiseta", "price": PRICE, "category": "camisetas",
+                  "quantity": 1, "size": "M", "color": "preto"}]
+        await db.payment_transactions.insert_one(server.PaymentTransaction(
+            session_id=session_id, user_id=f"u{i}", user_email=f"u{i}@example.com", user_name="Cliente",
+            amount=PRICE, status="open", payment_status="unpaid", reservation_id=reservation_id, items=items,
+            metadata={"user_email": f"u{i}@example.com", "user_name": "Cliente"},
+        ).dict())
+        sessions.append(session_id)
+    return sessions
+
+
+def test_replayed_and_reordered_events_finalize_once(mongo, server):
+    from finalization import OrderFinalizer
+    from order_stats import TOTALS_ID
+
+    async def deliver(finalizer, kind, session_id, event_id):
+        if event_id and not await finalizer.record_event(event_id, kind):
+            return
+        if kind == "completed":
+            await finalizer.apply_status(session_id, "complete", "paid")
+        elif kind == "expired":
+            await finalizer.apply_status(session_id, "expired", "unpaid")
+        else:
+            await finalizer.apply_status(session_id, "open", "unpaid")
+
+    async def test(db):
+        sessions = await open_sessions(db, server, SESSIONS)
+        events = []
+        for session_id in sessions:
+            completed = f"evt_{uuid.uuid4().hex}"
+            events += [("completed", session_id, completed)] * 4
+            events += [("open", session_id, f"evt_{uuid.uuid4().hex}"), ("expired", session_id, f"evt_{uuid.uuid4().hex}")]
+            events += [("completed", session_id, None)] * 2  # browser polls carry no event id
+        random.shuffle(events)
+
+        finalizer = OrderFinalizer(db, server.build_order)
+        await asyncio.gather(*(deliver(finalizer, *event) for event in events))
+
+        per_session = await db.orders.aggregate([{"$group": {"_id": "$session_id", "n": {"$sum": 1}}}]).to_list(None)
+        assert len(per_session) == SESSIONS and all(group["n"] == 1 for group in per_session)
+        assert await db.email_outbox.count_documents({}) == SESSIONS
+        assert (await db.products.find_one({"id": "p1"}))["stock"] == 1000 - SESSIONS
+        assert (await db.order_stats.find_one({"_id": TOTALS_ID}))["paid_orders"] == SESSIONS
+        assert await db.payment_transactions.count_documents({"finalization.completed_at": {"$exists": False}}) == 0
+        # Completed transactions leave the index resume_stalled walks
+        assert await db.payment_transactions.count_documents({"finalization.claimed_at": {"$exists": True}}) == 0
+        assert {order["user_id"] async for order in db.orders.find()} == {f"u{i}" for i in range(SESSIONS)}
+
+    mongo(test)
+
+
+def test_resume_stalled_finishes_a_claim_whose_worker_died(mongo, server):
+    from finalization import OrderFinalizer
+
+    async def test(db):
+        [session_id] = await open_sessions(db, server, 1)
+        # As left by a worker that claimed the session and died before any step ran
+        await db.payment_transactions.update_one({"session_id": session_id}, {"$set": {
+            "status": "complete", "payment_status": "paid", "order_id": "o1",
+            "finalization.claimed_at": datetime.now(timezone.utc) - timedelta(minutes=10),
+        }})
+        finalizer = OrderFinalizer(db, server.build_order)
+        assert await finalizer.resume_stalled() == 1
+        assert await finalizer.resume_stalled() == 0
+        assert await db.orders.count_documents({"id": "o1"}) == 1
+        assert (await db.products.find_one({"id": "p1"}))["stock"] == 999
+        transaction = await db.payment_transactions.find_one({"session_id": session_id})
+        assert set(transaction["finalization"]) >= {"stock", "stats", "completed_at"}
+
+    mongo(test)
+
+
+def test_stats_count_an_order_once(mongo):
+    from order_stats import TOTALS_ID, ensure_order_stats, record_paid_order
+
+    async def test(db):
+        order = {"id": "o1", "total_amount": 10.0, "created_at": datetime.now(timezone.utc), "payment_status": "paid",
+                 "items": [{"product_id": "p1", "name": "Camiseta", "price": 5.0, "quantity": 2}]}
+        await db.orders.insert_many([order, {**order, "id": "o2"}])
+        assert await record_paid_order(db, order)
+        assert not await record_paid_order(db, order)
+        # The backfill only counts what live payments have not
+        await ensure_order_stats(db)
+        await ensure_order_stats(db)
+        totals = await db.order_stats.find_one({"_id": TOTALS_ID})
+        assert (totals["paid_orders"], totals["revenue"]) == (2, 20.0)
+        assert (await db.order_stats.find_one({"_id": "product:p1"}))["units"] == 4
+
+    mongo(test)
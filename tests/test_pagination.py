@@ -0,0 +1,38 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from pagination import InvalidCursor, decode_cursor, encode_cursor, next_cursor, with_keyset
+
+
+def test_cursor_round_trip():
+    created_at = datetime(2024, 5, 1, 12, 30, 15, 123000, tzinfo=timezone.utc)
+    cursor = encode_cursor({"created_at": created_at, "id": "a|b"})
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (created_at, "a|b")
+
+
+@pytest.mark.parametrize("cursor", ["not base64!", "Zm9v", encode_cursor({"created_at": datetime(2024, 1, 1), "id": "x"})[:-3] + "@@"])
+def test_garbage_cursor_is_rejected(cursor):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor)
+
+
+def test_keyset_condition_breaks_ties_on_id():
+    created_at = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    query = with_keyset({"category": "camisetas"}, encode_cursor({"created_at": created_at, "id": "p5"}))
+    assert query == {"$and": [
+        {"category": "camisetas"},
+        {"$or": [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "id": {"$lt": "p5"}},
+        ]},
+    ]}
+    assert with_keyset({"category": "camisetas"}, None) == {"category": "camisetas"}
+
+
+def test_next_cursor_only_for_full_pages():
+    page = [{"created_at": datetime(2024, 1, 1), "id": str(i)} for i in range(3)]
+    assert next_cursor(page, 3) == encode_cursor(page[-1])
+    assert next_cursor(page, 4) is None
+    assert next_cursor([], 0) is None
@@ -0,0 +1,100 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+TTL = timedelta(minutes=30)
+
+
+def product(stock):
+    return {"id": "p1", "name": "Camiseta", "stock": stock}
+
+
+def test_flash_sale_never_oversells(mongo):
+    from indexes import ensure_indexes
+    from reservations import StockUnavailable, commit_reservation, release_expired_reservations, reserve_stock
+
+    async def test(db):
+        await ensure_indexes(db)
+        await db.products.insert_one(product(25))
+
+        async def attempt(quantity):
+            try:
+                return await reserve_stock(db, {"p1": quantity}, TTL)
+            except StockUnavailable:
+                return None
+
+        results = await asyncio.gather(*(attempt(1 + i % 2) for i in range(300)))
+        reserved = [rid for rid in results if rid]
+        held = {r["id"]: r["items"][0]["quantity"] async for r in db.stock_reservations.find({"id": {"$in": reserved}})}
+        assert sum(held.values()) <= 25
+        assert (await db.products.find_one({"id": "p1"}))["stock"] == 25 - sum(held.values())
+
+        paid = reserved[: len(reserved) // 2]
+        await asyncio.gather(*(commit_reservation(db, rid) for rid in paid))
+        await release_expired_reservations(db, now=datetime.now(timezone.utc) + TTL * 2)
+        final = await db.products.find_one({"id": "p1"})
+        assert final["stock"] == 25 - sum(held[rid] for rid in paid)
+        assert not final.get("holds")
+
+    mongo(test)
+
+
+def test_reserving_several_products_is_all_or_nothing(mongo):
+    from reservations import StockUnavailable, reserve_stock
+
+    async def test(db):
+        await db.products.insert_many([{"id": "a", "stock": 5}, {"id": "b", "stock": 1}])
+        with pytest.raises(StockUnavailable) as raised:
+            await reserve_stock(db, {"a": 2, "b": 2}, TTL)
+        assert raised.value.product_ids == ["b"]
+        stocks = {p["id"]: (p["stock"], p.get("holds")) async for p in db.products.find()}
+        assert stocks == {"a": (5, []), "b": (1, None)}
+        with pytest.raises(ValueError):
+            await reserve_stock(db, {}, TTL)
+
+    mongo(test)
+
+
+def test_sweeper_expires_the_session_before_releasing(mongo):
+    from reservations import attach_session, release_expired_reservations, reserve_stock
+
+    async def test(db):
+        await db.products.insert_one(product(3))
+        unpaid = await reserve_stock(db, {"p1": 1}, TTL)
+        paid = await reserve_stock(db, {"p1": 1}, TTL)
+        await attach_session(db, unpaid, "cs_unpaid")
+        await attach_session(db, paid, "cs_paid")
+        expired = []
+
+        async def expire_session(session_id):
+            expired.append(session_id)
+            return session_id != "cs_paid"
+
+        later = datetime.now(timezone.utc) + TTL * 2
+        assert await release_expired_reservations(db, now=later, expire_session=expire_session) == 1
+        assert sorted(expired) == ["cs_paid", "cs_unpaid"]
+        # The paid session keeps its hold for the payment to commit
+        assert (await db.stock_reservations.find_one({"id": paid}))["status"] == "pending"
+        assert (await db.products.find_one({"id": "p1"}))["stock"] == 2
+
+    mongo(test)
+
+
+def test_sweeper_finishes_an_interrupted_release(mongo):
+    from reservations import release_expired_reservations, reserve_stock
+
+    async def test(db):
+        await db.products.insert_one(product(3))
+        reservation_id = await reserve_stock(db, {"p1": 2}, TTL)
+        # As left by a worker that died between claiming the release and restoring stock
+        await db.stock_reservations.update_one(
+            {"id": reservation_id}, {"$set": {"status": "released", "restoring": True}}
+        )
+        await release_expired_reservations(db)
+        await release_expired_reservations(db)
+        final = await db.products.find_one({"id": "p1"})
+        assert final["stock"] == 3 and not final["holds"]
+        assert "restoring" not in await db.stock_reservations.find_one({"id": reservation_id})
+
+    mongo(test)